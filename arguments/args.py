@@ -14,6 +14,11 @@ def get_args():
 
     # parser.add_argument('--circuit', '-c', type=str, default="sky130hd_fakestack_ariane136", help='circuit name')
     parser.add_argument('--result_dir', '-r', type=str, default="result-debug", help='result directory')
+    parser.add_argument('--data_format', type=str, default="csv", choices=["csv", "bookshelf"], help='csv files in data_openroad_2, or the Bookshelf .block and .nets of the MCNC/GSRC benchmarks in data_MCNC_GSRC/original')
+    parser.add_argument('--design_cache_dir', type=str, default="", help='directory of the compiled design cache, empty string disables it, only use a directory written by yourself since the cache is unpickled')
+    parser.add_argument('--net_model', type=str, default="clique", choices=["clique", "star", "weighted_clique"], help='net model of the sparse adjacency matrix of the graph model')
+    parser.add_argument('--max_net_fanout', type=int, default=0, help='nets with more pins are handled by high_fanout_net in the adjacency matrix, 0 means no cutoff')
+    parser.add_argument('--high_fanout_net', type=str, default="skip", choices=["skip", "star"], help='skip the high fanout nets or reduce them to star in the adjacency matrix')
     parser.add_argument('--area_util', '-u', type=float, default=1.6, help='area utilization')
     parser.add_argument('--seed', type=int, default=3407, help='random seed')
     parser.add_argument('--num_env', '-e', type=int, default=16, help='num of env')
@@ -58,6 +63,11 @@ def get_args():
 
     # for some ablation study
     parser.add_argument('--max_grad_norm', type=float, default=-1.0, help='max grad norm, < 0 means no grad norm')
+    parser.add_argument('--debug_metrics', type=int, default=0, help='cross-check incremental reward metrics with full recompute')
+    parser.add_argument('--dedup_obs', type=int, default=0, help='store each observation once in the rollout buffer, obs_next is resolved by index')
+    parser.add_argument('--action_replay', type=int, default=0, help='store only the actions in the rollout buffer, observations are rebuilt at learn time by replaying them')
+    parser.add_argument('--mask_workers', type=int, default=0, help='compute the masks of an observation in a thread pool with this many threads, torch threads are divided among them, 0 means serial')
+    parser.add_argument('--compact_obs', type=int, default=0, help='bit-packed binary masks, uint8 canvas and 16-bit wiremask in observations, to hold more transitions in the buffer')
     parser.add_argument('--norm_wiremask', type=int, default=0, help='norm wiremask')
     parser.add_argument('--place_order_die_by_die', type=int, default=0, help='place order die by die')
     parser.add_argument('--set_vision_to_zero', type=int, default=0, help='set vision to zero')
@@ -117,6 +127,14 @@ def get_args():
     parser.add_argument('--learn_async_in_sync', type=int, default=None, help='Deprecated')
     parser.add_argument('--input_layer_sequence', type=int, default=0, help='input layer sequence to layer decider')
 
+    # for inference
+    parser.add_argument('--search', type=str, default='sample', choices=['sample', 'beam'], help='inference mode after training, sample one action per step or beam search')
+    parser.add_argument('--beam_width', type=int, default=4, help='number of kept states in beam search')
+    parser.add_argument('--search_topk', type=int, default=4, help='number of (position, layer) actions expanded from each state in beam search')
+    parser.add_argument('--search_value_coef', type=float, default=1.0, help='weight of critic value in the score of beam search')
+    parser.add_argument('--search_time_budget', type=float, default=0.0, help='seconds of beam search, then greedy. <= 0 means no limit')
+    parser.add_argument('--search_node_budget', type=int, default=0, help='number of evaluated nodes of beam search, then greedy. <= 0 means no limit')
+
     args = parser.parse_args()
 
     print("args.impl: ", args.impl, "args.design: ", args.design)
@@ -133,6 +151,7 @@ def get_args():
     args.add_last_step_reward_to_other_steps = True if args.add_last_step_reward_to_other_steps > 0 else False
     args.load_then_collect = True if args.load_then_collect > 0 else False
     args.add_virtual_block = True if args.add_virtual_block > 0 else False
+    args.debug_metrics = True if args.debug_metrics > 0 else False
 
     # override the default value for alignment
     args.enable_alignment = True if args.enable_alignment > 0 else False
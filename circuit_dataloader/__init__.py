@@ -3,3 +3,7 @@ from .construct_partner import construct_partner_blk
 from .construct_fp_info import construct_fp_info_func
 from .construct_layer import assign_layer
 from .construct_pre_placed_module import construct_preplaced_modules
+from .design_cache import design_cache_key, load_design, save_design
+from .parser import parse_net_csr, DATA_ROOT
+from .construct_adjacency import construct_adjacency
+from .parser import parse_bookshelf_block, parse_bookshelf_blk_tml, parse_bookshelf_net_csr, BOOKSHELF_ROOT
@@ -0,0 +1,89 @@
+import numpy as np
+import torch
+
+
+NET_MODELS = ("clique", "star", "weighted_clique")
+HIGH_FANOUT_NET_MODELS = ("skip", "star")
+
+
+def _clique_pairs(net_ptr:np.ndarray, net_pins:np.ndarray, net_ids:np.ndarray):
+    """(pin i, pin j, net) for each pair i < j in each net of net_ids, without python loops over the pins."""
+    start, k = net_ptr[net_ids], net_ptr[net_ids + 1] - net_ptr[net_ids]
+    num_pair = k * (k - 1) // 2
+    if num_pair.sum() == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+    # position of each pin in its net, and the number of pins after it
+    pin_net = np.repeat(np.arange(len(net_ids)), k)
+    pos = np.arange(k.sum()) - np.repeat(np.cumsum(k) - k, k)
+    pin = np.repeat(start, k) + pos
+    num_after = k[pin_net] - 1 - pos
+    # pin pairs with each of the pins after it
+    src = np.repeat(pin, num_after)
+    offset = np.arange(num_after.sum()) - np.repeat(np.cumsum(num_after) - num_after, num_after)
+    dst = src + 1 + offset
+    return net_pins[src], net_pins[dst], net_ids[np.repeat(pin_net, num_after)]
+
+
+def _star_pairs(net_ptr:np.ndarray, net_pins:np.ndarray, net_ids:np.ndarray):
+    """(first pin, pin j, net) for the other pins j of each net of net_ids."""
+    start, k = net_ptr[net_ids], net_ptr[net_ids + 1] - net_ptr[net_ids]
+    num_other = np.maximum(k - 1, 0)
+    offset = np.arange(num_other.sum()) - np.repeat(np.cumsum(num_other) - num_other, num_other)
+    src = np.repeat(start, num_other)
+    return net_pins[src], net_pins[src + 1 + offset], np.repeat(net_ids, num_other)
+
+
+def construct_adjacency(net_ptr:np.ndarray, net_pins:np.ndarray, net_weight:np.ndarray, num_node:int,
+                        net_model:str="clique", max_net_fanout:int=0, high_fanout_net:str="skip") -> torch.Tensor:
+    """
+    Sparse adjacency matrix of the netlist, a coalesced COO tensor with shape [num_node, num_node].
+    The nodes of net i are net_pins[net_ptr[i]:net_ptr[i+1]], its weight is net_weight[i].
+    net_model:
+        clique: each pair of nodes in a net is connected with the net weight.
+        star: the first node of a net is connected with each other node, with the net weight.
+        weighted_clique: clique with the net weight / (k-1) for a net with k nodes.
+    A pair connected by several nets has the largest weight in clique and star, and the sum of the weights in weighted_clique.
+    Nets with more than max_net_fanout nodes are skipped or reduced to star (with the net weight), according to high_fanout_net, 0 means no cutoff.
+    """
+    assert net_model in NET_MODELS, "[Error] Unknown net model {}, should be one of {}.".format(net_model, NET_MODELS)
+    assert high_fanout_net in HIGH_FANOUT_NET_MODELS, "[Error] Unknown high fanout net model {}, should be one of {}.".format(high_fanout_net, HIGH_FANOUT_NET_MODELS)
+    net_ptr, net_pins = np.asarray(net_ptr, dtype=np.int64), np.asarray(net_pins, dtype=np.int64)
+    net_weight = np.asarray(net_weight, dtype=np.float32)
+    fanout = np.diff(net_ptr)
+
+    is_high_fanout = (fanout > max_net_fanout) if max_net_fanout > 0 else np.zeros(len(fanout), dtype=bool)
+    high_fanout_ids = np.flatnonzero(is_high_fanout)
+    net_ids = np.flatnonzero(~is_high_fanout)
+    if net_model == "star":
+        row, col, net = _star_pairs(net_ptr, net_pins, net_ids)
+    else:
+        row, col, net = _clique_pairs(net_ptr, net_pins, net_ids)
+    value = net_weight[net]
+    if net_model == "weighted_clique":
+        value = value / (fanout[net] - 1).astype(np.float32)
+    if high_fanout_net == "star":
+        star_row, star_col, star_net = _star_pairs(net_ptr, net_pins, high_fanout_ids)
+        row, col = np.concatenate([row, star_row]), np.concatenate([col, star_col])
+        value = np.concatenate([value, net_weight[star_net]])
+
+    # symmetric, a net may contain a node twice, which is on the diagonal
+    off_diagonal = row != col
+    row, col = np.concatenate([row, col[off_diagonal]]), np.concatenate([col, row[off_diagonal]])
+    value = np.concatenate([value, value[off_diagonal]])
+
+    # merge the duplicated pairs
+    key = row * num_node + col
+    order = np.argsort(key, kind="stable")
+    key, value = key[order], value[order]
+    unique_key, first = np.unique(key, return_index=True)
+    if len(unique_key) > 0:
+        value = np.add.reduceat(value, first) if net_model == "weighted_clique" else np.maximum.reduceat(value, first)
+    else:
+        value = value[:0]
+
+    indices = torch.from_numpy(np.stack([unique_key // num_node, unique_key % num_node]))
+    adjacency_matrix = torch.sparse_coo_tensor(indices, torch.from_numpy(value), (num_node, num_node), is_coalesced=True, check_invariants=False)
+    print("[INFO] {} adjacency of {} nets, {} nets with fanout > {}: {}".format(
+        net_model, len(fanout), len(high_fanout_ids), max_net_fanout, high_fanout_net))
+    return adjacency_matrix
@@ -1,9 +1,14 @@
-from .parser import parse_blk_tml, map_tml, parse_net, parse_blk_xyz
+from .parser import parse_blk_tml, map_tml, parse_net_csr, parse_blk_xyz, DATA_ROOT
+from .parser import parse_bookshelf_blk_tml, parse_bookshelf_net_csr, BOOKSHELF_ROOT
+from .design_cache import design_cache_key, load_design, save_design
 from .construct_partner import construct_partner_blk
 from .construct_layer import assign_layer
 from .construct_pre_placed_module import construct_preplaced_modules
+from .construct_adjacency import construct_adjacency
+import os
 import torch
 import fp_env
+import numpy as np
 import pandas as pd
 from typing import Tuple
 from copy import deepcopy
@@ -11,9 +16,48 @@ from collections import defaultdict
 
 
 def construct_fp_info_func(circuit:str, area_util:float, num_grid_x:int, num_grid_y:int, num_alignment:int, 
-                           alignment_rate:float, alignment_sort:str, num_preplaced_module:int, add_virtual_block:bool, num_layer:int, read_fp: bool, set_z_only: bool, add_halo: bool, halo_width: float, halo_height: float) -> Tuple[fp_env.FPInfo, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+                           alignment_rate:float, alignment_sort:str, num_preplaced_module:int, add_virtual_block:bool, num_layer:int, read_fp: bool, set_z_only: bool, add_halo: bool, halo_width: float, halo_height: float,
+                           net_model:str="clique", max_net_fanout:int=0, high_fanout_net:str="skip", data_format:str="csv", cache_dir:str=None) -> Tuple[fp_env.FPInfo, pd.DataFrame]:
+    """
+    net_model, max_net_fanout and high_fanout_net are the net model of the sparse adjacency matrix, see construct_adjacency.
+    data_format is csv for <circuit>.blk.csv, .tml.csv and .net.csv in DATA_ROOT,
+    or bookshelf for <circuit>.block and .nets in BOOKSHELF_ROOT, which have no floorplan, so read_fp is ignored.
+    If cache_dir is given, the constructed design is loaded from the compiled design cache in cache_dir,
+    it is constructed and saved only if the design files or the arguments change, see design_cache.
+    """
+    args = dict(locals())
+    args.pop("cache_dir")
+    if cache_dir is None:
+        return _construct_fp_info(**args)
+
+    if data_format == "bookshelf":
+        input_paths = [os.path.join(BOOKSHELF_ROOT, "{}.{}".format(circuit, ext)) for ext in ("block", "nets")]
+    else:
+        input_paths = [os.path.join(DATA_ROOT, "{}.{}".format(circuit, ext)) for ext in ("blk.csv", "tml.csv", "net.csv")]
+    if read_fp and data_format != "bookshelf":
+        input_paths.append(os.path.join(DATA_ROOT, "{}.fp.txt".format(circuit)))
+    key = design_cache_key(input_paths, args)
+    path = os.path.join(cache_dir, "{}-{}.pkl".format(circuit, key))
+    design = load_design(path, key)
+    if design is not None:
+        print("[INFO] Load compiled design from {}".format(path))
+        return design
+
+    design = _construct_fp_info(**args)
+    save_design(path, key, design)
+    print("[INFO] Save compiled design to {}".format(path))
+    return design
+
+
+def _construct_fp_info(circuit:str, area_util:float, num_grid_x:int, num_grid_y:int, num_alignment:int, 
+                       alignment_rate:float, alignment_sort:str, num_preplaced_module:int, add_virtual_block:bool, num_layer:int, read_fp: bool, set_z_only: bool, add_halo: bool, halo_width: float, halo_height: float,
+                       net_model:str, max_net_fanout:int, high_fanout_net:str, data_format:str) -> Tuple[fp_env.FPInfo, pd.DataFrame]:
     
     alignment_rate = 1.0 if alignment_rate is None else alignment_rate
+    assert data_format in ("csv", "bookshelf"), "[Error] Unknown data format {}, should be csv or bookshelf.".format(data_format)
+    if data_format == "bookshelf" and read_fp:
+        print("[WARNING] There is no floorplan of the Bookshelf benchmark {}, read_fp is ignored".format(circuit))
+        read_fp = False
     
     # read block and terminal (w,h,virtual)
     # (add_halo, halo_width, halo_height)
@@ -22,7 +66,10 @@ def construct_fp_info_func(circuit:str, area_util:float, num_grid_x:int, num_gri
         halo_height = 0.0
     
     # parse_blk_tml (blk_wh_dict, tml_xy_dict)
-    blk_wh_dict, tml_xy_dict, outline_width, outline_height = parse_blk_tml(circuit, area_util, add_halo, halo_width, halo_height)
+    if data_format == "bookshelf":
+        blk_wh_dict, tml_xy_dict, outline_width, outline_height = parse_bookshelf_blk_tml(circuit, area_util, add_halo, halo_width, halo_height)
+    else:
+        blk_wh_dict, tml_xy_dict, outline_width, outline_height = parse_blk_tml(circuit, area_util, add_halo, halo_width, halo_height)
     
     tml_xy_dict = map_tml(tml_xy_dict, outline_width, outline_height)
 
@@ -117,17 +164,19 @@ def construct_fp_info_func(circuit:str, area_util:float, num_grid_x:int, num_gri
 
     # print(grid_width, grid_height)
 
-    # read nets and construct net_info, nets is List[List[str]]
+    # read nets and construct net_info, the pins of net i are pin_names[pin_ids[net_ptr[i]:net_ptr[i+1]]]
     # also construct adjacency matrix
-    nets_str = parse_net(circuit)
+    pin_names, net_ptr, pin_ids = parse_bookshelf_net_csr(circuit) if data_format == "bookshelf" else parse_net_csr(circuit)
+    net_ptr, pin_ids = net_ptr.tolist(), pin_ids.tolist()
     # name to objects
     name2obj = {obj.name: obj for obj in block_info + terminal_info}
+    pin_objs = [name2obj[name] for name in pin_names]
 
     net_info = []
     net_weight = 1.0
 
-    for net_connectors_str in nets_str:
-        connector_list = [name2obj[connector_name] for connector_name in net_connectors_str]
+    for net_idx in range(len(net_ptr) - 1):
+        connector_list = [pin_objs[pin_id] for pin_id in pin_ids[net_ptr[net_idx]:net_ptr[net_idx + 1]]]
         net = fp_env.Net(connector_list, net_weight, read_fp and (not set_z_only))
         # initialize the number of the pins in each layer for different nets
         net.init_layer_num_pin(num_layer)
@@ -140,15 +189,15 @@ def construct_fp_info_func(circuit:str, area_util:float, num_grid_x:int, num_gri
     fp_info = fp_env.FPInfo(block_info, terminal_info, net_info, outline_width, outline_height, num_grid_x, num_grid_y)
     episode_len = fp_info.movable_block_num
 
-    # construct adjacency matrix
-    adjacency_matrix = torch.zeros(fp_info.block_num + fp_info.termimal_num, fp_info.block_num + fp_info.termimal_num)
-    for net_idx, net_connectors_str in enumerate(nets_str):
-        for i in range(len(net_connectors_str)):
-            for j in range(i+1, len(net_connectors_str)):
-                adjacency_matrix[name2obj[net_connectors_str[i]].idx, name2obj[net_connectors_str[j]].idx] = fp_info.net_info[net_idx].get_net_weight()
-                adjacency_matrix[name2obj[net_connectors_str[j]].idx, name2obj[net_connectors_str[i]].idx] = fp_info.net_info[net_idx].get_net_weight()
-            # add connector to net
-            fp_info.net_info[net_idx].add_connector(name2obj[net_connectors_str[i]])
+    # add connectors to nets
+    for net_idx in range(len(net_ptr) - 1):
+        for pin_id in pin_ids[net_ptr[net_idx]:net_ptr[net_idx + 1]]:
+            fp_info.net_info[net_idx].add_connector(pin_objs[pin_id])
+
+    # construct sparse adjacency matrix, the nodes are the full idx of blocks and terminals
+    pin_node = np.array([obj.idx for obj in pin_objs], dtype=np.int64)
+    adjacency_matrix = construct_adjacency(net_ptr, pin_node[pin_ids], [net.get_net_weight() for net in fp_info.net_info],
+                                           fp_info.block_num + fp_info.termimal_num, net_model, max_net_fanout, high_fanout_net)
 
     #print(adjacency_matrix)
     fp_info.set_adjacency_matrix(adjacency_matrix)
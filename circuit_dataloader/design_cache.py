@@ -0,0 +1,71 @@
+"""
+Compiled design cache of construct_fp_info_func.
+The constructed (fp_info, df_partner) is pickled to <cache_dir>/<circuit>-<key>.pkl, with all its arrays and the adjacency matrix.
+key is a hash of DESIGN_CACHE_VERSION, the source of the construction and the pickled classes (circuit_dataloader and fp_env),
+the content of the design files and the arguments of construct_fp_info_func,
+so a changed design file, argument or code gives a new key, and the design is constructed again.
+The cache is opt-in (--design_cache_dir).
+WARNING: loading a cached design unpickles it, which can execute arbitrary code,
+only use a cache directory written by yourself, never a shared or downloaded one.
+"""
+import os
+import json
+import pickle
+import hashlib
+import functools
+from typing import Any, Dict, List, Optional
+
+
+DESIGN_CACHE_VERSION = 2
+
+
+# packages whose source is hashed into the key
+SOURCE_PACKAGES = ("circuit_dataloader", "fp_env")
+
+
+@functools.lru_cache(maxsize=None)
+def source_hash() -> str:
+    """hash of the python source of SOURCE_PACKAGES."""
+    h = hashlib.sha256()
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for package in SOURCE_PACKAGES:
+        package_dir = os.path.join(root, package)
+        for name in sorted(os.listdir(package_dir)):
+            if name.endswith(".py"):
+                h.update(name.encode())
+                with open(os.path.join(package_dir, name), "rb") as f:
+                    h.update(hashlib.sha256(f.read()).digest())
+    return h.hexdigest()
+
+
+def design_cache_key(input_paths:List[str], args:Dict[str, Any]) -> str:
+    h = hashlib.sha256()
+    h.update(json.dumps({"version": DESIGN_CACHE_VERSION, "source": source_hash(), "args": args}, sort_keys=True, default=str).encode())
+    for path in input_paths:
+        with open(path, "rb") as f:
+            h.update(hashlib.sha256(f.read()).digest())
+    return h.hexdigest()[:16]
+
+
+def load_design(path:str, key:str) -> Optional[Any]:
+    """The cached design, or None if it does not exist, is from another version or can not be loaded."""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            cached = pickle.load(f)
+    except Exception as e:
+        print("[WARNING] Failed to load the compiled design {}: {}".format(path, e))
+        return None
+    if cached.get("version") != DESIGN_CACHE_VERSION or cached.get("key") != key:
+        return None
+    return cached["design"]
+
+
+def save_design(path:str, key:str, design:Any):
+    """Write to a temporary file first, so that concurrent runs never read a partial file."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp_path, "wb") as f:
+        pickle.dump({"version": DESIGN_CACHE_VERSION, "key": key, "design": design}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
@@ -1,6 +1,9 @@
 import os
 import re
+import ast
 import torch
+from array import array
+from itertools import islice
 from copy import deepcopy
 from collections import OrderedDict
 import numpy as np
@@ -9,8 +12,16 @@ from typing import Dict, Tuple, List
 import pandas as pd
 
 
+# directory of the design files, <circuit>.blk.csv, <circuit>.tml.csv, <circuit>.net.csv and <circuit>.fp.txt
+DATA_ROOT = "../FlexPlanner-via/data_openroad_2"
+# directory of the original MCNC/GSRC benchmarks in Bookshelf format, <circuit>.block and <circuit>.nets
+BOOKSHELF_ROOT = "data_MCNC_GSRC/original"
+# a quoted pin name in the python list of a net, e.g. 'a' or "b"
+PIN_NAME_PATTERN = re.compile(r"'([^'\\]*(?:\\.[^'\\]*)*)'|\"([^\"\\]*(?:\\.[^\"\\]*)*)\"")
 
-def parse_blk_tml(circuit:str, area_util:float, add_halo:bool, halo_width:float, halo_height:float, root:str="../FlexPlanner-via/data_openroad_2") -> Tuple[Dict[str, Dict[str, float]], Dict[str, Dict[str, float]], float, float]:
+
+
+def parse_blk_tml(circuit:str, area_util:float, add_halo:bool, halo_width:float, halo_height:float, root:str=DATA_ROOT) -> Tuple[Dict[str, Dict[str, float]], Dict[str, Dict[str, float]], float, float]:
     """
     blk_wh_dict: {
         "[block_name]": {
@@ -115,7 +126,7 @@ def parse_blk_tml(circuit:str, area_util:float, add_halo:bool, halo_width:float,
     
     return blk_wh_dict, tml_xy_dict, float(chip_w), float(chip_h)
 
-def parse_blk_xyz(circuit: str, root:str="../FlexPlanner-via/data_openroad_2")->Dict[str, List[float]]:
+def parse_blk_xyz(circuit: str, root:str=DATA_ROOT)->Dict[str, List[float]]:
     """
     Return the (x,y,z) of the blocks given the fp.txt
     """
@@ -132,17 +143,184 @@ def parse_blk_xyz(circuit: str, root:str="../FlexPlanner-via/data_openroad_2")->
     return blk_xyz_dict
 
 
-def parse_net(circuit:str, root:str="../FlexPlanner-via/data_openroad_2") -> List[List[str]]:
+def parse_net(circuit:str, root:str=DATA_ROOT) -> List[List[str]]:
     """
     Return netlist, each net is a list consisting of str, the name of pin.
     """
+    names, net_ptr, pin_ids = parse_net_csr(circuit, root)
+    pin_names = [names[pin_id] for pin_id in pin_ids.tolist()]
+    net_ptr = net_ptr.tolist()
+    return [pin_names[start:end] for start, end in zip(net_ptr[:-1], net_ptr[1:])]
+
+
+def parse_net_csr(circuit:str, root:str=DATA_ROOT, chunk_size:int=65536) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """
+    Stream <circuit>.net.csv, chunk_size lines at a time.
+    Each row is a python list of pin names, e.g. "['a', 'b']", which is parsed by PIN_NAME_PATTERN instead of eval.
+    Return the netlist in CSR:
+        names: the pin names, interned in the order of first appearance.
+        net_ptr: int64 with shape (num_net + 1,), pin_ids: int64 with shape (num_pin,),
+        the pins of net i are names[pin_ids[net_ptr[i]:net_ptr[i+1]]].
+    """
     path = os.path.join(root, f"{circuit}.net.csv")
-    df_net = pd.read_csv(path, dtype={'net':str})
-    nets = []
-    for row in df_net.itertuples():
-        net = eval(row.net)
-        nets.append(net)
-    return nets
+    name2id:Dict[str, int] = {}
+    num_pin = array("q")
+    pin_ids = array("q")
+    with open(path, "r") as f:
+        header = f.readline().strip()
+        assert header == "net", "[Error] The header of {} should be net, but got {}.".format(path, header)
+        while True:
+            lines = list(islice(f, chunk_size))
+            if len(lines) == 0:
+                break
+            for line in lines:
+                line = line.strip()
+                if len(line) == 0:
+                    continue
+                # the field is quoted in csv if it contains a comma or a quote
+                if line[0] == '"':
+                    line = line[1:-1].replace('""', '"')
+                names = PIN_NAME_PATTERN.findall(line) # (single quoted, double quoted)
+                for single, double in names:
+                    name = single or double
+                    if "\\" in name:
+                        name = ast.literal_eval("'{}'".format(single) if single else '"{}"'.format(double))
+                    pin_ids.append(name2id.setdefault(name, len(name2id)))
+                num_pin.append(len(names))
+
+    net_ptr = np.zeros(len(num_pin) + 1, dtype=np.int64)
+    net_ptr[1:] = np.cumsum(np.frombuffer(num_pin, dtype=np.int64))
+    return list(name2id), net_ptr, np.frombuffer(pin_ids, dtype=np.int64).copy()
+
+
+def parse_bookshelf_block(circuit:str, root:str=BOOKSHELF_ROOT) -> Tuple[Dict[str, Dict[str, float]], Dict[str, Dict[str, float]], float, float]:
+    """
+    Stream <circuit>.block in Bookshelf format, in a single pass:
+        Outline: <w> <h>
+        NumBlocks: <n>, NumTerminals: <n>, other Num* headers are skipped, a header may also be "Key : value"
+        <name> <w> <h>                                      hard block
+        <name> hardrectilinear <k> (x1, y1) ... (xk, yk)    hard block, the bounding box of the vertices
+        <name> softrectangular <area> <min_ar> <max_ar>     soft block, the aspect ratio h/w closest to 1 in [min_ar, max_ar]
+        <name> terminal <x> <y>
+    Return blk_wh_dict {name: {"w", "h", "type"}}, tml_xy_dict {name: {"x", "y"}}, and the width and height of the outline.
+    type is "Macro" for hard blocks and "Soft" for soft blocks.
+    """
+    path = os.path.join(root, f"{circuit}.block")
+    blk_wh_dict, tml_xy_dict = OrderedDict(), OrderedDict()
+    outline_w = outline_h = None
+    num_block = num_terminal = None
+    with open(path, "r") as f:
+        for line_no, line in enumerate(f, 1):
+            tokens = line.split()
+            if len(tokens) == 0 or tokens[0].startswith("#") or tokens[0] in ("UCSC", "UCLA"):
+                continue
+            # headers are "Key: value" or "Key : value"
+            key = tokens[0].rstrip(":")
+            values = [token for token in tokens[1:] if token != ":"]
+            if key == "Outline":
+                outline_w, outline_h = float(values[0]), float(values[1])
+            elif key == "NumBlocks":
+                num_block = int(values[0])
+            elif key == "NumTerminals":
+                num_terminal = int(values[0])
+            elif key.startswith("Num"):
+                # NumSoftRectangularBlocks, NumHardRectilinearBlocks, ... are included in NumBlocks
+                continue
+            elif len(tokens) < 2:
+                print("[WARNING] Skip line {} of {}: {}".format(line_no, path, line.strip()))
+            elif tokens[1] == "terminal":
+                tml_xy_dict[tokens[0]] = {'x': float(tokens[2]), 'y': float(tokens[3])}
+            elif tokens[1] == "hardrectilinear":
+                xy = np.array(re.findall(r"[-+]?[0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?", " ".join(tokens[3:])), dtype=float).reshape(-1, 2)
+                w, h = xy.max(axis=0) - xy.min(axis=0)
+                blk_wh_dict[tokens[0]] = {'w': float(w), 'h': float(h), 'type': "Macro"}
+            elif tokens[1] == "softrectangular":
+                area, min_ar, max_ar = float(tokens[2]), float(tokens[3]), float(tokens[4])
+                ar = min(max(1.0, min_ar), max_ar)
+                blk_wh_dict[tokens[0]] = {'w': (area / ar) ** 0.5, 'h': (area * ar) ** 0.5, 'type': "Soft"}
+            else:
+                assert len(tokens) == 3, "[Error] Can not parse line {} of {}: {}".format(line_no, path, line.strip())
+                blk_wh_dict[tokens[0]] = {'w': float(tokens[1]), 'h': float(tokens[2]), 'type': "Macro"}
+
+    assert outline_w is not None, "[Error] There is no Outline in {}.".format(path)
+    assert num_block is None or num_block == len(blk_wh_dict), "[Error] NumBlocks of {} is {}, but {} blocks are read.".format(path, num_block, len(blk_wh_dict))
+    assert num_terminal is None or num_terminal == len(tml_xy_dict), "[Error] NumTerminals of {} is {}, but {} terminals are read.".format(path, num_terminal, len(tml_xy_dict))
+    return blk_wh_dict, tml_xy_dict, outline_w, outline_h
+
+
+def parse_bookshelf_blk_tml(circuit:str, area_util:float, add_halo:bool, halo_width:float, halo_height:float, root:str=BOOKSHELF_ROOT) -> Tuple[Dict[str, Dict[str, float]], Dict[str, Dict[str, float]], float, float]:
+    """
+    The same as parse_blk_tml, but read <circuit>.block in Bookshelf format, see parse_bookshelf_block.
+    The chip is a square with the area of the blocks / area_util as in parse_blk_tml, the outline of the benchmark is not used.
+    """
+    blocks, tml_xy_dict, outline_w, outline_h = parse_bookshelf_block(circuit, root)
+    if not add_halo:
+        halo_width = 0.0
+        halo_height = 0.0
+
+    blk_wh_dict = {}
+    blk_area = 0.0
+    for name, block in blocks.items():
+        # the halo is added to macros only, as in parse_blk_tml
+        halo_w, halo_h = (halo_width, halo_height) if block['type'] == "Macro" else (0.0, 0.0)
+        blk_wh_dict[name] = {
+            'w': block['w'] + 2 * halo_w,
+            'h': block['h'] + 2 * halo_h,
+            'realw': block['w'],
+            'realh': block['h'],
+            'type': block['type'],
+            'virtual': False,
+        }
+        blk_area += blk_wh_dict[name]['w'] * blk_wh_dict[name]['h']
+    blk_wh_dict = OrderedDict(sorted(blk_wh_dict.items()))
+
+    die_area = blk_area / area_util
+    chip_w = chip_h = die_area ** 0.5
+    print("outline: ", outline_w, outline_h)
+    print("die area: ", die_area)
+    print("blk_area: ", blk_area)
+    print("chip_w: ", chip_w, "chip_h: ", chip_h)
+    return blk_wh_dict, OrderedDict(sorted(tml_xy_dict.items())), float(chip_w), float(chip_h)
+
+
+def parse_bookshelf_net_csr(circuit:str, root:str=BOOKSHELF_ROOT) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """
+    Stream <circuit>.nets in Bookshelf format, in a single pass:
+        NumNets: <n>, NumPins: <n>
+        NetDegree: <k> [net name], followed by k lines of <pin name> [direction] [: offset], only the pin name is used.
+    Return the netlist in CSR as parse_net_csr.
+    """
+    path = os.path.join(root, f"{circuit}.nets")
+    name2id:Dict[str, int] = {}
+    num_pin = array("q")
+    pin_ids = array("q")
+    num_net = None
+    remain = 0 # the pins to read in the current net
+    with open(path, "r") as f:
+        for line_no, line in enumerate(f, 1):
+            tokens = line.split()
+            if len(tokens) == 0 or tokens[0].startswith("#") or tokens[0] == "UCLA":
+                continue
+            key = tokens[0].rstrip(":")
+            if key in ("NetDegree", "NumNets", "NumPins"):
+                # "NetDegree : 3 [net name]" is also accepted
+                value = int([token for token in tokens[1:] if token != ":"][0])
+                if key == "NetDegree":
+                    assert remain == 0, "[Error] Net {} of {} has {} pins less than its degree.".format(len(num_pin) - 1, path, remain)
+                    remain = value
+                    num_pin.append(value)
+                elif key == "NumNets":
+                    num_net = value
+            else:
+                assert remain > 0, "[Error] Pin {} at line {} of {} is not in a net.".format(tokens[0], line_no, path)
+                pin_ids.append(name2id.setdefault(tokens[0], len(name2id)))
+                remain -= 1
+
+    assert remain == 0, "[Error] The last net of {} has {} pins less than its degree.".format(path, remain)
+    assert num_net is None or num_net == len(num_pin), "[Error] NumNets of {} is {}, but {} nets are read.".format(path, num_net, len(num_pin))
+    net_ptr = np.zeros(len(num_pin) + 1, dtype=np.int64)
+    net_ptr[1:] = np.cumsum(np.frombuffer(num_pin, dtype=np.int64))
+    return list(name2id), net_ptr, np.frombuffer(pin_ids, dtype=np.int64).copy()
 
 
 def map_tml(tml_xy_dict:OrderedDict, chip_w:float, chip_h:float) -> Dict[str, Dict[str, float]]:
@@ -1,2 +1,4 @@
 from .collector import Collector, AsyncCollector
 from .collect_statistics import get_statistics
+from .dedup_buffer import DedupVectorReplayBuffer
+from .action_replay_buffer import ActionReplayBuffer
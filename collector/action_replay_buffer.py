@@ -0,0 +1,100 @@
+import numpy as np
+from copy import deepcopy
+from typing import Any, Dict, List, Optional, Tuple, Union
+from tianshou.data import Batch, VectorReplayBuffer
+from fp_env import PlaceEnv
+from .dedup_buffer import DedupVectorReplayBuffer
+
+
+class ActionReplayBuffer(DedupVectorReplayBuffer):
+    """
+    VectorReplayBuffer which stores no observation, obs of a transition is (episode, step).
+    PlaceEnv is deterministic given the design and the actions, so the observation is rebuilt by replaying the stored actions
+    of its episode on a copy of env, see replay_obs. obs_next is resolved as in DedupVectorReplayBuffer.
+    The observations of a batch are rebuilt episode by episode, in step order, so a batch in buffer order replays each episode once.
+    Learn minibatches should be split by split_episodes, so that each episode is also replayed once per pass, see A2CPolicy._split.
+    An episode must be collected from its reset, and not be overwritten before learning, which holds for the on-policy collector.
+    """
+    def __init__(self, total_size:int, buffer_num:int, env:PlaceEnv):
+        super().__init__(total_size, buffer_num)
+        self.env = deepcopy(env)
+
+
+    def reset(self, keep_statistics:bool=False):
+        super().reset(keep_statistics)
+        self.episode_start:Dict[int, int] = {} # index of the first transition of each episode
+        self.num_episode = 0
+        # (episode, step) of self.env, step is the number of replayed actions
+        self.replay_episode, self.replay_step = -1, 0
+
+
+    def add(self, batch:Batch, buffer_ids:Optional[Union[np.ndarray, List[int]]]=None) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        if buffer_ids is None:
+            buffer_ids = np.arange(self.buffer_num)
+        episode = np.zeros(len(buffer_ids), dtype=np.int64)
+        step = np.zeros(len(buffer_ids), dtype=np.int64)
+        for i, buffer_id in enumerate(buffer_ids):
+            last = int(self.last_index[buffer_id])
+            if len(self.buffers[buffer_id]) > 0 and not self.done[last]:
+                episode[i], step[i] = self.obs.episode[last], self.obs.step[last] + 1
+            else:
+                episode[i], step[i] = self.num_episode, 0
+                self.num_episode += 1
+
+        new_batch = Batch({key: batch[key] for key in batch.keys() if key not in ("obs", "obs_next")})
+        new_batch.obs = Batch(episode=episode, step=step)
+        ptr, ep_rew, ep_len, ep_idx = VectorReplayBuffer.add(self, new_batch, buffer_ids)
+        for i, index in enumerate(ptr):
+            if step[i] == 0:
+                self.episode_start[int(episode[i])] = int(index)
+        return ptr, ep_rew, ep_len, ep_idx
+
+
+    def get_obs_next(self, indices:np.ndarray) -> Batch:
+        """obs_next of buffer[indices], rebuilt after replaying their actions."""
+        return self.replay_obs(Batch(episode=self.obs.episode[indices], step=self.obs.step[indices] + 1))
+
+
+    def replay_obs(self, obs:Batch) -> Batch:
+        """Rebuild the observations of obs = Batch(episode, step)."""
+        episode, step = np.asarray(obs.episode), np.asarray(obs.step)
+        rebuilt = [None] * len(episode)
+        # episodes in the order of their first appearance, the replay continues from the previous batch
+        _, first, inverse = np.unique(episode, return_index=True, return_inverse=True)
+        for i in np.lexsort((step, np.argsort(np.argsort(first))[inverse])):
+            rebuilt[i] = self._replay(int(episode[i]), int(step[i]))
+        return Batch(np.stack(rebuilt))
+
+
+    def split_episodes(self, obs:Batch, size:int) -> List[np.ndarray]:
+        """
+        Indices of obs = Batch(episode, step) in minibatches of size, the last one is merged as in Batch.split(merge_last=True).
+        Whole episodes are shuffled instead of transitions, and the transitions of an episode stay in step order,
+        so replay_obs of the minibatches in turn replays each episode once.
+        """
+        episode, step = np.asarray(obs.episode), np.asarray(obs.step)
+        unique_episode, inverse = np.unique(episode, return_inverse=True)
+        rank = np.random.permutation(len(unique_episode))
+        order = np.lexsort((step, rank[inverse]))
+        length = len(order)
+        num_minibatch = max(1, length // size)
+        return [order[i * size:(i + 1) * size if i < num_minibatch - 1 else length] for i in range(num_minibatch)]
+
+
+    def _replay(self, episode:int, step:int) -> Dict[str, Any]:
+        """Move self.env to the state after the first step actions of episode, return its observation."""
+        assert episode in self.episode_start, "[Error] The first transition of episode {} is not in the buffer.".format(episode)
+        if episode != self.replay_episode or step < self.replay_step:
+            self.env.reset()
+            self.replay_episode, self.replay_step = episode, 0
+
+        start = self.episode_start[episode]
+        buffer_id = np.searchsorted(self._extend_offset, start, side="right") - 1
+        offset, size = self._offset[buffer_id], self.buffers[buffer_id].maxsize
+        for k in range(self.replay_step, step):
+            index = offset + (start - offset + k) % size
+            assert self.obs.episode[index] == episode and self.obs.step[index] == k, \
+                "[Error] Step {} of episode {} is overwritten in the buffer.".format(k, episode)
+            self.env.step(self.act[index], build_obs=False)
+        self.replay_step = step
+        return self.env.get_obs()
@@ -0,0 +1,73 @@
+import numpy as np
+from copy import deepcopy
+from typing import Any, Dict, List, Optional, Tuple, Union
+from tianshou.data import Batch, VectorReplayBuffer
+
+
+class DedupVectorReplayBuffer(VectorReplayBuffer):
+    """
+    VectorReplayBuffer which stores each observation once.
+    obs_next of a transition is obs of buffer.next(index), so it is not stored,
+    except for the last transition of an episode (terminal obs_next) and the last transition of an unfinished episode,
+    whose obs_next are copied to extra_obs_next.
+    buffer[indices] has no obs_next, call get_obs_next(indices) to resolve it lazily, see A2CPolicy._compute_returns.
+    """
+    def __init__(self, total_size:int, buffer_num:int):
+        super().__init__(total_size, buffer_num, ignore_obs_next=True)
+
+
+    def reset(self, keep_statistics:bool=False):
+        super().reset(keep_statistics)
+        self.extra_obs_next:Dict[int, Batch] = {}
+
+
+    def add(self, batch:Batch, buffer_ids:Optional[Union[np.ndarray, List[int]]]=None) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        if buffer_ids is None:
+            buffer_ids = np.arange(self.buffer_num)
+        # obs_next of the previous unfinished transition is obs of the new transition now
+        for buffer_id in buffer_ids:
+            last = int(self.last_index[buffer_id])
+            if len(self.buffers[buffer_id]) > 0 and not self.done[last]:
+                self.extra_obs_next.pop(last, None)
+
+        ptr, ep_rew, ep_len, ep_idx = super().add(batch, buffer_ids)
+        # the collector overwrites obs_next of finished envs by the reset obs in place, so it is copied
+        for i, index in enumerate(ptr):
+            self.extra_obs_next[int(index)] = deepcopy(batch.obs_next[i])
+        return ptr, ep_rew, ep_len, ep_idx
+
+
+    def get_obs_next(self, indices:np.ndarray) -> Batch:
+        """obs_next of buffer[indices]."""
+        obs_next = self.get(self.next(indices), "obs")
+        for i, index in enumerate(indices):
+            if int(index) in self.extra_obs_next:
+                obs_next[i] = self.extra_obs_next[int(index)]
+        return obs_next
+
+
+    def has_extra_obs_next(self, indices:np.ndarray) -> np.ndarray:
+        """True if obs_next of buffer[indices] is not obs of buffer[buffer.next(indices)]."""
+        return self.next(indices) == indices
+
+
+    def __getitem__(self, index:Union[slice, int, List[int], np.ndarray]) -> Batch:
+        """The same as ReplayBuffer.__getitem__, but obs_next is not gathered."""
+        if isinstance(index, slice):
+            indices = self.sample_indices(0) if index == slice(None) else self._indices[:len(self)][index]
+        else:
+            indices = index
+        batch_dict:Dict[str, Any] = {
+            "obs": self.get(indices, "obs"),
+            "act": self.act[indices],
+            "rew": self.rew[indices],
+            "terminated": self.terminated[indices],
+            "truncated": self.truncated[indices],
+            "done": self.done[indices],
+            "info": self.get(indices, "info", Batch()),
+            "policy": self.get(indices, "policy", Batch()),
+        }
+        for key in self._meta.__dict__.keys():
+            if key not in self._input_keys:
+                batch_dict[key] = self._meta[key][indices]
+        return Batch(batch_dict)
@@ -3,3 +3,12 @@ from .net import Net
 from .fp_info import FPInfo, discretize
 from .place_env import PlaceEnv, RewardArgs
 from .terminal import Terminal
+from .position_mask import PositionMaskEngine
+from .net_array import NetArray
+from .metrics_tracker import MetricsTracker
+from .mask_cache import MaskCache
+from .vector_env import VectorPlaceEnv
+from .design_template import DesignTemplate
+from .undo_log import UndoLog
+from .sequence_feature import SequenceFeature
+from .obs_schema import ObsSchema, flatten_obs, unflatten_obs
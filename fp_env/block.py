@@ -3,6 +3,9 @@ import numpy as np
 from .terminal import Terminal
 
 class Block:
+    # changed during an episode, see get_state
+    STATE_KEYS = ("x", "y", "z", "w", "h", "grid_x", "grid_y", "grid_z", "grid_w", "grid_h", "placed")
+
     def __init__(self, x:float, y:float, z:int, w:float, h:float,
                  realw:float, realh:float, name:str, type_:str, preplaced:bool, virtual:bool,
                  ):
@@ -79,6 +82,13 @@ class Block:
         if hasattr(self, "init_grid_w") and hasattr(self, "init_grid_h"):
             self.grid_w, self.grid_h = self.init_grid_w, self.init_grid_h
  
+    def get_state(self) -> dict:
+        """position, shape and layer of the block, used by the undo log of PlaceEnv."""
+        return {key: self.__dict__[key] for key in self.STATE_KEYS if key in self.__dict__}
+
+    def set_state(self, state:dict):
+        self.__dict__.update(state)
+ 
     def set_ratio(self, ratio:float, x_grid_num:int, y_grid_num:int):
         """ratio is w/h."""
         # ratio = grid_w/grid_h, reset grid_w and grid_h based on ratio, keep grid_area unchanged
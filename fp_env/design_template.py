@@ -0,0 +1,29 @@
+import torch
+from collections import defaultdict
+from typing import List
+from .terminal import Terminal
+from .net import Net
+
+
+class DesignTemplate:
+    """
+    Immutable part of a design: terminals, nets (netlist incidence), adjacency matrix and partner table.
+    It is shared by reference between the replicas of FPInfo, deepcopy returns the template itself.
+    The mutable episode state, i.e., blocks, net ranges, canvas and reward metrics, stays in FPInfo.
+    The nets of the template are views of the NetArray of the original FPInfo, they hold the immutable incidence (weight, init range, connectors).
+    A replica resolves its nets through fp_info.net_info, which are its own views of its NetArray, and its blocks are connected to them.
+    terminal.connected_nets still refer to the nets of the template.
+    """
+    def __init__(self, terminal_info:List[Terminal], net_info:List[Net]):
+        self.terminal_info = terminal_info
+        self.net_info = net_info
+        self.adjacency_matrix: torch.Tensor = None
+        # for all partner pairs
+        self.partner_idx2indices: dict[int, list[int]] = defaultdict(list)
+
+
+    def __deepcopy__(self, memo:dict) -> "DesignTemplate":
+        # terminals and nets are also reachable from blocks, e.g., block.connected_nets
+        for obj in [self, self.terminal_info, self.net_info, *self.terminal_info, *self.net_info]:
+            memo[id(obj)] = obj
+        return self
@@ -1,15 +1,39 @@
 from .block import Block
 from .net import Net
+from .net_array import NetArray
+from .metrics_tracker import MetricsTracker
 from .terminal import Terminal
+from .position_mask import PositionMaskEngine
+from .design_template import DesignTemplate
 from typing import List, Dict, Tuple, Union
 import torch
 import pandas as pd
 from collections import Counter, defaultdict
 import numpy as np
+from copy import deepcopy
 # from typing import dict
 import pdb
 
 
+def _legalize_preplaced(occupied:np.ndarray, block:Block):
+    """
+    Shift the preplaced block right to the first grid_x >= block.grid_x without overlap with the occupied grids of its die, and occupy it.
+    The overlap of every candidate grid_x is read from the prefix sum of the occupied columns in the rows of the block, in one query.
+    The parts out of the canvas are clipped as in slicing, so a block may be shifted beyond the right boundary.
+    """
+    x_grid_num = occupied.shape[0]
+    column = occupied[:, block.grid_y:block.grid_y+block.grid_h].any(axis=1)
+    # a block wider than the canvas has a negative grid_x, where slicing wraps around
+    while block.grid_x < 0 and column[block.grid_x:block.grid_x+block.grid_w].any():
+        block.grid_x += 1
+    if block.grid_x >= 0:
+        prefix = np.concatenate([[0], np.cumsum(column)])
+        x = np.arange(block.grid_x, x_grid_num + 1)
+        overlap = prefix[np.minimum(x + block.grid_w, x_grid_num)] - prefix[np.minimum(x, x_grid_num)]
+        block.grid_x = int(x[np.argmax(overlap == 0)])
+    occupied[block.grid_x:block.grid_x+block.grid_w, block.grid_y:block.grid_y+block.grid_h] = True
+
+
 def discretize(block_info:List[Block], terminal_info:List[Terminal], x_grid_num:int, y_grid_num:int, original_outline_width:float, original_outline_height:float):
         """discretize the block x,y,w,h to grid position."""
         print('[INFO] discretize block to {} x {}'.format(x_grid_num, y_grid_num))
@@ -17,22 +41,15 @@ def discretize(block_info:List[Block], terminal_info:List[Terminal], x_grid_num:
         grid_width  = original_outline_width  / x_grid_num
         grid_height = original_outline_height / y_grid_num
 
-        # The size of the canvas
-        canvas = defaultdict(lambda: torch.zeros(x_grid_num, y_grid_num).to(torch.int))
+        # occupied grids of preplaced blocks in each die
+        occupied = defaultdict(lambda: np.zeros((x_grid_num, y_grid_num), dtype=bool))
 
         for block in block_info:
             block.set_grid_wh(grid_width, grid_height)
             block.set_grid_xy(grid_width, grid_height, x_grid_num, y_grid_num)
             # block.preplaced
             if block.preplaced:
-                while True:
-                    canvas[block.grid_z][block.grid_x:block.grid_x+block.grid_w, block.grid_y:block.grid_y+block.grid_h] += 1
-                    # without overlap?
-                    if (canvas[block.grid_z] > 1).sum() > 0:
-                        canvas[block.grid_z][block.grid_x:block.grid_x+block.grid_w, block.grid_y:block.grid_y+block.grid_h] -= 1
-                        block.grid_x += 1
-                    else:
-                        break
+                _legalize_preplaced(occupied[block.grid_z], block)
 
         print('[INFO] discretize terminal to {} x {}'.format(x_grid_num, y_grid_num))
         for terminal in terminal_info:
@@ -46,8 +63,8 @@ class FPInfo:
                  original_outline_width:float, original_outline_height:float, x_grid_num:int, y_grid_num:int):
         """original_outline_width and original_outline_height are the original width and height of the chip. They are used to discretize the block position to grid position."""
         self.block_info = block_info
-        self.terminal_info = terminal_info
-        self.net_info = net_info
+        # terminals, nets, adjacency matrix and partner table are shared by replicas
+        self.template = DesignTemplate(terminal_info, net_info)
 
         self.original_outline_width = original_outline_width
         self.original_outline_height = original_outline_height
@@ -69,9 +86,6 @@ class FPInfo:
 
         assert self.block_num > 0, "[ERROR] block_num should be larger than 0, but got {}".format(self.block_num)
 
-        # for all partner pairs
-        self.partner_idx2indices: dict[int, list[int]] = defaultdict(list)
-
         # list of add modules
         self.all_modules: List[Union[Block, Terminal]] = block_info + terminal_info
 
@@ -110,14 +124,68 @@ class FPInfo:
         print('[INFO] num_layer: {}'.format(self.num_layer))
         print('[INFO] net_num: {}'.format(self.net_num))
 
+        # nets are stored as arrays, net_info are views of net_array
+        self.net_array = NetArray(self.net_info, self.block_info, self.num_layer)
+
+        # running totals of reward metrics
+        self.metrics_tracker = MetricsTracker(self)
+
+    @property
+    def terminal_info(self) -> List[Terminal]:
+        return self.template.terminal_info
+
+    @property
+    def net_info(self) -> List[Net]:
+        """views of self.net_array, the nets of the template for the original FPInfo, see __deepcopy__."""
+        return self.__dict__.get("_net_views") or self.template.net_info
+
+    @property
+    def adjacency_matrix(self) -> torch.Tensor:
+        return self.template.adjacency_matrix
+
+    @property
+    def partner_idx2indices(self) -> Dict[int, List[int]]:
+        return self.template.partner_idx2indices
+
+
+    def __deepcopy__(self, memo:dict) -> "FPInfo":
+        """The design template is shared, only the episode state (blocks, net ranges, canvas, metrics) is copied."""
+        # register the shared objects in memo first
+        deepcopy(self.template, memo)
+        # the nets of a replica are replaced below, do not copy them
+        for net in self.__dict__.get("_net_views", []):
+            memo[id(net)] = net
+        new = self.__class__.__new__(self.__class__)
+        memo[id(self)] = new
+        for key, value in self.__dict__.items():
+            if key != "_net_views":
+                new.__dict__[key] = deepcopy(value, memo)
+        # the nets of the template are views of the NetArray of the original FPInfo,
+        # the replica has its own views, and its blocks are connected to them
+        new._net_views = [net.view(new.net_array, new.block_info) for net in self.template.net_info]
+        for block in new.block_info:
+            block.connected_nets = [new._net_views[net_idx] for net_idx in new.net_array.get_net_indices(block)]
+        return new
+
+
     def set_alignment_sort(self, alignment_sort:str):
         self.alignment_sort = alignment_sort
+
+    def set_metrics_debug(self, debug:bool):
+        """cross-check the incremental reward metrics with the full recompute in each step."""
+        self.metrics_tracker.debug = debug
     
     def set_adjacency_matrix(self, adjacency_matrix:torch.Tensor):
-        """set adjacency matrix for the net_info."""
-        self.adjacency_matrix = adjacency_matrix
-        print('[INFO] adjacency_matrix: {}'.format(self.adjacency_matrix.shape))
-        print('[INFO] mean degree: {}'.format(self.adjacency_matrix.sum() / self.adjacency_matrix.shape[0]))
+        """set adjacency matrix for the net_info, a sparse COO tensor, see construct_adjacency."""
+        self.template.adjacency_matrix = adjacency_matrix.coalesce()
+        print('[INFO] adjacency_matrix: {}, {} nonzeros'.format(self.adjacency_matrix.shape, self.adjacency_matrix._nnz()))
+        print('[INFO] mean degree: {}'.format(self.adjacency_matrix.values().sum() / self.adjacency_matrix.shape[0]))
+
+    def get_adjacency_submatrix(self, start:int, end:int) -> torch.Tensor:
+        """adjacency_matrix[start:end, start:end], a sparse COO tensor, the full matrix is not densified."""
+        indices, values = self.adjacency_matrix.indices(), self.adjacency_matrix.values()
+        inside = ((indices >= start) & (indices < end)).all(dim=0)
+        return torch.sparse_coo_tensor(indices[:, inside] - start, values[inside], (end - start, end - start), is_coalesced=True, check_invariants=False)
     
 
     @torch.no_grad()
@@ -134,10 +202,21 @@ class FPInfo:
         """
         canvas.shape is (num_layer, x_grid_num, y_grid_num)
         """
-        self.canvas = torch.zeros(self.num_layer, self.x_grid_num, self.y_grid_num)
+        # in place, canvas may be a view of a batched storage, see fp_env.vector_env.VectorPlaceEnv
+        if not hasattr(self, "canvas"):
+            self.canvas = torch.zeros(self.num_layer, self.x_grid_num, self.y_grid_num)
+        self.canvas.zero_()
         for block in self.block_info:
             if block.preplaced and block.placed:
                 self.canvas[block.grid_z, block.grid_x:block.grid_x+block.grid_w, block.grid_y:block.grid_y+block.grid_h] += 1
+
+        # increased when a non-virtual block is placed on the die
+        self.die_version = [0 for _ in range(self.num_layer)]
+
+        # occupancy of non-virtual blocks, used for position mask
+        if not hasattr(self, "position_mask_engine"):
+            self.position_mask_engine = PositionMaskEngine(self.num_layer, self.x_grid_num, self.y_grid_num, self.block_num)
+        self.position_mask_engine.reset([block for block in self.block_info if block.preplaced and block.placed and not block.virtual])
     
 
     def update_canvas(self, block:Block):
@@ -145,6 +224,18 @@ class FPInfo:
         if block.virtual:
             return
         self.canvas[block.grid_z, block.grid_x:block.grid_x+block.grid_w, block.grid_y:block.grid_y+block.grid_h] += 1
+        self.position_mask_engine.add_block(block)
+        self.die_version[block.grid_z] += 1
+
+
+    def remove_from_canvas(self, block:Block):
+        """inverse of update_canvas, block should be the last placed block on its die."""
+        if block.virtual:
+            return
+        self.canvas[block.grid_z, block.grid_x:block.grid_x+block.grid_w, block.grid_y:block.grid_y+block.grid_h] -= 1
+        self.position_mask_engine.remove_block(block)
+        # versions only increase, a mask cached before the block is removed is never hit
+        self.die_version[block.grid_z] += 1
 
 
     def reset(self):
@@ -155,44 +246,36 @@ class FPInfo:
         for block in self.block_info:
             block.reset()
         
-        net_id = 0
-        # print("net reset begin")
-        for net in self.net_info:
-            net.reset()
-            net.init_layer_num_pin(self.num_layer)
-            # print("net_id: ", net_id)
-            # net.show_layer_num_pin()
-        # print("net reset end")
+        # reset net range and pin_layer of all nets
+        self.net_array.reset()
             
         self.placed_movable_block_num = 0
 
         self.reset_canvas()
+        self.metrics_tracker.reset()
+
+
 
+    def add_layer_num_pin(self, block:Block, layer_id:int):
+        """add one pin on layer_id for each net of the block, and update via."""
+        self.net_array.add_layer_num_pin(block, layer_id)
+        self.metrics_tracker.update_via(block)
 
 
     def calc_hpwl(self) -> Tuple[float, float, float]:
         """calculate grid_hpwl, weighted_grid_hpwl, original_hpwl."""
-        grid_hpwl = 0
-        weighted_grid_hpwl = 0
-        original_hpwl = 0
+        x_stride, y_stride = self.net_array.calc_stride()
+        hpwl = x_stride + y_stride
 
-        for net in self.net_info:
-            tmp = net.calc_hpwl()
-            grid_hpwl += tmp
-            weighted_grid_hpwl += tmp * net.get_net_weight()
-            x_stride, y_stride = net.calc_stride()
-            original_hpwl += x_stride * self.grid_width + y_stride * self.grid_height
+        grid_hpwl = int(hpwl.sum())
+        weighted_grid_hpwl = float((hpwl * self.net_array.weight).sum())
+        original_hpwl = float((x_stride * self.grid_width + y_stride * self.grid_height).sum())
 
         return grid_hpwl, weighted_grid_hpwl, original_hpwl
     
     def calc_via(self) -> int:
         """calculate the number of vias"""
-        num_via = 0
-        #print("net_len: ", len(self.net_info))
-        # optimize the number of the vias
-        for net in self.net_info:
-            num_via += net.is_cut()
-        return num_via
+        return int(self.net_array.is_cut().sum())
     
     def check_net_init_status(self) -> bool:
         init_flag = True
@@ -224,11 +307,8 @@ class FPInfo:
 
     def calc_original_hpwl(self) -> float:
         """calculate HPWL for all nets."""
-        hpwl = 0
-        for net in self.net_info:
-            x_stride, y_stride = net.calc_stride()
-            hpwl += x_stride * self.grid_width + y_stride * self.grid_height
-        return hpwl
+        x_stride, y_stride = self.net_array.calc_stride()
+        return float((x_stride * self.grid_width + y_stride * self.grid_height).sum())
 
 
     def get_block_by_movable_idx(self, movable_idx:int) -> Block:
@@ -395,4 +475,4 @@ class FPInfo:
                 name2alignment_group_color[blk.name] = "blue"
 
         self._name2alignment_group_color = name2alignment_group_color
-        return name2alignment_group_color
\ No newline at end of file
+        return name2alignment_group_color
\ No newline at end of file
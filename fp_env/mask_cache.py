@@ -0,0 +1,72 @@
+import threading
+from collections import OrderedDict, defaultdict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+
+class MaskCache:
+    """
+    LRU cache for masks of a block.
+    The key is a tuple whose first element is the mask name, the rest are everything the mask depends on,
+    e.g., movable_idx, grid_w, grid_h, die, die_version and net version.
+    A stale entry is never hit, because the versions in its key are out of date; it is evicted by LRU.
+    Cached masks are shared between observations, they should not be modified in place.
+    get() is thread-safe, see PlaceEnv.set_mask_workers. A key being computed by another thread is waited for instead of computed again.
+    """
+    def __init__(self, max_size:int=64):
+        self.max_size = max_size
+        self._cache: OrderedDict[Tuple, Any] = OrderedDict()
+        self._pending: Dict[Tuple, Future] = {}
+        self._lock = threading.Lock()
+        self.hits: Dict[str, int] = defaultdict(int)
+        self.misses: Dict[str, int] = defaultdict(int)
+
+
+    def get(self, key:Tuple[Hashable, ...], compute:Callable[[], Any]) -> Any:
+        """return the cached value of key, or compute and cache it."""
+        name = key[0]
+        with self._lock:
+            if key in self._cache:
+                self.hits[name] += 1
+                self._cache.move_to_end(key)
+                return self._cache[key]
+            pending = self._pending.get(key)
+            if pending is None:
+                self.misses[name] += 1
+                self._pending[key] = Future()
+            else:
+                self.hits[name] += 1
+        if pending is not None:
+            return pending.result()
+
+        try:
+            value = compute()
+        except BaseException as e:
+            with self._lock:
+                self._pending.pop(key).set_exception(e)
+            raise
+        with self._lock:
+            self._cache[key] = value
+            if len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+            self._pending.pop(key).set_result(value)
+        return value
+
+
+    def __contains__(self, key:Tuple[Hashable, ...]) -> bool:
+        return key in self._cache
+
+
+    def clear(self):
+        """remove all entries, counters are kept."""
+        with self._lock:
+            self._cache.clear()
+
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """hits, misses and hit_rate of each mask."""
+        res = {}
+        for name in sorted(set(self.hits) | set(self.misses)):
+            hits, misses = self.hits[name], self.misses[name]
+            res[name] = {"hits": hits, "misses": misses, "hit_rate": hits / (hits + misses)}
+        return res
@@ -0,0 +1,202 @@
+import numpy as np
+from typing import Tuple
+from .block import Block
+
+
+def calc_overlap_1d(x1:int, x2:int, w1:int, w2:int) -> int:
+    """calculate the overlap length for 1D."""
+    left, right = max(x1, x2), min(x1 + w1, x2 + w2)
+    return max(0, right - left)
+
+
+class MetricsTracker:
+    """
+    Running totals of the reward metrics of fp_info.
+    reset() computes all metrics once, then add_block() and update_via() only touch the nets, partners and footprint of one block.
+    If debug is True, check() compares the running totals with the full recompute in FPInfo.
+    """
+    def __init__(self, fp_info, debug:bool=False):
+        self.fp_info = fp_info
+        self.debug = debug
+
+
+    def reset(self):
+        fp_info = self.fp_info
+        net_array = fp_info.net_array
+
+        # hpwl, stride of each net
+        self.x_stride, self.y_stride = net_array.calc_stride()
+        self.sum_x_stride = int(self.x_stride.sum())
+        self.sum_y_stride = int(self.y_stride.sum())
+        self.weight_hpwl = float(((self.x_stride + self.y_stride) * net_array.weight).sum())
+
+        # via, cut status of each net
+        self.cut = net_array.is_cut()
+        self.via = int(self.cut.sum())
+
+        # overlap, number of overlapped cells in canvas
+        self.overlap_cells = int((fp_info.canvas - 1).clamp_min_(0).sum().item())
+
+        # area and number of placed blocks in each layer
+        self.area_layer = np.zeros(fp_info.num_layer, dtype=np.float64)
+        self.num_block_layer = np.zeros(fp_info.num_layer, dtype=np.float64)
+
+        # alignment area, required alignment area and score of each block
+        self.alignment_area = np.zeros(fp_info.block_num, dtype=np.int64)
+        self.required_alignment_area = np.zeros(fp_info.block_num, dtype=np.int64)
+        self.alignment_score = np.zeros(fp_info.block_num, dtype=np.float64)
+        self.has_alignment_score = np.zeros(fp_info.block_num, dtype=bool)
+        self.sum_alignment_score = 0.0
+        self.alignment_num = 0
+
+        for block in fp_info.block_info:
+            if block.placed:
+                self.area_layer[block.grid_z] += float(block.grid_w * block.grid_h)
+                self.num_block_layer[block.grid_z] += 1.0
+
+        for blk_idx in fp_info.partner_idx2indices.keys():
+            block = fp_info.get_module_by_full_idx(blk_idx)
+            if not block.placed:
+                continue
+            for partner_idx in block.partner_indices:
+                partner_block = fp_info.get_module_by_full_idx(partner_idx)
+                if partner_block.placed:
+                    self.alignment_area[blk_idx] += calc_overlap_1d(block.grid_x, partner_block.grid_x, block.grid_w, partner_block.grid_w) * \
+                                                    calc_overlap_1d(block.grid_y, partner_block.grid_y, block.grid_h, partner_block.grid_h)
+                    self.required_alignment_area[blk_idx] += partner_block.grid_area
+            self._update_alignment_score(block)
+
+
+    def add_block(self, block:Block):
+        """update metrics after the block is placed, i.e., net range and canvas have been updated."""
+        fp_info = self.fp_info
+
+        # hpwl, only the nets of block are changed
+        net_indices = np.unique(fp_info.net_array.get_net_indices(block))
+        self._update_hpwl(net_indices)
+
+        # overlap, a cell becomes overlapped if it is covered by at least 2 blocks now
+        if not block.virtual:
+            footprint = fp_info.canvas[block.grid_z, block.grid_x:block.grid_x+block.grid_w, block.grid_y:block.grid_y+block.grid_h]
+            self.overlap_cells += int((footprint >= 2).sum().item())
+
+        # area and number
+        self.area_layer[block.grid_z] += float(block.grid_w * block.grid_h)
+        self.num_block_layer[block.grid_z] += 1.0
+
+        # alignment, only the block and its placed partners are changed
+        changed_blocks = {block.idx: block}
+        for partner_idx in block.partner_indices:
+            partner_block = fp_info.get_module_by_full_idx(partner_idx)
+            if not partner_block.placed:
+                continue
+            overlap = calc_overlap_1d(block.grid_x, partner_block.grid_x, block.grid_w, partner_block.grid_w) * \
+                      calc_overlap_1d(block.grid_y, partner_block.grid_y, block.grid_h, partner_block.grid_h)
+            self.alignment_area[block.idx] += overlap
+            self.required_alignment_area[block.idx] += partner_block.grid_area
+            self.alignment_area[partner_idx] += overlap
+            self.required_alignment_area[partner_idx] += block.grid_area
+            changed_blocks[partner_idx] = partner_block
+        for changed_block in changed_blocks.values():
+            self._update_alignment_score(changed_block)
+
+
+    def update_via(self, block:Block):
+        """update via after the pin_layer of the block's nets is changed."""
+        net_indices = np.unique(self.fp_info.net_array.get_net_indices(block))
+        cut = self.fp_info.net_array.is_cut(net_indices)
+        self.via += int(cut.sum()) - int(self.cut[net_indices].sum())
+        self.cut[net_indices] = cut
+
+
+    def save(self, net_indices:np.ndarray, block_indices:list) -> dict:
+        """running totals, and the per-net and per-block values in net_indices and block_indices, used by the undo log of PlaceEnv."""
+        return {
+            "scalars": {key: getattr(self, key) for key in ("sum_x_stride", "sum_y_stride", "weight_hpwl", "via", "overlap_cells", "sum_alignment_score", "alignment_num")},
+            "layers": (self.area_layer.copy(), self.num_block_layer.copy()),
+            "net_indices": net_indices,
+            "nets": (self.x_stride[net_indices].copy(), self.y_stride[net_indices].copy(), self.cut[net_indices].copy()),
+            "block_indices": block_indices,
+            "blocks": tuple(array[block_indices].copy() for array in (self.alignment_area, self.required_alignment_area, self.alignment_score, self.has_alignment_score)),
+        }
+
+
+    def load(self, state:dict):
+        """restore the state returned by save."""
+        for key, value in state["scalars"].items():
+            setattr(self, key, value)
+        self.area_layer, self.num_block_layer = state["layers"]
+        net_indices, block_indices = state["net_indices"], state["block_indices"]
+        self.x_stride[net_indices], self.y_stride[net_indices], self.cut[net_indices] = state["nets"]
+        for array, values in zip((self.alignment_area, self.required_alignment_area, self.alignment_score, self.has_alignment_score), state["blocks"]):
+            array[block_indices] = values
+
+
+    def _update_hpwl(self, net_indices:np.ndarray):
+        net_array = self.fp_info.net_array
+        x_stride = np.maximum(net_array.x_max[net_indices] - net_array.x_min[net_indices], 0)
+        y_stride = np.maximum(net_array.y_max[net_indices] - net_array.y_min[net_indices], 0)
+        delta_x, delta_y = x_stride - self.x_stride[net_indices], y_stride - self.y_stride[net_indices]
+        self.sum_x_stride += int(delta_x.sum())
+        self.sum_y_stride += int(delta_y.sum())
+        self.weight_hpwl += float(((delta_x + delta_y) * net_array.weight[net_indices]).sum())
+        self.x_stride[net_indices] = x_stride
+        self.y_stride[net_indices] = y_stride
+
+
+    def _update_alignment_score(self, block:Block):
+        if len(block.partner_indices) == 0:
+            return
+        if self.has_alignment_score[block.idx]:
+            self.sum_alignment_score -= self.alignment_score[block.idx]
+            self.alignment_num -= 1
+
+        required_alignment_area = min(self.required_alignment_area[block.idx], block.grid_area)
+        self.has_alignment_score[block.idx] = required_alignment_area > 0 # at least one partner is placed
+        if self.has_alignment_score[block.idx]:
+            self.alignment_score[block.idx] = np.clip(self.alignment_area[block.idx] / required_alignment_area, 0.0, 1.0)
+            self.sum_alignment_score += self.alignment_score[block.idx]
+            self.alignment_num += 1
+
+
+    def calc_hpwl(self) -> Tuple[int, float, float]:
+        """return grid_hpwl, weighted_grid_hpwl, original_hpwl."""
+        grid_hpwl = self.sum_x_stride + self.sum_y_stride
+        original_hpwl = self.sum_x_stride * self.fp_info.grid_width + self.sum_y_stride * self.fp_info.grid_height
+        return grid_hpwl, self.weight_hpwl, original_hpwl
+
+    def calc_via(self) -> int:
+        return self.via
+
+    def get_overlap(self, norm:bool=True) -> float:
+        overlap = float(self.overlap_cells)
+        if norm:
+            overlap /= (self.fp_info.num_layer * self.fp_info.x_grid_num * self.fp_info.y_grid_num)
+        return overlap
+
+    def calc_area_ratio(self) -> float:
+        if self.area_layer[1] == 0:
+            return 10000000
+        return float(self.area_layer[0] / self.area_layer[1])
+
+    def calc_num_ratio(self) -> float:
+        if self.num_block_layer[1] == 0:
+            return 10000000
+        return float(self.num_block_layer[0] / self.num_block_layer[1])
+
+    def calc_alignment_score(self) -> float:
+        return self.sum_alignment_score / self.alignment_num if self.alignment_num > 0 else 0.0
+
+
+    def check(self):
+        """cross-check the running totals with the full recompute."""
+        fp_info = self.fp_info
+        for name, value, expected in [
+            ("hpwl", self.calc_hpwl(), fp_info.calc_hpwl()),
+            ("via", self.calc_via(), fp_info.calc_via()),
+            ("overlap", self.get_overlap(), fp_info.get_overlap()),
+            ("area_ratio", self.calc_area_ratio(), fp_info.calc_area_ratio()),
+            ("num_ratio", self.calc_num_ratio(), fp_info.calc_num_ratio()),
+            ("alignment", self.calc_alignment_score(), fp_info.calc_alignment_score()),
+        ]:
+            assert np.allclose(value, expected, rtol=1e-6, atol=1e-6), "[Error] incremental {} = {}, but full recompute = {}".format(name, value, expected)
@@ -3,12 +3,37 @@ from .block import Block
 from .terminal import Terminal
 import math
 
+
+def _net_array_property(key:str) -> property:
+    """The attribute is stored in the net itself, until the net is bound to a NetArray."""
+    def getter(self):
+        if self._net_array is None:
+            return self.__dict__["_" + key]
+        return getattr(self._net_array, key)[self._net_idx]
+
+    def setter(self, value):
+        if self._net_array is None:
+            self.__dict__["_" + key] = value
+        else:
+            getattr(self._net_array, key)[self._net_idx] = value
+
+    return property(getter, setter)
+
+
 class Net:
+    x_min = _net_array_property("x_min")
+    x_max = _net_array_property("x_max")
+    y_min = _net_array_property("y_min")
+    y_max = _net_array_property("y_max")
+    num_placed_connector = _net_array_property("num_placed_connector")
+    pin_layer = _net_array_property("pin_layer")
+
     def __init__(self, connector_list:List[Union[Block, Terminal]], weight:float=1.0, read_fp:bool=False):
         """
         connector_list: list of connector id's that are connected to the net.
         For instance, the full id of preplaced block, movable block, and terminal.
         """
+        self._net_array, self._net_idx = None, None
         self._weight = weight
         self.read_fp = read_fp
 
@@ -61,6 +86,19 @@ class Net:
     def get_net_weight(self) -> float:
         return self._weight
 
+    def bind(self, net_array, net_idx:int):
+        """Net becomes a view of net_array[net_idx], see fp_env.net_array.NetArray."""
+        self._net_array, self._net_idx = net_array, net_idx
+
+    def view(self, net_array, block_info:List[Block]) -> "Net":
+        """A shallow copy of the net which is a view of net_array[net_idx], the connected blocks are resolved in block_info, for a replica of FPInfo."""
+        net = Net.__new__(Net)
+        net.__dict__.update(self.__dict__)
+        net._net_array = net_array
+        if hasattr(self, "connector_list"):
+            net.connector_list = [block_info[connector.idx] if isinstance(connector, Block) else connector for connector in self.connector_list]
+        return net
+
     def init_layer_num_pin(self, num_layer)->List[int]:
         self.pin_layer = [0 for layer_id in range(num_layer)]
     
@@ -0,0 +1,141 @@
+import numpy as np
+from copy import copy
+from typing import List, Tuple
+from .block import Block
+
+
+class NetArray:
+    """
+    Structure-of-arrays storage for all nets, index is the net index in fp_info.net_info.
+    Net range (x_min, x_max, y_min, y_max) uses inf/-inf for an empty net.
+    pin_layer.shape = (net_num, num_layer).
+    block2net_ptr and block2net_indices are the CSR incidence from block full idx to net index.
+    """
+    # mutable net state, the other arrays do not change after construction
+    STATE_KEYS = ("x_min", "x_max", "y_min", "y_max", "num_placed_connector", "pin_layer", "version")
+
+    def __init__(self, net_info:list, block_info:List[Block], num_layer:int):
+        self.net_num = len(net_info)
+        self.num_layer = num_layer
+
+        self.weight = np.array([net.get_net_weight() for net in net_info], dtype=np.float64)
+        self.num_preplaced_fixed_connector = np.array([net.num_preplaced_fixed_connector for net in net_info], dtype=np.int64)
+        self.read_fp = np.array([net.read_fp for net in net_info], dtype=bool)
+        self.init_x_min = np.array([net.init_x_min for net in net_info], dtype=np.float64)
+        self.init_x_max = np.array([net.init_x_max for net in net_info], dtype=np.float64)
+        self.init_y_min = np.array([net.init_y_min for net in net_info], dtype=np.float64)
+        self.init_y_max = np.array([net.init_y_max for net in net_info], dtype=np.float64)
+
+        # current status, copied from nets
+        self.x_min = np.array([net.x_min for net in net_info], dtype=np.float64)
+        self.x_max = np.array([net.x_max for net in net_info], dtype=np.float64)
+        self.y_min = np.array([net.y_min for net in net_info], dtype=np.float64)
+        self.y_max = np.array([net.y_max for net in net_info], dtype=np.float64)
+        self.num_placed_connector = np.array([net.num_placed_connector for net in net_info], dtype=np.int64)
+        self.pin_layer = np.zeros((self.net_num, num_layer), dtype=np.int64)
+        # increased when the net range is updated
+        self.version = np.zeros(self.net_num, dtype=np.int64)
+        for net_idx, net in enumerate(net_info):
+            pin_layer = getattr(net, "pin_layer", [])[:num_layer]
+            self.pin_layer[net_idx, :len(pin_layer)] = pin_layer
+
+        # block -> net, duplicated connectors are kept, the same as block.connected_nets
+        net2idx = {id(net): net_idx for net_idx, net in enumerate(net_info)}
+        block2net = [[] for _ in range(len(block_info))]
+        for block in block_info:
+            block2net[block.idx] = [net2idx[id(net)] for net in block.connected_nets]
+        self.block2net_ptr = np.zeros(len(block_info) + 1, dtype=np.int64)
+        self.block2net_ptr[1:] = np.cumsum([len(net_indices) for net_indices in block2net])
+        self.block2net_indices = np.array([net_idx for net_indices in block2net for net_idx in net_indices], dtype=np.int64)
+
+        # nets become views of this array
+        for net_idx, net in enumerate(net_info):
+            net.bind(self, net_idx)
+
+
+    def __deepcopy__(self, memo:dict) -> "NetArray":
+        """weight, init range and incidence are shared, only the net state is copied."""
+        new = copy(self)
+        memo[id(self)] = new
+        for key in self.STATE_KEYS:
+            setattr(new, key, getattr(self, key).copy())
+        return new
+
+
+    def get_net_indices(self, block:Block) -> np.ndarray:
+        """net indices connected to the block."""
+        return self.block2net_indices[self.block2net_ptr[block.idx]:self.block2net_ptr[block.idx + 1]]
+
+
+    def reset(self):
+        """If there is no preplaced block or terminal, reset the net range to inf, -inf. Clear pin_layer."""
+        # in place, the arrays may be views of a batched storage, see fp_env.vector_env.VectorPlaceEnv
+        has_init = (self.num_preplaced_fixed_connector > 0) | self.read_fp
+        self.x_min[:] = np.where(has_init, self.init_x_min, np.inf)
+        self.x_max[:] = np.where(has_init, self.init_x_max, -np.inf)
+        self.y_min[:] = np.where(has_init, self.init_y_min, np.inf)
+        self.y_max[:] = np.where(has_init, self.init_y_max, -np.inf)
+        self.num_placed_connector[:] = np.where(has_init, self.num_preplaced_fixed_connector, 0)
+        self.pin_layer[:] = 0
+        self.version[:] = 0
+
+
+    def update(self, block:Block):
+        """After placing a block, update the range of its nets."""
+        assert not block.preplaced, "The block is preplaced, should not be updated."
+        net_indices = self.get_net_indices(block)
+        np.add.at(self.num_placed_connector, net_indices, 1)
+        self.version[net_indices] += 1
+        x_center = block.grid_x + block.grid_w / 2
+        y_center = block.grid_y + block.grid_h / 2
+        # np.round is half to even, the same as python round
+        self.x_min[net_indices] = np.round(np.minimum(self.x_min[net_indices], x_center))
+        self.x_max[net_indices] = np.round(np.maximum(self.x_max[net_indices], x_center))
+        self.y_min[net_indices] = np.round(np.minimum(self.y_min[net_indices], y_center))
+        self.y_max[net_indices] = np.round(np.maximum(self.y_max[net_indices], y_center))
+
+
+    def get_net_version(self, block:Block) -> int:
+        """it changes whenever the range of any net of the block is updated."""
+        return int(self.version[self.get_net_indices(block)].sum())
+
+
+    def add_layer_num_pin(self, block:Block, layer_id:int, num:int=1):
+        """add num pins on layer_id for each net of the block."""
+        np.add.at(self.pin_layer, (self.get_net_indices(block), layer_id), num)
+
+
+    def save(self, net_indices:np.ndarray) -> Tuple[np.ndarray, dict]:
+        """state of the nets in net_indices, used by the undo log of PlaceEnv."""
+        return net_indices, {key: getattr(self, key)[net_indices].copy() for key in self.STATE_KEYS}
+
+
+    def load(self, state:Tuple[np.ndarray, dict]):
+        """restore the state returned by save, except that the version is increased."""
+        net_indices, values = state
+        for key in self.STATE_KEYS:
+            if key != "version":
+                getattr(self, key)[net_indices] = values[key]
+        self.version[net_indices] += 1
+
+
+    def get_placed_net_range(self, block:Block) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """return x_min, x_max, y_min, y_max, weight of the block's nets with at least one placed connector."""
+        net_indices = self.get_net_indices(block)
+        net_indices = net_indices[self.num_placed_connector[net_indices] > 0]
+        return self.x_min[net_indices], self.x_max[net_indices], self.y_min[net_indices], self.y_max[net_indices], self.weight[net_indices]
+
+
+    def calc_stride(self) -> Tuple[np.ndarray, np.ndarray]:
+        """return x_stride and y_stride of all nets."""
+        return np.maximum(self.x_max - self.x_min, 0), np.maximum(self.y_max - self.y_min, 0)
+
+
+    def is_cut(self, net_indices:np.ndarray=None) -> np.ndarray:
+        """return a bool array, whether each net (or each net in net_indices) needs a via."""
+        if net_indices is None:
+            net_indices = slice(None)
+        pin_layer = self.pin_layer[net_indices]
+        num_layer_with_pins = (pin_layer > 0).sum(axis=1)
+        return (num_layer_with_pins > 1) | \
+            ((self.num_preplaced_fixed_connector[net_indices] > 0) & (num_layer_with_pins == 1) & (pin_layer[:, 0] == 0))
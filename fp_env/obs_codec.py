@@ -0,0 +1,83 @@
+"""
+Compact encoding of the observation of PlaceEnv, see PlaceEnv.set_compact_obs.
+    binary masks: bit-packed uint8, shape = (ceil(x_grid_num * y_grid_num / 8),)
+    canvas: uint8, number of blocks covering each cell
+    wiremask, wiremask_next, alignment_mask: 16-bit quantized with a per-sample scale in "<key>_scale", value = (q + 32768) * scale.
+        int16 is used because index_put is not implemented for uint16, which is required by the replay buffer.
+decode_obs is vectorized over the batch, and called at the beginning of Actor.forward and Critic.forward.
+"""
+import torch
+from tianshou.data import Batch
+from typing import Any, Dict, Tuple
+
+
+# dtype after decoding
+BINARY_MASK_KEYS = {
+    "position_mask": torch.float32,
+    "position_mask_loose": torch.float32,
+    "position_mask_next": torch.float32,
+    "boundary_mask": torch.float32,
+    "binary_alignment_mask": torch.int32,
+}
+QUANTIZED_KEYS = ("wiremask", "wiremask_next", "alignment_mask")
+
+_BITS = torch.tensor([128, 64, 32, 16, 8, 4, 2, 1], dtype=torch.uint8)
+_Q_MAX = 65535
+_Q_OFFSET = 32768
+
+
+def pack_mask(mask:torch.Tensor) -> torch.Tensor:
+    """binary mask with shape (X, Y) -> uint8 with shape (ceil(X*Y/8),), nonzero is 1."""
+    flat = (mask.flatten() != 0).to(torch.uint8)
+    flat = torch.nn.functional.pad(flat, (0, -len(flat) % 8))
+    return (flat.view(-1, 8) * _BITS.to(flat.device)).sum(dim=-1).to(torch.uint8)
+
+
+def unpack_mask(packed:torch.Tensor, shape:Tuple[int, int], dtype:torch.dtype) -> torch.Tensor:
+    """uint8 with shape (B, nbytes) -> mask with shape (B, X, Y)."""
+    bits = (packed.unsqueeze(-1) & _BITS.to(packed.device)) != 0 # [B, nbytes, 8]
+    return bits.flatten(start_dim=1)[:, :shape[0] * shape[1]].reshape(-1, *shape).to(dtype)
+
+
+def quantize(value:torch.Tensor) -> Tuple[torch.Tensor, float]:
+    """non-negative value -> (int16 q, scale)."""
+    max_value = float(value.max())
+    scale = max_value / _Q_MAX if max_value > 0 else 1.0
+    q = torch.round(value / scale).clamp_(0, _Q_MAX) - _Q_OFFSET
+    return q.to(torch.int16), scale
+
+
+def dequantize(q:torch.Tensor, scale:torch.Tensor) -> torch.Tensor:
+    """q with shape (B, X, Y), scale with shape (B,) -> float32 with shape (B, X, Y)."""
+    return (q.to(torch.float32) + _Q_OFFSET) * scale.to(torch.float32).view(-1, 1, 1)
+
+
+def encode_obs(obs:Dict[str, Any]) -> Dict[str, Any]:
+    """Encode the masks and canvas of an observation of PlaceEnv in place."""
+    for key in BINARY_MASK_KEYS:
+        if key in obs:
+            obs[key] = pack_mask(obs[key])
+    if "canvas" in obs:
+        obs["canvas"] = obs["canvas"].clamp(0, 255).to(torch.uint8)
+    for key in QUANTIZED_KEYS:
+        if key in obs:
+            obs[key], obs[key + "_scale"] = quantize(obs[key])
+    return obs
+
+
+def decode_obs(obs:Batch, device:torch.device) -> Batch:
+    """Decode a batch of observations encoded by encode_obs, on device. Other observations are returned as they are."""
+    if "canvas" not in obs.keys() or obs["canvas"].dtype != torch.uint8:
+        return obs
+
+    # do not modify the batch in the replay buffer
+    decoded = Batch({key: obs[key] for key in obs.keys()})
+    shape = tuple(obs["canvas"].shape[-2:])
+    decoded["canvas"] = obs["canvas"].to(device=device, dtype=torch.float32)
+    for key, dtype in BINARY_MASK_KEYS.items():
+        if key in obs.keys():
+            decoded[key] = unpack_mask(obs[key].to(device), shape, dtype)
+    for key in QUANTIZED_KEYS:
+        if key in obs.keys():
+            decoded[key] = dequantize(obs[key].to(device), torch.as_tensor(obs[key + "_scale"], device=device))
+    return decoded
@@ -0,0 +1,103 @@
+import numpy as np
+import torch
+import config
+from typing import Any, Dict, Tuple, Union
+from tianshou.data import Batch
+from .block import Block
+
+
+# nested keys are joined by SEP in the flat observation, e.g., graph_data.x
+SEP = "."
+# channels of obs["block"], -1 if there is no block to place, grid_x and grid_y are -1 if the block is not placed
+BLOCK_FEATURE_KEYS = ("idx", "movable_idx", "grid_x", "grid_y", "grid_z", "grid_w", "grid_h", "grid_area", "placed", "virtual")
+
+
+class ObsSchema:
+    """
+    Flat observation schema of PlaceEnv.
+    Each field is a numeric torch.Tensor (canvas and masks) or np.ndarray (the others) with a fixed shape and dtype, there is no python object:
+        nested dicts are flattened, e.g., graph_data.x, sequence_feature.packed, see unflatten_obs.
+        block is a vector of BLOCK_FEATURE_KEYS, last_placed_block is a vector of config.sequence_feature_keys.
+    fields[key] = (shape, dtype), the schema is inferred from the first observation of PlaceEnv and shared by its replicas.
+    VectorPlaceEnv preallocates the observation slots by empty(), Actor and Critic regroup the nested fields by unflatten_obs.
+    """
+    VERSION = 1
+
+    def __init__(self, fields:Dict[str, Tuple[Tuple[int, ...], Union[torch.dtype, np.dtype]]]):
+        self.fields = fields
+        self.version = self.VERSION
+        print("[INFO] Observation schema v{}: {} fields".format(self.version, len(self.fields)))
+
+
+    @classmethod
+    def from_obs(cls, obs:Dict[str, Any]) -> "ObsSchema":
+        """obs is flat, see flatten_obs."""
+        return cls({key: (tuple(value.shape), value.dtype) for key, value in obs.items()})
+
+
+    def empty(self, batch_size:int) -> Dict[str, Union[torch.Tensor, np.ndarray]]:
+        """zeros with shape (batch_size, *shape) of each field."""
+        return {
+            key: torch.zeros((batch_size, *shape), dtype=dtype) if isinstance(dtype, torch.dtype) else np.zeros((batch_size, *shape), dtype=dtype)
+            for key, (shape, dtype) in self.fields.items()
+        }
+
+
+    def check(self, obs:Dict[str, Any]):
+        assert obs.keys() == self.fields.keys(), "[Error] The keys {} of the observation are not the same as the schema {}.".format(sorted(obs.keys()), sorted(self.fields.keys()))
+        for key, (shape, dtype) in self.fields.items():
+            assert tuple(obs[key].shape) == shape and obs[key].dtype == dtype, \
+                "[Error] {} has shape {} and dtype {}, but {} and {} in the schema.".format(key, tuple(obs[key].shape), obs[key].dtype, shape, dtype)
+
+
+def block_feature(block:Block) -> np.ndarray:
+    if block is None:
+        return np.full(len(BLOCK_FEATURE_KEYS), -1, dtype=np.int64)
+    feature = np.array([getattr(block, key, -1) for key in BLOCK_FEATURE_KEYS], dtype=np.int64)
+    if not block.placed:
+        feature[[BLOCK_FEATURE_KEYS.index("grid_x"), BLOCK_FEATURE_KEYS.index("grid_y")]] = -1
+    return feature
+
+
+def _to_array(value:Any) -> Union[torch.Tensor, np.ndarray]:
+    if isinstance(value, torch.Tensor):
+        return value
+    if isinstance(value, (bool, np.bool_)):
+        return np.array(value, dtype=bool)
+    if isinstance(value, (int, np.integer)):
+        return np.array(value, dtype=np.int64)
+    if isinstance(value, (float, np.floating)):
+        return np.array(value, dtype=np.float64)
+    return np.array(value) # a copy, the getter may return the state of env
+
+
+def flatten_obs(obs:Dict[str, Any]) -> Dict[str, Union[torch.Tensor, np.ndarray]]:
+    """Flatten an observation of PlaceEnv, see ObsSchema."""
+    flat = {}
+    for key, value in obs.items():
+        if key == "block":
+            flat[key] = block_feature(value)
+        elif key == "last_placed_block":
+            flat[key] = np.array([value[k] for k in config.sequence_feature_keys], dtype=np.int64)
+        elif isinstance(value, dict):
+            for k, v in value.items():
+                flat[key + SEP + k] = _to_array(v)
+        else:
+            flat[key] = _to_array(value)
+    return flat
+
+
+def unflatten_obs(obs:Batch) -> Batch:
+    """Regroup the nested fields of a batch of flat observations, e.g., obs.graph_data.x. The arrays are not copied."""
+    if not any(SEP in key for key in obs.keys()):
+        return obs
+    nested = Batch()
+    for key in obs.keys():
+        if SEP in key:
+            group, k = key.split(SEP, 1)
+            if group not in nested.keys():
+                nested[group] = Batch()
+            nested[group][k] = obs[key]
+        else:
+            nested[key] = obs[key]
+    return nested
@@ -1,7 +1,12 @@
 from .block import Block
 from .terminal import Terminal
 from .fp_info import FPInfo
-from typing import Tuple, Dict, Any, Union, List
+from .mask_cache import MaskCache
+from .undo_log import UndoLog
+from .sequence_feature import SequenceFeature
+from .obs_codec import encode_obs
+from .obs_schema import ObsSchema, flatten_obs
+from typing import Tuple, Dict, Any, Union, List, Callable, Iterable
 import gymnasium as gym
 import numpy as np
 import torch
@@ -13,6 +18,7 @@ from matplotlib import pyplot as plt
 from collections import OrderedDict
 from tianshou.data import Batch
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 import os
 import pandas as pd
 plt.switch_backend('agg')
@@ -45,6 +51,29 @@ class RewardArgs:
 
 
 class PlaceEnv(gym.Env):
+    # always in observation, cheap and used for bookkeeping
+    BASE_OBS_KEYS = ("step", "layer_idx", "next_block_valid")
+    # constraint tiers of the action mask of actor, from the tightest to the loosest, a position satisfies a tier if all its masks are 0
+    CONSTRAINT_TIERS = (
+        ("position_mask", "binary_alignment_mask"), # all constraints
+        ("position_mask",), # no alignment
+        ("position_mask_loose",), # loose overlap
+        ("boundary_mask",), # boundary only
+    )
+    # the getters of these keys return views of the env state, build_obs copies them
+    LIVE_OBS_KEYS = ("canvas",)
+    # independent mask kernels of an observation, computed in the thread pool of set_mask_workers
+    MASK_OBS_KEYS = (
+        "wiremask", "position_mask", "position_mask_loose", "boundary_mask",
+        "wiremask_next", "position_mask_next", "alignment_mask", "binary_alignment_mask",
+    )
+    # do not change after the first reset, shared by replicas
+    SHARED_ATTRS = (
+        "empty_mask", "adj_mat_mov", "init_place_order", "init_num_block_without_placing_order",
+        "graph_x_init", "graph_y_init", "graph_z_init", "graph_w_init", "graph_h_init", "graph_area_init", "graph_placed_init", "graph_order_init",
+        "obs_schema", "mask_executor",
+    )
+
     def __init__(self, fp_info:FPInfo, 
                  overlap_ratio:float, along_boundary:bool, reward_args:RewardArgs, 
                  ratio_range:List[float], async_place:bool, 
@@ -78,6 +107,27 @@ class PlaceEnv(gym.Env):
         # print("need sequence feature: ", self.need_sequence_feature)
         self.empty_mask = torch.zeros((self.fp_info.x_grid_num, self.fp_info.y_grid_num)).to(device=self.return_device)
         self.need_alignment_mask = need_alignment_mask
+        # binary_alignment_mask is in the first constraint tier, see set_alignment_constraint
+        self.use_alignment_constraint = need_alignment_mask
+
+        # masks of the next next block are reused when it becomes the next block
+        self.mask_cache = MaskCache()
+        # boundary masks only depend on the block size, so they are kept across episodes
+        self.boundary_mask_cache = MaskCache(max_size=256)
+
+        # observation keys consumed by the model, None means all keys
+        self.obs_keys = None
+        # encode masks and canvas compactly, see set_compact_obs
+        self.compact_obs = False
+        # inferred from the first observation, see build_obs
+        self.obs_schema:ObsSchema = None
+        # thread pool of the mask kernels, see set_mask_workers
+        self.mask_executor:ThreadPoolExecutor = None
+
+        # enabled by snapshot(), see undo()
+        self.undo_log:UndoLog = None
+        # getters of the last observation, rebuilt after undo()
+        self._obs_getters:Dict[str, Callable[[], Any]] = None
 
         # define action space and observation space
         action_space = OrderedDict({"pos": gym.spaces.Discrete(fp_info.x_grid_num * fp_info.y_grid_num)})
@@ -101,10 +151,34 @@ class PlaceEnv(gym.Env):
         assert reward_args is not None, "[Error] reward_args is None."
 
     
+    def __deepcopy__(self, memo:dict) -> "PlaceEnv":
+        """A replica shares the design template and the SHARED_ATTRS, the mask cache and the undo log are not copied."""
+        new = self.__class__.__new__(self.__class__)
+        memo[id(self)] = new
+        # fp_info first, so that the shared objects of its template are registered in memo
+        new.__dict__["fp_info"] = deepcopy(self.fp_info, memo)
+        for key, value in self.__dict__.items():
+            if key == "fp_info":
+                continue
+            elif key in self.SHARED_ATTRS:
+                new.__dict__[key] = value
+            elif key in ("mask_cache", "boundary_mask_cache"):
+                new.__dict__[key] = MaskCache(value.max_size)
+            elif key in ("undo_log", "_obs_getters"):
+                # the getters are bound to self
+                new.__dict__[key] = None
+            else:
+                new.__dict__[key] = deepcopy(value, memo)
+        return new
+
+
     def reset(self) -> Tuple[Dict, Dict]:
         # need to reset fp_info, blks and nets
         # print("reset fp_info starts")
         self.fp_info.reset()
+        self.mask_cache.clear()
+        if self.undo_log is not None:
+            self.undo_log.reset()
         # print("reset fp_info ends")
         
         # placing order
@@ -158,66 +232,79 @@ class PlaceEnv(gym.Env):
             "z": -1,
         }
 
-        if self.need_alignment_mask:
-            alignment_mask, binary_alignment_mask = self.get_alignment_mask(next_block, self.device)
-
-
+        # each value is a getter, only the keys in self.obs_keys are computed
         state = {
-            "step": self.fp_info.placed_movable_block_num,
-            "num_net": self.fp_info.net_num,
-            "layer_idx": next_block.grid_z,
-            "next_block_valid": 1,
-            "ready_layers": self.get_ready_layers(),
-            "num_blk_without_placing_order": self.num_block_without_placing_order.copy(),
-            "last_placed_block": self.last_placed_block,
+            "step": lambda: self.fp_info.placed_movable_block_num,
+            "num_net": lambda: self.fp_info.net_num,
+            "layer_idx": lambda: next_block.grid_z,
+            "next_block_valid": lambda: 1,
+            "ready_layers": lambda: self.get_ready_layers(),
+            "num_blk_without_placing_order": lambda: self.num_block_without_placing_order.copy(),
+            "last_placed_block": lambda: self.last_placed_block,
 
-            "canvas": self.fp_info.canvas.to(device=self.return_device).clone(),
-            "block": next_block,
+            "canvas": lambda: self.fp_info.canvas.to(device=self.return_device),
+            "block": lambda: next_block,
 
             # mask
-            "wiremask": self.get_wiremask(next_block, self.device).to(device=self.return_device),
-            "position_mask": self.get_position_mask(next_block, 0, self.along_boundary, device=self.device).to(device=self.return_device),
-            "position_mask_loose": self.get_position_mask(next_block, 0, False, self.overlap_ratio, device=self.device).to(device=self.return_device),
-            "boundary_mask": self.get_boundary_mask(next_block, device=self.device).to(device=self.return_device),
+            "wiremask": lambda: self.get_wiremask(next_block, self.device).to(device=self.return_device),
+            "position_mask": lambda: self.get_position_mask(next_block, 0, self.along_boundary, device=self.device).to(device=self.return_device),
+            "position_mask_loose": lambda: self.get_position_mask(next_block, 0, False, self.overlap_ratio, device=self.device).to(device=self.return_device),
+            "boundary_mask": lambda: self.get_boundary_mask(next_block, device=self.device).to(device=self.return_device),
 
-            "wiremask_next": self.get_wiremask(next_next_block, self.device).to(device=self.return_device) if next_next_block is not None else self.empty_mask.clone(),
-            "position_mask_next": self.get_position_mask(next_next_block, 0, self.along_boundary, device=self.device).to(device=self.return_device) if next_next_block is not None else self.empty_mask.clone(),
-            "grid_area_next": next_next_block.grid_area / self.get_mean_grid_area() if next_next_block is not None else 0
+            "wiremask_next": lambda: self.get_wiremask(next_next_block, self.device).to(device=self.return_device) if next_next_block is not None else self.empty_mask.clone(),
+            "position_mask_next": lambda: self.get_position_mask(next_next_block, 0, self.along_boundary, device=self.device).to(device=self.return_device) if next_next_block is not None else self.empty_mask.clone(),
+            "grid_area_next": lambda: next_next_block.grid_area / self.get_mean_grid_area() if next_next_block is not None else 0.0
 
         }
 
         # alignment mask
-        # print("need_alignement: ", self.need_alignment_mask)
-        # print("input_layer_sequence: ", self.input_layer_sequence)
-        # print("need_sequence_feature: ", self.need_sequence_feature)
-        # print("graph: ", self.graph)
-
         if self.need_alignment_mask:
-            state["alignment_mask"] = alignment_mask.to(device=self.return_device)
-            state["binary_alignment_mask"] = binary_alignment_mask.to(device=self.return_device)
+            state["alignment_mask"] = lambda: self.get_alignment_mask(next_block, self.device)[0].to(device=self.return_device)
+            state["binary_alignment_mask"] = lambda: self.get_alignment_mask(next_block, self.device)[1].to(device=self.return_device)
     
 
         # input_layer_sequence
         if self.input_layer_sequence:
-            state["layer_sequence"] = self.layer_sequence
-            state["layer_sequence_mask"] = self.layer_sequence_mask
-            state["layer_sequence_len"] = self.layer_sequence_len
+            state["layer_sequence"] = lambda: self.layer_sequence
+            state["layer_sequence_mask"] = lambda: self.layer_sequence_mask
+            state["layer_sequence_len"] = lambda: self.layer_sequence_len
         
         # sequence feature
         if self.need_sequence_feature:
-            state["sequence_feature"] = self.get_sequence_feature()
+            state["sequence_feature"] = lambda: self.get_sequence_feature()
         
         # graph data
         if self.graph:
-            state["graph_data"] = self.get_graph_data()
-            state["graph_data"]["idx"] = torch.tensor(next_block.movable_idx)
+            state["graph_data"] = lambda: self.get_graph_data(next_block)
 
+        self._obs_getters = state
+        state = self.build_obs(state)
         return state, {}
 
 
     
-    def step(self, action: Union[OrderedDict,Batch]) -> Tuple[Any, float, bool, bool, Dict[str, Any]]:
-        """state, reward, terminated, truncated, info"""
+    def step(self, action: Union[OrderedDict,Batch], build_obs:bool=True) -> Tuple[Any, float, bool, bool, Dict[str, Any]]:
+        """
+        state, reward, terminated, truncated, info
+        If build_obs is False, state is None, e.g., the caller replays the actions of an episode and calls get_obs() at the end.
+        """
+        curr_blk, x, y = self.pop_block(action)
+
+        # place block
+        self.place_a_block(curr_blk, x, y)
+
+        obs_next, reward, terminated, truncated, info = self.after_place(action, curr_blk, x, y)
+        obs_next = self.build_obs(obs_next) if build_obs else None
+        return obs_next, reward, terminated, truncated, info
+
+
+    def get_obs(self) -> Dict[str, Any]:
+        """The observation of the current state, the same as the one returned by the last step() or reset()."""
+        return self.build_obs(self._obs_getters)
+
+
+    def pop_block(self, action: Union[OrderedDict,Batch]) -> Tuple[Block, int, int]:
+        """Decode the position in action, pop the block to place, which is determined in last step."""
         # coordinates
         pos = action["pos"]   # the position of the action
         # print("pos: ", pos)
@@ -230,25 +317,23 @@ class PlaceEnv(gym.Env):
         # print("x: ", x, ",y: ", y)
         # print("y_grid_num: ", self.fp_info.y_grid_num)
 
-        # block ratio (the ratio for the next blocks)
-        if self.ratio_range is not None:
-            # next_block_ratio
-            next_block_ratio = action["ratio"] if self.ratio_range is not None else None # next_block_ratio
-            # print("ratio_range min: ", self.ratio_range[0], ", max: ", self.ratio_range[1])
-            # print("ratio: ", next_block_ratio)
-            # print("ratio_range high: ", self.ratio_range[1], ", low: ", self.ratio_range[0])
-            # next_block_ratio is in range [-1,1], use linear transformation to [low, high]
-            next_block_ratio = (next_block_ratio + 1) / 2 * (self.ratio_range[1] - self.ratio_range[0]) + self.ratio_range[0]
-            # clip the ratio into a range
-            # Should consider if the block is hard Macro
-            next_block_ratio = np.clip(next_block_ratio, self.ratio_range[0], self.ratio_range[1])
-
         # get block and pop, which is determined in last step
         # print("layer_curr_blk: ", self.layer_curr_blk)
         # current block in the layer
         # print("self.layer_curr_blk: ", self.layer_curr_blk)
 
         # print("self.layer_curr_blk: ", self.layer_curr_blk, "self.layer_dst_blk: ", self.layerdst_curr_blk, ", 0: ", self.num_block_without_placing_order[0], ", 1: ", self.num_block_without_placing_order[1])
+        if self.undo_log is not None:
+            self.undo_log.new_entry(
+                obs_getters=self._obs_getters,
+                layer_curr_blk=self.layer_curr_blk,
+                pop_layer=self.layer_curr_blk if self.async_place else None,
+                num_block_without_placing_order=self.num_block_without_placing_order.copy(),
+                last_placed_block=dict(self.last_placed_block),
+                last_metrics=dict(self.last_metrics),
+                placed_movable_block_num=self.fp_info.placed_movable_block_num,
+            )
+
         # curr_blk_idx
         curr_blk_mov_idx = self.get_next_block_movable_idx(self.layer_curr_blk, pop=True)
         # print("self.layer_curr_blk now: ", self.layer_curr_blk, ", curr_blk_mov_idx: ", curr_blk_mov_idx, ", num 1: ", self.num_block_without_placing_order[0], ", num 2: ", self.num_block_without_placing_order[1])
@@ -271,8 +356,26 @@ class PlaceEnv(gym.Env):
         # curr_blk.set_z(self.layerdst_curr_blk)
         # print("curr_blk z: ", curr_blk.grid_z, "self.layerdst_curr_blk: ", self.layerdst_curr_blk, "self.layer_curr_blk: ", self.layer_curr_blk)
 
-        # place block
-        self.place_a_block(curr_blk, x, y)
+        return curr_blk, x, y
+
+
+    def after_place(self, action: Union[OrderedDict,Batch], curr_blk:Block, x:int, y:int) -> Tuple[Dict[str, Callable[[], Any]], float, bool, bool, Dict[str, Any]]:
+        """
+        After curr_blk is placed, select the next block and calculate reward.
+        Return the getters of obs_next (see build_obs), reward, terminated, truncated, info.
+        """
+        # block ratio (the ratio for the next blocks)
+        if self.ratio_range is not None:
+            # next_block_ratio
+            next_block_ratio = action["ratio"] if self.ratio_range is not None else None # next_block_ratio
+            # print("ratio_range min: ", self.ratio_range[0], ", max: ", self.ratio_range[1])
+            # print("ratio: ", next_block_ratio)
+            # print("ratio_range high: ", self.ratio_range[1], ", low: ", self.ratio_range[0])
+            # next_block_ratio is in range [-1,1], use linear transformation to [low, high]
+            next_block_ratio = (next_block_ratio + 1) / 2 * (self.ratio_range[1] - self.ratio_range[0]) + self.ratio_range[0]
+            # clip the ratio into a range
+            # Should consider if the block is hard Macro
+            next_block_ratio = np.clip(next_block_ratio, self.ratio_range[0], self.ratio_range[1])
 
         # done (if all the blocks are placed terminated)
         terminated = self.fp_info.is_all_placed()
@@ -352,11 +455,13 @@ class PlaceEnv(gym.Env):
         # else:
         #     self.layerdst_curr_blk = None
 
+        if self.undo_log is not None and next_block is not None:
+            self._record_next_block(next_block)
+
         # layer
         # next_block is placed on the layerdst_curr_blk
         if self.async_place and next_block is not None:
-            for net in next_block.connected_nets:
-                net.add_layer_num_pin(self.layer_curr_blk)
+            self.fp_info.add_layer_num_pin(next_block, self.layer_curr_blk)
         
         if next_block is not None:
             # update block ratio
@@ -414,67 +519,60 @@ class PlaceEnv(gym.Env):
         # next_next_block
         next_next_block = self.fp_info.get_block_by_movable_idx(next_next_block_moveable_idx) if next_next_block_moveable_idx is not None else None
 
-        # self.need_alignment_mask = False
-        # print("self.need_alignment_mask: ", self.need_alignment_mask)
-        if next_block is not None:
-            if self.need_alignment_mask:
-                alignment_mask, binary_alignment_mask = self.get_alignment_mask(next_block, self.device)
-        else:
-            if self.need_alignment_mask:
-                alignment_mask = self.empty_mask.clone()
-                binary_alignment_mask = self.empty_mask.clone().to(dtype=torch.int32)
-
-        # print("next block layer:", next_block.grid_z, ", action_z: ", action["layer"], ", self.layer_curr_blk: ", self.layer_curr_blk, ", 0: ", self.num_block_without_placing_order[0], ", 1: ", self.num_block_without_placing_order[1])
-        
-        # obs_next calculation
+        # obs_next calculation, each value is a getter, only the keys in self.obs_keys are computed
         obs_next = {
-            "step": self.fp_info.placed_movable_block_num,
-            "num_net": self.fp_info.net_num,
+            "step": lambda: self.fp_info.placed_movable_block_num,
+            "num_net": lambda: self.fp_info.net_num,
             # layer
-            "layer_idx": next_block.grid_z if next_block is not None else 0,
+            "layer_idx": lambda: next_block.grid_z if next_block is not None else 0,
             # "layer_idx": self.layerdst_curr_blk if next_block is not None else 0,
-            "next_block_valid": 1 if next_block is not None else 0,
-            "ready_layers": self.get_ready_layers(),
-            "num_blk_without_placing_order": self.num_block_without_placing_order.copy(),
-            "last_placed_block": self.last_placed_block,
+            "next_block_valid": lambda: 1 if next_block is not None else 0,
+            "ready_layers": lambda: self.get_ready_layers(),
+            "num_blk_without_placing_order": lambda: self.num_block_without_placing_order.copy(),
+            "last_placed_block": lambda: self.last_placed_block,
             
-            "canvas": self.fp_info.canvas.to(device=self.return_device).clone(),
-            "block": next_block,
+            "canvas": lambda: self.fp_info.canvas.to(device=self.return_device),
+            "block": lambda: next_block,
 
             # mask
-            "wiremask": self.get_wiremask(next_block, self.device).to(device=self.return_device) if next_block is not None else self.empty_mask.clone(),
+            "wiremask": lambda: self.get_wiremask(next_block, self.device).to(device=self.return_device) if next_block is not None else self.empty_mask.clone(),
             # "position_mask": self.get_position_mask(next_block,  int(self.layerdst_curr_blk), 1, self.along_boundary, device=self.device).to(device=self.return_device) if next_block is not None else self.empty_mask.clone(),
             # "position_mask_loose": self.get_position_mask(next_block,  int(self.layerdst_curr_blk), False, self.overlap_ratio, device=self.device).to(device=self.return_device) if next_block is not None else self.empty_mask.clone(),
-            "position_mask": self.get_position_mask(next_block,  int(self.layer_curr_blk), 1, self.along_boundary, device=self.device).to(device=self.return_device) if next_block is not None else self.empty_mask.clone(),
-            "position_mask_loose": self.get_position_mask(next_block,  int(self.layer_curr_blk), False, self.overlap_ratio, device=self.device).to(device=self.return_device) if next_block is not None else self.empty_mask.clone(),
-            "boundary_mask": self.get_boundary_mask(next_block, self.device).to(device=self.return_device) if next_block is not None else self.empty_mask.clone(),
+            "position_mask": lambda: self.get_position_mask(next_block,  int(self.layer_curr_blk), 1, self.along_boundary, device=self.device).to(device=self.return_device) if next_block is not None else self.empty_mask.clone(),
+            "position_mask_loose": lambda: self.get_position_mask(next_block,  int(self.layer_curr_blk), False, self.overlap_ratio, device=self.device).to(device=self.return_device) if next_block is not None else self.empty_mask.clone(),
+            "boundary_mask": lambda: self.get_boundary_mask(next_block, self.device).to(device=self.return_device) if next_block is not None else self.empty_mask.clone(),
 
-            "wiremask_next": self.get_wiremask(next_next_block, self.device).to(device=self.return_device) if next_next_block is not None else self.empty_mask.clone(),
+            "wiremask_next": lambda: self.get_wiremask(next_next_block, self.device).to(device=self.return_device) if next_next_block is not None else self.empty_mask.clone(),
             # "position_mask_next": self.get_position_mask(next_next_block,  int(self.layerdst_curr_blk), 2, self.along_boundary, device=self.device).to(device=self.return_device) if next_next_block is not None else self.empty_mask.clone(),
-            "position_mask_next": self.get_position_mask(next_next_block,  int(self.layer_curr_blk), 2, self.along_boundary, device=self.device).to(device=self.return_device) if next_next_block is not None else self.empty_mask.clone(),
-            "grid_area_next": next_next_block.grid_area / self.get_mean_grid_area() if next_next_block is not None else 0,
+            "position_mask_next": lambda: self.get_position_mask(next_next_block,  int(self.layer_curr_blk), 2, self.along_boundary, device=self.device).to(device=self.return_device) if next_next_block is not None else self.empty_mask.clone(),
+            "grid_area_next": lambda: next_next_block.grid_area / self.get_mean_grid_area() if next_next_block is not None else 0.0,
         }
 
         # alignment mask
         if self.need_alignment_mask:
-            obs_next["alignment_mask"] = alignment_mask.to(device=self.return_device)
-            obs_next["binary_alignment_mask"] = binary_alignment_mask.to(device=self.return_device)
+            if next_block is not None:
+                obs_next["alignment_mask"] = lambda: self.get_alignment_mask(next_block, self.device)[0].to(device=self.return_device)
+                obs_next["binary_alignment_mask"] = lambda: self.get_alignment_mask(next_block, self.device)[1].to(device=self.return_device)
+            else:
+                obs_next["alignment_mask"] = lambda: self.empty_mask.clone().to(device=self.return_device)
+                obs_next["binary_alignment_mask"] = lambda: self.empty_mask.clone().to(dtype=torch.int32).to(device=self.return_device)
 
 
         # input_layer_sequence
         if self.input_layer_sequence:
-            obs_next["layer_sequence"] = self.layer_sequence
-            obs_next["layer_sequence_mask"] = self.layer_sequence_mask
-            obs_next["layer_sequence_len"] = self.layer_sequence_len
+            obs_next["layer_sequence"] = lambda: self.layer_sequence
+            obs_next["layer_sequence_mask"] = lambda: self.layer_sequence_mask
+            obs_next["layer_sequence_len"] = lambda: self.layer_sequence_len
         
         # sequence feature
         if self.need_sequence_feature:
-            obs_next["sequence_feature"] = self.get_sequence_feature()
+            obs_next["sequence_feature"] = lambda: self.get_sequence_feature()
         
         # graph data
         if self.graph:
-            obs_next["graph_data"] = self.get_graph_data()
-            obs_next["graph_data"]["idx"] = torch.tensor(next_block.movable_idx) if next_block is not None else torch.tensor(-1)
+            obs_next["graph_data"] = lambda: self.get_graph_data(next_block)
+
+        self._obs_getters = obs_next
 
         # print("source layer: ", self.layer_curr_blk, "dst layer grid_z: ", curr_blk.grid_z, ", z: ", curr_blk.z)
 
@@ -506,9 +604,14 @@ class PlaceEnv(gym.Env):
             s = n_preplaced
             e = n_preplaced + n_movable
 
-            self.adj_mat_mov = self.fp_info.adjacency_matrix[s:e,s:e].clone().to(self.return_device)
-            # set diagonal to 1
-            self.adj_mat_mov[torch.eye(n_movable, dtype=bool)] = 1
+            adj_mat_mov = self.fp_info.get_adjacency_submatrix(s, e)
+            # set diagonal to 1, adj_mat_mov is sparse
+            indices, values = adj_mat_mov.indices(), adj_mat_mov.values()
+            off_diagonal = indices[0] != indices[1]
+            diagonal = torch.arange(n_movable).expand(2, -1)
+            self.adj_mat_mov = torch.sparse_coo_tensor(torch.cat([indices[:, off_diagonal], diagonal], dim=1),
+                                                       torch.cat([values[off_diagonal], torch.ones(n_movable, dtype=values.dtype)]),
+                                                       adj_mat_mov.shape, check_invariants=False).coalesce().to(self.return_device)
             
             # node data
             # self.graph_x_init = torch.zeros(n_movable)
@@ -577,25 +680,135 @@ class PlaceEnv(gym.Env):
         self.graph_placed[i] = block.placed
     
 
-    def get_graph_data(self) -> Dict[str, torch.Tensor]:
+    def set_obs_keys(self, obs_keys:Iterable[str]=None):
         """
-        Node feature of netlist graph.
+        Only compute the observation keys consumed by the model, e.g., actor.obs_keys() | critic.obs_keys().
+        None means all keys are computed.
         """
-        graph_data = deepcopy(OrderedDict({
-            "adj_mat_mov": self.adj_mat_mov,
-            "x": self.graph_x,
-            "y": self.graph_y,
-            "z": self.graph_z,
-            "w": self.graph_w,
-            "h": self.graph_h,
-            "area": self.graph_area,
-            "placed": self.graph_placed,
-        }))
-        if not self.async_place:
-            graph_data["order"] = self.graph_order
+        self.obs_keys = None if obs_keys is None else set(obs_keys) | set(self.BASE_OBS_KEYS)
+        self.obs_schema = None
+        print("[INFO] obs_keys: {}".format(sorted(self.obs_keys) if self.obs_keys is not None else "all"))
+
+
+    def set_compact_obs(self, compact_obs:bool):
+        """
+        If True, binary masks are bit-packed, canvas is uint8, wiremask and alignment mask are 16-bit quantized,
+        see fp_env.obs_codec. Actor and Critic decode them.
+        """
+        self.compact_obs = bool(compact_obs)
+        self.obs_schema = None
+        print("[INFO] compact_obs: {}".format(self.compact_obs))
+
+
+    def set_alignment_constraint(self, use_alignment_constraint:bool):
+        """If False, binary_alignment_mask is dropped from the first constraint tier, see get_constraint_tier."""
+        assert not use_alignment_constraint or self.need_alignment_mask, "[Error] The alignment constraint requires need_alignment_mask."
+        self.use_alignment_constraint = bool(use_alignment_constraint)
+        print("[INFO] use_alignment_constraint: {}".format(self.use_alignment_constraint))
+
+
+    def set_mask_workers(self, num_workers:int):
+        """
+        Compute the masks of MASK_OBS_KEYS in an observation by a thread pool of num_workers threads, 0 or 1 means serial.
+        The heavy tensor ops release the GIL. The intra-op threads of torch are divided among the workers to avoid oversubscription.
+        The thread pool is shared by the replicas, which build their observations one by one.
+        """
+        if self.mask_executor is not None:
+            self.mask_executor.shutdown()
+            self.mask_executor = None
+        if num_workers > 1:
+            self.mask_executor = ThreadPoolExecutor(num_workers, thread_name_prefix="mask")
+            torch.set_num_threads(max(1, os.cpu_count() // num_workers))
+        print("[INFO] mask_workers: {}, torch threads: {}".format(num_workers, torch.get_num_threads()))
+
+
+    def build_obs(self, getters:Dict[str, Callable[[], Any]], out:Dict[str, torch.Tensor]=None) -> Dict[str, Any]:
+        """
+        Call the getters of the keys in self.obs_keys, the masks are computed in parallel if mask_executor is set.
+        constraint_tier and min_tier are computed from the masks of CONSTRAINT_TIERS, see get_constraint_tier.
+        The observation is flat, see fp_env.obs_schema.ObsSchema.
+        out: preallocated arrays of all fields, e.g., the observation slots of VectorPlaceEnv.
+        Each field is written into out[key], which is returned instead of a new array.
+        """
+        keys = [key for key in getters if self.obs_keys is None or key in self.obs_keys]
+        if self.mask_executor is None:
+            obs = {key: getters[key]() for key in keys}
+        else:
+            # the other getters are called while the masks are computed
+            futures = {key: self.mask_executor.submit(getters[key]) for key in keys if key in self.MASK_OBS_KEYS}
+            obs = {key: futures[key].result() if key in futures else getters[key]() for key in keys}
+        if self.obs_keys is None or "constraint_tier" in self.obs_keys or "min_tier" in self.obs_keys:
+            obs["constraint_tier"], obs["min_tier"] = self.get_constraint_tier(getters, obs)
+        live = {key: obs[key] for key in self.LIVE_OBS_KEYS if key in obs}
+        if self.compact_obs:
+            obs = encode_obs(obs)
+        obs = flatten_obs(obs)
+        if self.obs_schema is None:
+            self.obs_schema = ObsSchema.from_obs(obs)
+
+        for key, value in obs.items():
+            if out is not None:
+                assert key in out and tuple(value.shape) == tuple(out[key].shape) and value.dtype == out[key].dtype, \
+                    "[Error] {} with shape {} and dtype {} does not match the observation schema.".format(key, tuple(value.shape), value.dtype)
+                if isinstance(value, torch.Tensor):
+                    out[key].copy_(value)
+                else:
+                    out[key][...] = value
+                obs[key] = out[key]
+            elif key in live and value is live[key]:
+                obs[key] = value.clone()
+        return obs
+
+
+    def get_constraint_tier(self, getters:Dict[str, Callable[[], Any]], obs:Dict[str, Any]) -> Tuple[torch.Tensor, int]:
+        """
+        constraint_tier: int8 with shape (x_grid_num, y_grid_num), the tightest tier of CONSTRAINT_TIERS satisfied at each position.
+        min_tier: the tightest tier satisfied at any position, actor samples the positions with constraint_tier <= min_tier.
+        The tiers after min_tier are not computed, so the positions which do not satisfy min_tier are len(CONSTRAINT_TIERS).
+        If no tier is satisfied, min_tier = len(CONSTRAINT_TIERS) and all positions are sampled.
+        The masks already in obs are reused.
+        """
+        num_tier = len(self.CONSTRAINT_TIERS)
+        for tier, keys in enumerate(self.CONSTRAINT_TIERS):
+            if not self.use_alignment_constraint:
+                keys = tuple(key for key in keys if key != "binary_alignment_mask")
+            satisfied = sum(obs[key] if key in obs else getters[key]() for key in keys) == 0
+            if satisfied.any():
+                return torch.where(satisfied, tier, num_tier).to(torch.int8), tier
+        return torch.full_like(satisfied, num_tier, dtype=torch.int8), num_tier
+
+
+    def get_graph_data(self, block:Block=None) -> Dict[str, torch.Tensor]:
+        """
+        Node feature of netlist graph, which changes in each step.
+        idx is the movable_idx of the block to place, -1 if block is None.
+        The adjacency matrix and order are not included, see get_static_graph_data.
+        """
+        graph_data = OrderedDict({
+            "x": self.graph_x.copy(),
+            "y": self.graph_y.copy(),
+            "z": self.graph_z.copy(),
+            "w": self.graph_w.copy(),
+            "h": self.graph_h.copy(),
+            "area": self.graph_area.copy(),
+            "placed": self.graph_placed.copy(),
+        })
+        graph_data["idx"] = torch.tensor(block.movable_idx) if block is not None else torch.tensor(-1)
         return graph_data
 
 
+    def get_static_graph_data(self) -> Dict[str, torch.Tensor]:
+        """
+        Graph data that does not change in an episode, available after reset().
+        adj_mat_mov: sparse COO [N_movable, N_movable] with unit diagonal, order: [N_movable], only in sync place.
+        It is registered once with the model (SharedEncoder.set_static_graph_data) instead of stored in each observation.
+        """
+        static_graph_data = {"adj_mat_mov": self.adj_mat_mov}
+        if not self.async_place:
+            static_graph_data["order"] = torch.from_numpy(self.graph_order)
+        return static_graph_data
+
+
     def set_hpwl_norm_coef(self, hpwl_norm_coef:float) -> None:
         print(f"[INFO] Set hpwl_norm_coef to {hpwl_norm_coef}.")
         self._hpwl_norm_coef = hpwl_norm_coef
@@ -714,9 +927,7 @@ class PlaceEnv(gym.Env):
 
     def reset_sequence_feature(self):
         """sequence_feature: [num_die, C]"""
-        if not hasattr(self, "init_seq_feat"):
-            self.init_seq_feat = True
-
+        if not hasattr(self, "sequence_feature"):
             # order of each die
             if self.async_place:
                 max_len = max(map(len, self.place_order))
@@ -732,73 +943,27 @@ class PlaceEnv(gym.Env):
                 max_len = max(map(len, sequence_each_die))
                 for die in range(self.fp_info.num_layer):
                     sequence_each_die[die] += [-1] * (max_len - len(sequence_each_die[die]))
-            self.init_sequence_each_die = np.array(sequence_each_die) # [num_layer, max_len]
-
-            # weight, height, area, placed
-            self.init_width = np.full_like(self.init_sequence_each_die, -1)
-            self.init_height = np.full_like(self.init_sequence_each_die, -1)
-            self.init_area = np.full_like(self.init_sequence_each_die, -1)
-            self.init_placed = np.full_like(self.init_sequence_each_die, -1)
-            self.init_x = np.full_like(self.init_sequence_each_die, -1)
-            self.init_y = np.full_like(self.init_sequence_each_die, -1)
-            self.init_z = np.full_like(self.init_sequence_each_die, -1)
-
-            for i in range(self.fp_info.num_layer):
-                for j in range(len(self.init_sequence_each_die[i])):
-                    if self.init_sequence_each_die[i][j] == -1: # not a valid block
-                        continue
-                    block = self.fp_info.get_block_by_movable_idx(self.init_sequence_each_die[i][j])
-                    self.init_width[i,j] = block.grid_w
-                    self.init_height[i,j] = block.grid_h
-                    self.init_area[i,j] = block.grid_area
-                    self.init_placed[i,j] = block.placed
-                    self.init_x[i,j] = -1
-                    self.init_y[i,j] = -1
-                    self.init_z[i,j] = block.grid_z
+            self.sequence_feature = SequenceFeature(np.array(sequence_each_die), self.fp_info) # [num_layer, max_len, C]
 
         # reset
-        self.sequence_each_die = self.init_sequence_each_die.copy()
-        self.width = self.init_width.copy()
-        self.height = self.init_height.copy()
-        self.area = self.init_area.copy()
-        self.placed = self.init_placed.copy()
-        self.x = self.init_x.copy()
-        self.y = self.init_y.copy()
-        self.z = self.init_z.copy()
+        self.sequence_feature.reset()
     
 
     def update_sequence_feature(self, block:Block):
-        # update width, height, area, placed
-        i,j = np.where(self.sequence_each_die == block.movable_idx)
-
-        self.width[i,j] = block.grid_w
-        self.height[i,j] = block.grid_h
-        self.area[i,j] = block.grid_area
-        self.placed[i,j] = block.placed
-        self.x[i,j] = block.grid_x
-        self.y[i,j] = block.grid_y
-        self.z[i,j] = block.grid_z
+        # update width, height, area, placed, x, y, z
+        self.sequence_feature.update(block)
 
 
     def get_sequence_feature(self) -> Dict[str, np.ndarray]:
         """
-        Return a dict with keys: sequence, width, height, area, placed, x, y, z. 
-        Each feature is a numpy array with shape (num_layer, max_len).
-        sequence: the place order of each die.
+        Return a dict with keys:
+            packed: numpy array with shape (num_layer, max_len, C), channels are config.sequence_feature_keys, i.e., area, height, placed, sequence, width, x, y, z.
+            last_placed_block: numpy array with shape (C,).
+        The sequence channel is the place order of each die.
         """
-        return deepcopy(OrderedDict({
-            "sequence": self.sequence_each_die,
-            "width": self.width,
-            "height": self.height,
-            "area": self.area,
-            "placed": self.placed,
-            "x": self.x,
-            "y": self.y,
-            "z": self.z,
-
-            "last_placed_block": self.last_placed_block,
-        }))
+        return self.sequence_feature.get(self.last_placed_block)
     
+
     def get_place_order_detailed_information(self) -> pd.DataFrame:
         """
         Detailed information for movable blocks.
@@ -967,19 +1132,43 @@ class PlaceEnv(gym.Env):
 
 
 
+    def get_next_blocks(self) -> Tuple[Block, Block]:
+        """next block and next next block in the next observation, None if not available."""
+        next_block_moveable_idx = self.get_next_block_movable_idx(self.layer_curr_blk)
+        if next_block_moveable_idx is None:
+            return None, None
+        next_next_block_moveable_idx = self.get_next_next_block_movable_idx(self.layer_curr_blk)
+        next_block = self.fp_info.get_block_by_movable_idx(next_block_moveable_idx)
+        next_next_block = self.fp_info.get_block_by_movable_idx(next_next_block_moveable_idx) if next_next_block_moveable_idx is not None else None
+        return next_block, next_next_block
+
+
     def place_a_block(self, block:Block, x:int, y:int):
+        self.set_block_position(block, x, y)
+
+        # update net range
+        self.fp_info.net_array.update(block)
+
+        # update canvas
+        self.fp_info.update_canvas(block)
+
+        self.update_placed_block(block)
+
+
+    def set_block_position(self, block:Block, x:int, y:int):
         assert not block.placed, "Block {} has been placed.".format(block.idx)
+        if self.undo_log is not None:
+            self._record_block(block)
 
         # place block
         block.place(x, y, self.fp_info.grid_width, self.fp_info.grid_height)
         self.fp_info.placed_movable_block_num += 1
 
-        # update net range
-        for net in block.connected_nets:
-            net.update(block)
 
-        # update canvas
-        self.fp_info.update_canvas(block)
+    def update_placed_block(self, block:Block):
+        """After the net range and canvas are updated, update metrics and features of the placed block."""
+        # update reward metrics
+        self.fp_info.metrics_tracker.add_block(block)
 
         # update sequence feature
         # print("need_sequence_feature: ", self.need_sequence_feature)
@@ -1002,21 +1191,116 @@ class PlaceEnv(gym.Env):
             "z": block.grid_z,
         })
 
+    def snapshot(self) -> Tuple[int, int]:
+        """
+        Return a token of the current state for restore().
+        The steps after the first snapshot of an episode are logged, so restore() costs O(steps since the token) instead of deepcopy(env).
+        """
+        if self.undo_log is None:
+            self.undo_log = UndoLog()
+        return self.undo_log.snapshot()
+
+
+    def restore(self, token:Tuple[int, int]) -> Dict[str, Any]:
+        """Undo the steps after token, return the observation of that state."""
+        assert self.undo_log is not None, "[Error] restore() is called before snapshot()."
+        return self.undo(self.undo_log.steps_since(token))
+
+
+    def undo(self, n:int=1, build_obs:bool=True) -> Dict[str, Any]:
+        """
+        Undo the last n logged steps, return the observation of the state before them, the same as the one returned by step() or reset().
+        If build_obs is False, return None, e.g., the caller keeps the observation.
+        """
+        assert self.undo_log is not None, "[Error] undo() is called before snapshot()."
+        assert 0 <= n <= len(self.undo_log), "[Error] Undo {} steps, but only {} steps are logged.".format(n, len(self.undo_log))
+        for _ in range(n):
+            self._undo_step(self.undo_log.pop())
+        return self.build_obs(self._obs_getters) if build_obs else None
+
+
+    def _record_block(self, block:Block):
+        """Log the state overwritten by placing block, before set_block_position."""
+        entry = self.undo_log.last
+        net_indices = np.unique(self.fp_info.net_array.get_net_indices(block))
+        entry["block"] = (block, block.get_state())
+        entry["nets"] = self.fp_info.net_array.save(net_indices)
+        entry["metrics"] = self.fp_info.metrics_tracker.save(net_indices, [block.idx] + list(block.partner_indices))
+        if self.need_sequence_feature:
+            entry["sequence_feature"] = self.sequence_feature.save(block)
+        if self.graph:
+            i = block.movable_idx
+            entry["graph_data"] = (i, [feat[i] for feat in (self.graph_x, self.graph_y, self.graph_z, self.graph_w, self.graph_h, self.graph_area, self.graph_placed)])
+
+
+    def _record_next_block(self, next_block:Block):
+        """Log the state overwritten by selecting next_block in after_place, i.e., its ratio, pin layer and layer sequence."""
+        entry = self.undo_log.last
+        entry["next_block"] = (next_block, next_block.get_state())
+        if self.async_place:
+            net_indices = np.unique(self.fp_info.net_array.get_net_indices(next_block))
+            entry["pin_layer"] = (next_block, self.layer_curr_blk, self.fp_info.metrics_tracker.save(net_indices, []))
+        if self.input_layer_sequence:
+            i = self.fp_info.placed_movable_block_num
+            entry["layer_sequence"] = (i, self.layer_sequence[i], self.layer_sequence_mask[i], self.layer_sequence_len)
+
+
+    def _undo_step(self, entry:Dict[str, Any]):
+        """Apply the inverse of one step, in the reverse order of step()."""
+        if "layer_sequence" in entry:
+            i, self.layer_sequence[i], self.layer_sequence_mask[i], self.layer_sequence_len = entry["layer_sequence"]
+        if "pin_layer" in entry:
+            next_block, layer, metrics = entry["pin_layer"]
+            self.fp_info.net_array.add_layer_num_pin(next_block, layer, -1)
+            self.fp_info.metrics_tracker.load(metrics)
+        if "next_block" in entry:
+            next_block, state = entry["next_block"]
+            next_block.set_state(state)
+
+        if "graph_data" in entry:
+            i, values = entry["graph_data"]
+            for feat, value in zip((self.graph_x, self.graph_y, self.graph_z, self.graph_w, self.graph_h, self.graph_area, self.graph_placed), values):
+                feat[i] = value
+        if "sequence_feature" in entry:
+            self.sequence_feature.load(entry["sequence_feature"])
+        if "block" in entry:
+            block, state = entry["block"]
+            self.fp_info.metrics_tracker.load(entry["metrics"])
+            self.fp_info.remove_from_canvas(block)
+            self.fp_info.net_array.load(entry["nets"])
+            block.set_state(state)
+
+            # push the block back to the front of place order
+            place_order = self.place_order[entry["pop_layer"]] if self.async_place else self.place_order
+            place_order.insert(0, block.movable_idx)
+
+        self.fp_info.placed_movable_block_num = entry["placed_movable_block_num"]
+        self.layer_curr_blk = entry["layer_curr_blk"]
+        self.num_block_without_placing_order = entry["num_block_without_placing_order"]
+        self.last_placed_block.update(entry["last_placed_block"])
+        self.last_metrics = defaultdict(lambda: 0, entry["last_metrics"])
+        self._obs_getters = entry["obs_getters"]
+
+
     @property
     def curr_process(self) -> Tuple[int,int]:
         return self.fp_info.placed_movable_block_num, self.fp_info.movable_block_num
     
 
     def calc_reward(self, terminated:bool, action_x:int, action_y:int, action_z:int, action_z_dst:int, step:int, tm:torch.Tensor) -> Tuple[float, dict]:
+        # metrics are maintained incrementally, see fp_env.metrics_tracker.MetricsTracker
+        metrics_tracker = self.fp_info.metrics_tracker
+        if metrics_tracker.debug:
+            metrics_tracker.check()
         
         # hpwl. Note that weight_hpwl is the weighted hpwl, which is involved in the reward calculation.
-        hpwl, weight_hpwl, original_hpwl = self.fp_info.calc_hpwl()
+        hpwl, weight_hpwl, original_hpwl = metrics_tracker.calc_hpwl()
         # print("hpwl: ", hpwl)
         hpwl_norm_coef = self._hpwl_norm_coef if hasattr(self, "_hpwl_norm_coef") else 1
         hpwl_delta = (self.last_metrics["weight_hpwl"] - weight_hpwl) / hpwl_norm_coef
 
         # calculate the number of the vias
-        via = self.fp_info.calc_via()
+        via = metrics_tracker.calc_via()
 
         # print("via: ", via)
         via_norm_coef = self._via_norm_coef if hasattr(self, "_via_norm_coef") else 1
@@ -1025,17 +1309,17 @@ class PlaceEnv(gym.Env):
         # print("via current: ", via, "via last: ", self.last_metrics["via"])
 
         # area_ratio
-        area_ratio = self.fp_info.calc_area_ratio()
+        area_ratio = metrics_tracker.calc_area_ratio()
 
         # num_ratio
-        num_ratio = self.fp_info.calc_num_ratio()
+        num_ratio = metrics_tracker.calc_num_ratio()
 
         # alignment
         if self.reward_args.reward_weight_alignment is not None:
-            alignment_score = self.fp_info.calc_alignment_score()
+            alignment_score = metrics_tracker.calc_alignment_score()
 
         # overlap
-        overlap = self.fp_info.get_overlap() # the lower the better
+        overlap = metrics_tracker.get_overlap() # the lower the better
 
         # print("overlap: ", overlap)
 
@@ -1110,31 +1394,35 @@ class PlaceEnv(gym.Env):
     # @utils.record_time
     @torch.no_grad()
     def get_wiremask(self, tobe_placed_block:Block, device:torch.device=torch.device("cpu")) -> torch.Tensor:
-        """wiremask.shape = (Nx, Ny)"""
-        wiremask = torch.zeros((self.fp_info.x_grid_num, self.fp_info.y_grid_num), device=device)
-        for net in tobe_placed_block.connected_nets:
-            if net.num_placed_connector == 0:
-                continue
-            if 0 < net.x_min:
-                x = torch.arange(0, net.x_min).to(device)
-                x_rep = repeat(x, 'x -> x y', y=self.fp_info.y_grid_num)
-                wiremask[x, :] += (net.x_min - x_rep) * net.get_net_weight()
-            
-            if net.x_max+1 < self.fp_info.x_grid_num:
-                x = torch.arange(net.x_max+1, self.fp_info.x_grid_num).to(device)
-                x_rep = repeat(x, 'x -> x y', y=self.fp_info.y_grid_num)
-                wiremask[x, :] += (x_rep - net.x_max) * net.get_net_weight()
+        """wiremask.shape = (Nx, Ny), cached until the range of any net of the block is updated."""
+        key = self.get_wiremask_key(tobe_placed_block, device)
+        return self.mask_cache.get(key, lambda: self._compute_wiremask(tobe_placed_block, device))
+
 
-            if 0 < net.y_min:
-                y = torch.arange(0, net.y_min).to(device)
-                y_rep = repeat(y, 'y -> x y', x=self.fp_info.x_grid_num)
-                wiremask[:, y] += (net.y_min - y_rep) * net.get_net_weight()
+    def get_wiremask_key(self, tobe_placed_block:Block, device:torch.device) -> tuple:
+        return ("wiremask", tobe_placed_block.movable_idx, self.fp_info.net_array.get_net_version(tobe_placed_block), device)
 
-            if net.y_max+1 < self.fp_info.y_grid_num:
-                y = torch.arange(net.y_max+1, self.fp_info.y_grid_num).to(device)
-                y_rep = repeat(y, 'y -> x y', x=self.fp_info.x_grid_num)
-                wiremask[:, y] += (y_rep - net.y_max) * net.get_net_weight()
 
+    @torch.no_grad()
+    def _compute_wiremask(self, tobe_placed_block:Block, device:torch.device) -> torch.Tensor:
+        """
+        wiremask.shape = (Nx, Ny)
+        The HPWL increment is separable, wiremask[x,y] = x_profile[x] + y_profile[y].
+        """
+        net_range = self.fp_info.net_array.get_placed_net_range(tobe_placed_block)
+        if len(net_range[0]) == 0:
+            return torch.zeros((self.fp_info.x_grid_num, self.fp_info.y_grid_num), device=device)
+
+        # (x_min, x_max, y_min, y_max, weight) of each net, shape = (num_net, 1)
+        bbox = torch.tensor(np.stack(net_range), dtype=torch.float32, device=device)
+        x_min, x_max, y_min, y_max, weight = bbox.unsqueeze(-1).unbind(dim=0)
+        x = torch.arange(self.fp_info.x_grid_num, device=device)
+        y = torch.arange(self.fp_info.y_grid_num, device=device)
+
+        # distance to the net range, zero inside the range
+        x_profile = (((x_min - x).clamp_min(0) + (x - x_max).clamp_min(0)) * weight).sum(dim=0)
+        y_profile = (((y_min - y).clamp_min(0) + (y - y_max).clamp_min(0)) * weight).sum(dim=0)
+        wiremask = x_profile[:, None] + y_profile[None, :]
         return wiremask
 
 
@@ -1157,161 +1445,27 @@ class PlaceEnv(gym.Env):
         w1 = tobe_placed_block.grid_w
         h1 = tobe_placed_block.grid_h
 
-        # What are the overlap w1 and h1?
-        # (overlap_w1, overlap_h1)
-        overlap_w1 = round(w1 * overlap_ratio)
-        overlap_h1 = round(h1 * overlap_ratio)
-
-        #print("w1: ", w1, "h1: ", h1, "overlap_w1: ", overlap_w1, "overlap_h1: ", overlap_h1, "overlap_ratio: ", overlap_ratio)
-        # print("along_boundary: ", along_boundary)
-
-        if along_boundary is False:
-            # all position are available
-            position_mask = torch.zeros((self.fp_info.x_grid_num, self.fp_info.y_grid_num), device=device)
-        else:
-            # only the position along the boundary are available (position mask)
-            # print("block name: ", tobe_placed_block.name, "along_boundary: ", along_boundary, "next_or_nextnext", next_or_nextnext)
-            position_mask = torch.ones((self.fp_info.x_grid_num, self.fp_info.y_grid_num), device=device)
-
-            for i in range(self.fp_info.block_num):
-                # vvirtual blocks?
-                if self.fp_info.block_info[i].virtual:
-                    continue
- 
-                # a placed block, the same layer
-                # too strange for the position mask calculation
-                if self.fp_info.block_info[i].placed and self.fp_info.block_info[i].grid_z == layer_next:
-                    placed_block = self.fp_info.block_info[i]
-
-                    x2 = placed_block.grid_x
-                    y2 = placed_block.grid_y
-                    w2 = placed_block.grid_w
-                    h2 = placed_block.grid_h
-
-                    overlap_w2 = round(w2 * overlap_ratio)
-                    overlap_h2 = round(h2 * overlap_ratio)
-
-                    # (Why overlap_w1 is compared with overlap_w2)
-                    # The larggest overlap ratio
-                    min_overlap_w = min(overlap_w1, overlap_w2)
-                    min_overlap_h = min(overlap_h1, overlap_h2)
-
-                    # set the top region of placed block to available
-                    # start_x = x2
-                    start_x = x2 - w1 + 1
-                    end_x   = x2 + w2
-                    start_y = y2 + h2 - min_overlap_h
-                    end_y   = y2 + h2
-
-                    start_x = max(0, start_x)
-                    start_y = max(0, start_y)
-                    end_y  += 1
-                    position_mask[start_x:end_x, start_y:end_y] = 0
-
-
-                    # set the bottom region of placed block to available
-                    # start_x = x2
-                    start_x = x2 - w1 + 1
-                    end_x   = x2 + w2
-                    start_y = y2 - h1
-                    end_y   = y2 - h1 + min_overlap_h
-
-                    start_x = max(0, start_x)
-                    start_y = max(0, start_y)
-                    end_y  += 1
-                    end_y = max(0, end_y)
-                    position_mask[start_x:end_x, start_y:end_y] = 0
-
-
-                    # set the left region of placed block to available
-                    start_x = x2 - w1
-                    end_x   = x2 - w1 + min_overlap_w
-                    # start_y = y2
-                    start_y = y2 - h1 + 1
-                    end_y   = y2 + h2
-
-                    start_x = max(0, start_x)
-                    start_y = max(0, start_y)
-                    end_x  += 1
-                    end_x = max(0, end_x)
-
-                    position_mask[start_x:end_x, start_y:end_y] = 0
-
-
-                    # set the right region of placed block to available
-                    start_x = x2 + w2 - min_overlap_w
-                    end_x   = x2 + w2
-                    # start_y = y2
-                    start_y = y2 - h1 + 1
-                    end_y   = y2 + h2
-
-                    start_x = max(0, start_x)
-                    start_y = max(0, start_y)
-                    end_x  += 1
-                    position_mask[start_x:end_x, start_y:end_y] = 0
-            
-            
-            # set region to 1 due to boundary
-            # left
-            position_mask[0, :] = 0
-            # right
-            position_mask[self.fp_info.x_grid_num - w1, :] = 0
-            # top
-            position_mask[:, self.fp_info.y_grid_num - h1] = 0
-            # bottom
-            position_mask[:, 0] = 0
-
-                    
-        # set region to 1 due to placed blocks
-        for i in range(self.fp_info.block_num):
-            if self.fp_info.block_info[i].virtual:
-                continue
-            if self.fp_info.block_info[i].placed and self.fp_info.block_info[i].grid_z == layer_next:
-                placed_block = self.fp_info.block_info[i]
-
-                x2 = placed_block.grid_x
-                y2 = placed_block.grid_y
-                w2 = placed_block.grid_w
-                h2 = placed_block.grid_h
-
-                overlap_w2 = round(w2 * overlap_ratio)
-                overlap_h2 = round(h2 * overlap_ratio)
-
-                min_overlap_w = min(overlap_w1, overlap_w2)
-                min_overlap_h = min(overlap_h1, overlap_h2)
-
-                # left
-                start_x = x2 - w1 + min_overlap_w
-                start_x += 1
-                start_x = max(0, start_x)
+        # NOTE: along_boundary is disabled only when it is False, e.g. 0.0 still enables it.
+        along_boundary = along_boundary is not False
 
-                # bottom
-                start_y = y2 - h1 + min_overlap_h
-                start_y += 1
-                start_y = max(0, start_y)
+        key = self.get_position_mask_key(w1, h1, layer_next, along_boundary, overlap_ratio, device)
+        return self.mask_cache.get(key, lambda: self._compute_position_mask(w1, h1, layer_next, along_boundary, overlap_ratio, device))
 
-                # right
-                end_x = x2 + w2 - min_overlap_w
-                end_x = max(0, end_x)
 
-                # top
-                end_y = y2 + h2 - min_overlap_h
-                end_y = max(0, end_y)
-
-                position_mask[start_x:end_x, start_y:end_y] = 1
-
-
-        # set region to 1 due to boundary
-        start_x = self.fp_info.x_grid_num - w1
-        start_x += 1
-
-        start_y = self.fp_info.y_grid_num - h1
-        start_y += 1
+    def get_position_mask_key(self, w1:int, h1:int, layer_next:int, along_boundary:bool, overlap_ratio:float, device:torch.device) -> tuple:
+        """
+        it only depends on the block shape and the die, cached until a block is placed on the die.
+        along_boundary is normalized as in get_position_mask, so that e.g. 0 and True give the same key.
+        """
+        return ("position_mask", w1, h1, layer_next, self.fp_info.die_version[layer_next], along_boundary is not False, overlap_ratio, device)
 
-        position_mask[start_x:, :] = 1
-        position_mask[:, start_y:] = 1
 
-        return position_mask
+    @torch.no_grad()
+    def _compute_position_mask(self, w1:int, h1:int, layer_next:int, along_boundary:bool, overlap_ratio:float, device:torch.device) -> torch.Tensor:
+        # blocked region and the boundary of placed blocks are queried from the summed-area table of die layer_next,
+        # the cost does not depend on the number of placed blocks.
+        position_mask = self.fp_info.position_mask_engine.position_mask(layer_next, w1, h1, along_boundary, overlap_ratio)
+        return position_mask.to(device=device)
     
 
     # @utils.record_time
@@ -1322,14 +1476,16 @@ class PlaceEnv(gym.Env):
         Return a mask with shape (x_grid_num, y_grid_num). 
         1: not available. 0: available.
         """
-        mask = torch.zeros((self.fp_info.x_grid_num, self.fp_info.y_grid_num), device=device)
-        x_start = self.fp_info.x_grid_num - block.grid_w
-        y_start = self.fp_info.y_grid_num - block.grid_h
-        x_start += 1
-        y_start += 1
-        mask[x_start:, :] = 1
-        mask[:, y_start:] = 1
-        return mask
+        key = ("boundary_mask", block.grid_w, block.grid_h, device)
+        return self.boundary_mask_cache.get(key, lambda: self._compute_boundary_mask(block, device))
+
+
+    @torch.no_grad()
+    def _compute_boundary_mask(self, block:Block, device:torch.device) -> torch.Tensor:
+        """mask[x, y] = 1 if x > x_grid_num - grid_w or y > y_grid_num - grid_h, the max of two 1D masks."""
+        mask_x = torch.arange(self.fp_info.x_grid_num, device=device) > self.fp_info.x_grid_num - block.grid_w
+        mask_y = torch.arange(self.fp_info.y_grid_num, device=device) > self.fp_info.y_grid_num - block.grid_h
+        return (mask_x[:, None] | mask_y[None, :]).to(torch.float32)
     
     @torch.no_grad()
     def get_alignment_mask(self, block_to_place:Block, device:torch.device=torch.device("cpu")) -> Tuple[torch.Tensor, torch.IntTensor]:
@@ -1339,71 +1495,52 @@ class PlaceEnv(gym.Env):
         These masks will be merged to get the final alignment mask and binary alignment mask.
         Binary alignment mask is used to check whether the block B can be placed at the position (x, y).
         0 means the position is valid, 1 means the position is invalid.
+        The masks are cached until the shape of B or the position and shape of one of its partners changes,
+        the partner geometry is in the key, since undo() and restore() may place a partner at another position.
         """
-        alignment_masks = []
-        binary_alignment_masks = []
-        for pid in block_to_place.partner_indices:
-            partner_block = self.fp_info.get_module_by_full_idx(pid)
-            threshold = block_to_place.alignment_areas[partner_block.idx]
-            alignment_mask = self._get_alignment_mask(block_to_place, partner_block, device)
-            alignment_masks.append(alignment_mask)
-            binary_alignment_mask = torch.where(alignment_mask >= threshold, 0, 1).to(dtype=torch.int32, device=device)
-            binary_alignment_masks.append(binary_alignment_mask)
-        
-        if len(alignment_masks) == 0:
-            single_alignment_mask = self._get_alignment_mask(block_to_place, None, device)
-            single_binary_alignment_mask = torch.where(single_alignment_mask >= 0.0, 0, 1).to(dtype=torch.int32, device=device)
+        partners = tuple(
+            (partner.grid_x, partner.grid_y, partner.grid_w, partner.grid_h) if partner.placed else None
+            for partner in (self.fp_info.get_module_by_full_idx(pid) for pid in block_to_place.partner_indices)
+        )
+        key = ("alignment_mask", block_to_place.movable_idx, block_to_place.grid_w, block_to_place.grid_h, partners, device)
+        return self.mask_cache.get(key, lambda: self._compute_alignment_mask(block_to_place, device))
+
+
+    @torch.no_grad()
+    def _compute_alignment_mask(self, block_to_place:Block, device:torch.device) -> Tuple[torch.Tensor, torch.IntTensor]:
+        partner_blocks = [self.fp_info.get_module_by_full_idx(pid) for pid in block_to_place.partner_indices]
+        if len(partner_blocks) == 0:
+            single_alignment_mask = self._get_alignment_mask(block_to_place, [None])[0]
+            single_binary_alignment_mask = np.zeros(single_alignment_mask.shape, dtype=np.int32)
         else:
-            single_alignment_mask = torch.stack(alignment_masks, dim=0).max(dim=0).values # union
-            single_binary_alignment_mask = torch.stack(binary_alignment_masks, dim=0).prod(dim=0).to(dtype=torch.int32, device=device) # 0 * X = 0
-        
-        return single_alignment_mask, single_binary_alignment_mask
+            alignment_masks = self._get_alignment_mask(block_to_place, partner_blocks) # [P, X, Y]
+            threshold = np.array([block_to_place.alignment_areas[partner_block.idx] for partner_block in partner_blocks], dtype=alignment_masks.dtype)
+            single_alignment_mask = alignment_masks.max(axis=0) # union
+            # invalid only if the position is not aligned with any partner
+            single_binary_alignment_mask = (alignment_masks < threshold[:, None, None]).all(axis=0).astype(np.int32)
+        return torch.from_numpy(single_alignment_mask).to(device), torch.from_numpy(single_binary_alignment_mask).to(device)
 
     
-    @torch.no_grad()
-    def _get_alignment_mask(self, block_to_place:Block, partner_block:Block, device:torch.device) -> torch.Tensor:
+    def _get_alignment_mask(self, block_to_place:Block, partner_blocks:List[Block]) -> np.ndarray:
         """
-        Return a mask with shape (x_grid_num, y_grid_num).
-        Each element is the projection area of overlap between block_to_place and partner_block.
+        Return float32 masks with shape (len(partner_blocks), x_grid_num, y_grid_num).
+        Each element is the projection area of overlap between block_to_place and a partner block.
+        The overlap is separable, it is the outer product of the 1D overlaps in x and y, computed for all partners at once.
+        If a partner is None or not placed, every position is completely overlapped except the boundary.
         """
-        x1, y1, w1, h1 = block_to_place.grid_x, block_to_place.grid_y, block_to_place.grid_w, block_to_place.grid_h
-
-        if partner_block is None or not partner_block.placed: # if not placed, we think every position is completely overlapped except the boundary
-            mask = torch.zeros((self.fp_info.x_grid_num, self.fp_info.y_grid_num), device=device)
-            x_start, y_start = 0, 0
-            x_end, y_end = self.fp_info.x_grid_num - w1 + 1, self.fp_info.y_grid_num - h1 + 1
-            mask[x_start:x_end, y_start:y_end] = block_to_place.grid_area
-            return mask
-
-        x2, y2, w2, h2 = partner_block.grid_x, partner_block.grid_y, partner_block.grid_w, partner_block.grid_h
         Nx, Ny = self.fp_info.x_grid_num, self.fp_info.y_grid_num
-
-        x1_start = max(0, x2 - w1 + 1)
-        x1_end = min(x2 + w2, Nx)
-        y1_start = max(0, y2 - h1 + 1)
-        y1_end = min(y2 + h2, Ny)
-
-        overlap_fast = torch.zeros((Nx, Ny), device=device)
-        x1 = torch.arange(x1_start, x1_end, device=device)
-        y1 = torch.arange(y1_start, y1_end, device=device)
-        x1, y1 = torch.meshgrid(x1, y1, indexing='ij')
-
-        l1 = x1
-        r1 = x1 + w1
-        l2 = x2
-        r2 = x2 + w2
-
-        overlap_x = (torch.where(r1<r2, r1, r2) - torch.where(l1>l2, l1, l2)).clamp(min=0)
-
-        l1 = y1
-        r1 = y1 + h1
-        l2 = y2
-        r2 = y2 + h2
-
-        overlap_y = (torch.where(r1<r2, r1, r2) - torch.where(l1>l2, l1, l2)).clamp(min=0)
-
-        overlap_fast[x1,y1] = (overlap_x * overlap_y).to(overlap_fast.dtype)
-
-        return overlap_fast
+        w1, h1 = block_to_place.grid_w, block_to_place.grid_h
+        placed = np.array([partner_block is not None and partner_block.placed for partner_block in partner_blocks])[:, None] # [P, 1]
+        x2, y2, w2, h2 = np.array([
+            [partner_block.grid_x, partner_block.grid_y, partner_block.grid_w, partner_block.grid_h] if is_placed else [0, 0, 0, 0]
+            for partner_block, is_placed in zip(partner_blocks, placed[:, 0])
+        ], dtype=np.int64).T[:, :, None] # [P, 1] each
+        x1 = np.arange(Nx)
+        y1 = np.arange(Ny)
+
+        overlap_x = np.where(placed, np.maximum(np.minimum(x1 + w1, x2 + w2) - np.maximum(x1, x2), 0), x1 <= Nx - w1) # [P, X]
+        overlap_y = np.where(placed, np.maximum(np.minimum(y1 + h1, y2 + h2) - np.maximum(y1, y2), 0), y1 <= Ny - h1) # [P, Y]
+        scale = np.where(placed[:, 0], 1.0, block_to_place.grid_area).astype(np.float32)
+        return scale[:, None, None] * overlap_x[:, :, None].astype(np.float32) * overlap_y[:, None, :].astype(np.float32)
 
     
@@ -0,0 +1,242 @@
+import torch
+import numpy as np
+from typing import Tuple
+from .block import Block
+
+
+class PositionMaskEngine:
+    """
+    Occupancy-based position mask for each die.
+    canvas is the occupancy bitmap, shape is (num_layer, x_grid_num, y_grid_num).
+    sat is the summed-area table of canvas, shape is (num_layer, x_grid_num+1, y_grid_num+1).
+    sat[z, i, j] = canvas[z, :i, :j].sum(), it is updated in place when a block is added.
+    """
+    def __init__(self, num_layer:int, x_grid_num:int, y_grid_num:int, max_num_rect:int):
+        self.num_layer = num_layer
+        self.x_grid_num = x_grid_num
+        self.y_grid_num = y_grid_num
+        self.max_num_rect = max_num_rect
+
+        self.sat = torch.zeros(num_layer, x_grid_num + 1, y_grid_num + 1, dtype=torch.long)
+
+        # (grid_x, grid_y, grid_w, grid_h) of placed blocks on each die, only used when overlap is allowed
+        self.rects = torch.zeros(num_layer, max_num_rect, 4, dtype=torch.long)
+        self.num_rect = np.zeros(num_layer, dtype=int)
+
+        # clamped index for window query
+        self._x_idx = torch.arange(x_grid_num)
+        self._y_idx = torch.arange(y_grid_num)
+
+
+    def reset(self, placed_blocks:list[Block]):
+        """clear sat, and add placed blocks (e.g., preplaced blocks)."""
+        self.sat.zero_()
+        self.num_rect[:] = 0
+        for block in placed_blocks:
+            self.add_block(block)
+
+
+    def add_block(self, block:Block):
+        """update sat in place after block is added into canvas."""
+        self._add_sat(block, 1)
+        self._add_rect(block)
+
+
+    def remove_block(self, block:Block):
+        """inverse of add_block, block should be the last added block on its die."""
+        self._add_sat(block, -1)
+        self.num_rect[block.grid_z] -= 1
+
+
+    def _add_sat(self, block:Block, sign:int):
+        z = block.grid_z
+        x0, x1 = min(block.grid_x, self.x_grid_num), min(block.grid_x + block.grid_w, self.x_grid_num)
+        y0, y1 = min(block.grid_y, self.y_grid_num), min(block.grid_y + block.grid_h, self.y_grid_num)
+        if x0 < x1 and y0 < y1:
+            # sat[i,j] += |[x0,x1) & [0,i)| * |[y0,y1) & [0,j)|
+            ramp_x = (torch.arange(self.x_grid_num + 1) - x0).clamp_(0, x1 - x0)
+            ramp_y = (torch.arange(self.y_grid_num + 1) - y0).clamp_(0, y1 - y0)
+            self.sat[z].add_(ramp_x[:, None] * ramp_y[None, :], alpha=sign)
+
+
+    def _add_rect(self, block:Block):
+        z = block.grid_z
+        assert self.num_rect[z] < self.max_num_rect, "[Error] too many rectangles on die {}".format(z)
+        self.rects[z, self.num_rect[z]] = torch.tensor([block.grid_x, block.grid_y, block.grid_w, block.grid_h])
+        self.num_rect[z] += 1
+
+
+    def window_sum(self, z:int, dx:int, dy:int, w:int, h:int) -> torch.Tensor:
+        """
+        For each grid (x,y), return canvas[z] summed over [x+dx, x+dx+w) x [y+dy, y+dy+h).
+        The window is clipped by the chip boundary. Return a tensor with shape (x_grid_num, y_grid_num).
+        """
+        x0 = (self._x_idx + dx).clamp_(0, self.x_grid_num)
+        x1 = (self._x_idx + dx + w).clamp_(0, self.x_grid_num)
+        y0 = (self._y_idx + dy).clamp_(0, self.y_grid_num)
+        y1 = (self._y_idx + dy + h).clamp_(0, self.y_grid_num)
+        sat = self.sat[z]
+        s_x1, s_x0 = sat.index_select(0, x1), sat.index_select(0, x0)
+        return s_x1.index_select(1, y1) - s_x0.index_select(1, y1) - s_x1.index_select(1, y0) + s_x0.index_select(1, y0)
+
+
+    def fit_mask(self, z:int, w:int, h:int, max_overlap_cells:int=0) -> torch.BoolTensor:
+        """
+        True if a w x h block placed at (x,y) covers at most max_overlap_cells occupied grids on die z.
+        A grid covered by n blocks counts n times.
+        """
+        return self.window_sum(z, 0, 0, w, h) <= max_overlap_cells
+
+
+    def adjacency_mask(self, z:int, w:int, h:int) -> torch.BoolTensor:
+        """
+        True if a w x h block placed at (x,y) touches an occupied grid on one of its four sides.
+        It is built by separable dilations, dilate_x along x with width w, and dilate_y along y with height h.
+        """
+        X, Y = self.x_grid_num, self.y_grid_num
+        dilate_x = self.window_sum(z, 0, 0, w, 1) > 0 # [x, x+w) on row y
+        dilate_y = self.window_sum(z, 0, 0, 1, h) > 0 # [y, y+h) on column x
+
+        adjacency = torch.zeros((X, Y), dtype=torch.bool)
+        adjacency[:, 1:] |= dilate_x[:, :-1] # bottom side, row y-1
+        if h < Y:
+            adjacency[:, :Y-h] |= dilate_x[:, h:] # top side, row y+h
+        adjacency[1:, :] |= dilate_y[:-1, :] # left side, column x-1
+        if w < X:
+            adjacency[:X-w, :] |= dilate_y[w:, :] # right side, column x+w
+        return adjacency
+
+
+    def _rasterize(self, start_x:torch.Tensor, end_x:torch.Tensor, start_y:torch.Tensor, end_y:torch.Tensor) -> torch.BoolTensor:
+        """Union of rectangles [start_x, end_x) x [start_y, end_y), computed by a 2D difference array."""
+        X, Y = self.x_grid_num, self.y_grid_num
+        start_x, end_x = start_x.clamp(0, X), end_x.clamp(0, X)
+        start_y, end_y = start_y.clamp(0, Y), end_y.clamp(0, Y)
+        valid = ((start_x < end_x) & (start_y < end_y)).long()
+
+        diff = torch.zeros((X + 1, Y + 1), dtype=torch.long)
+        diff.index_put_((start_x, start_y), valid, accumulate=True)
+        diff.index_put_((end_x, start_y), -valid, accumulate=True)
+        diff.index_put_((start_x, end_y), -valid, accumulate=True)
+        diff.index_put_((end_x, end_y), valid, accumulate=True)
+        return diff.cumsum(dim=0).cumsum(dim=1)[:X, :Y] > 0
+
+
+    def _overlap_masks(self, z:int, w1:int, h1:int, along_boundary:bool, overlap_ratio:float) -> Tuple[torch.BoolTensor, torch.BoolTensor]:
+        """
+        Blocked region and along-boundary region when overlap is allowed.
+        The allowed overlap depends on each placed block, min(round(w1*r), round(w2*r)).
+        """
+        rects = self.rects[z, :self.num_rect[z]]
+        x2, y2, w2, h2 = rects.unbind(dim=1)
+
+        overlap_w1, overlap_h1 = round(w1 * overlap_ratio), round(h1 * overlap_ratio)
+        # the same as python round, half to even
+        overlap_w2, overlap_h2 = torch.round(w2.double() * overlap_ratio).long(), torch.round(h2.double() * overlap_ratio).long()
+        min_overlap_w = overlap_w2.clamp(max=overlap_w1)
+        min_overlap_h = overlap_h2.clamp(max=overlap_h1)
+        zero = torch.zeros_like(x2)
+
+        blocked = self._rasterize(
+            torch.maximum(zero, x2 - w1 + min_overlap_w + 1), torch.maximum(zero, x2 + w2 - min_overlap_w),
+            torch.maximum(zero, y2 - h1 + min_overlap_h + 1), torch.maximum(zero, y2 + h2 - min_overlap_h),
+        )
+
+        if not along_boundary:
+            return blocked, None
+
+        # top, bottom, left, right
+        x_lo, x_hi = torch.maximum(zero, x2 - w1 + 1), x2 + w2
+        y_lo, y_hi = torch.maximum(zero, y2 - h1 + 1), y2 + h2
+        adjacency = self._rasterize(
+            torch.cat([x_lo, x_lo, torch.maximum(zero, x2 - w1), torch.maximum(zero, x2 + w2 - min_overlap_w)]),
+            torch.cat([x_hi, x_hi, torch.maximum(zero, x2 - w1 + min_overlap_w + 1), x2 + w2 + 1]),
+            torch.cat([torch.maximum(zero, y2 + h2 - min_overlap_h), torch.maximum(zero, y2 - h1), y_lo, y_lo]),
+            torch.cat([y2 + h2 + 1, torch.maximum(zero, y2 - h1 + min_overlap_h + 1), y_hi, y_hi]),
+        )
+        return blocked, adjacency
+
+
+    @torch.no_grad()
+    def position_mask(self, z:int, w1:int, h1:int, along_boundary:bool, overlap_ratio:float) -> torch.Tensor:
+        """
+        Position mask for a w1 x h1 block on die z, tensor with shape (x_grid_num, y_grid_num).
+        0: available.
+        1: not available.
+        """
+        X, Y = self.x_grid_num, self.y_grid_num
+        if round(w1 * overlap_ratio) == 0 and round(h1 * overlap_ratio) == 0:
+            # no overlap is allowed for any placed block
+            blocked = ~self.fit_mask(z, w1, h1, 0)
+            adjacency = self.adjacency_mask(z, w1, h1) if along_boundary else None
+        else:
+            blocked, adjacency = self._overlap_masks(z, w1, h1, along_boundary, overlap_ratio)
+
+        if along_boundary:
+            # only the position along the boundary of placed blocks or chip are available
+            adjacency[0, :] = True
+            adjacency[X - w1, :] = True
+            adjacency[:, Y - h1] = True
+            adjacency[:, 0] = True
+            mask = ~adjacency | blocked
+        else:
+            mask = blocked
+
+        # set region to 1 due to boundary
+        mask[X - w1 + 1:, :] = True
+        mask[:, Y - h1 + 1:] = True
+        return mask.float()
+
+
+def _batch_window_sum(sat:torch.Tensor, dx:int, dy:int, w:torch.Tensor, h:torch.Tensor) -> torch.Tensor:
+    """
+    Batched PositionMaskEngine.window_sum, sat.shape = (B, x_grid_num+1, y_grid_num+1), w.shape = h.shape = (B,).
+    Return a tensor with shape (B, x_grid_num, y_grid_num).
+    """
+    B, X, Y = sat.shape[0], sat.shape[1] - 1, sat.shape[2] - 1
+    x_idx, y_idx = torch.arange(X), torch.arange(Y)
+    x0 = (x_idx + dx).clamp_(0, X)
+    x1 = (x_idx[None, :] + dx + w[:, None]).clamp_(0, X)
+    y0 = (y_idx + dy).clamp_(0, Y)
+    y1 = (y_idx[None, None, :] + dy + h[:, None, None]).clamp_(0, Y).expand(B, X, Y)
+    rows = sat[torch.arange(B)[:, None], x1] - sat[:, x0]
+    return rows.gather(2, y1) - rows[:, :, y0]
+
+
+def _batch_shift(mask:torch.BoolTensor, shift:torch.Tensor, dim:int) -> torch.BoolTensor:
+    """out[b, ..., i, ...] = mask[b, ..., i + shift[b], ...] along dim, False out of range."""
+    size = mask.shape[dim]
+    shape = [1] * mask.dim()
+    shape[0], shape[dim] = -1, size
+    idx = torch.arange(size).view(shape) + shift.view([-1] + [1] * (mask.dim() - 1))
+    valid = (idx >= 0) & (idx < size)
+    shifted = mask.gather(dim, idx.clamp(0, size - 1).expand_as(mask))
+    return shifted & valid
+
+
+@torch.no_grad()
+def batch_position_mask(sat:torch.Tensor, w1:torch.Tensor, h1:torch.Tensor, along_boundary:bool) -> torch.Tensor:
+    """
+    Position masks of B blocks in one batch, the same as PositionMaskEngine.position_mask without overlap.
+    sat.shape = (B, x_grid_num+1, y_grid_num+1) is the summed-area table of the die of each block.
+    w1.shape = h1.shape = (B,).
+    Return a tensor with shape (B, x_grid_num, y_grid_num), 0: available, 1: not available.
+    """
+    B, X, Y = sat.shape[0], sat.shape[1] - 1, sat.shape[2] - 1
+    one = torch.ones_like(w1)
+    mask = _batch_window_sum(sat, 0, 0, w1, h1) > 0
+
+    x_idx = torch.arange(X)[None, :, None]
+    y_idx = torch.arange(Y)[None, None, :]
+    if along_boundary:
+        dilate_x = _batch_window_sum(sat, 0, 0, w1, one) > 0 # [x, x+w) on row y
+        dilate_y = _batch_window_sum(sat, 0, 0, one, h1) > 0 # [y, y+h) on column x
+        adjacency = _batch_shift(dilate_x, -one, 2) | _batch_shift(dilate_x, h1, 2) | \
+                    _batch_shift(dilate_y, -one, 1) | _batch_shift(dilate_y, w1, 1)
+        # chip boundary
+        adjacency |= (x_idx == 0) | (x_idx == (X - w1)[:, None, None]) | (y_idx == 0) | (y_idx == (Y - h1)[:, None, None])
+        mask |= ~adjacency
+
+    # set region to 1 due to boundary
+    mask |= (x_idx > (X - w1)[:, None, None]) | (y_idx > (Y - h1)[:, None, None])
+    return mask.float()
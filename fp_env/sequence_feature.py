@@ -0,0 +1,80 @@
+import numpy as np
+import config
+from copy import copy
+from typing import Dict, Tuple
+from .block import Block
+
+
+class SequenceFeature:
+    """
+    Sequence feature of the place order of each die, packed as feature.shape = (num_layer, max_len, C).
+    The channels are config.sequence_feature_keys, an invalid slot is -1 in all channels.
+    die[movable_idx], slot[movable_idx] is the position of the block in feature, -1 if the block is not in the sequence.
+    """
+    KEYS = tuple(config.sequence_feature_keys)
+
+    def __init__(self, sequence_each_die:np.ndarray, fp_info):
+        """sequence_each_die: [num_layer, max_len], movable indices padded with -1."""
+        num_layer, max_len = sequence_each_die.shape
+        self.init_feature = np.full((num_layer, max_len, len(self.KEYS)), -1, dtype=sequence_each_die.dtype)
+        self.die = np.full(fp_info.movable_block_num, -1, dtype=np.int64)
+        self.slot = np.full(fp_info.movable_block_num, -1, dtype=np.int64)
+        for die, slot in zip(*np.where(sequence_each_die != -1)):
+            movable_idx = sequence_each_die[die, slot]
+            block = fp_info.get_block_by_movable_idx(movable_idx)
+            self.die[movable_idx], self.slot[movable_idx] = die, slot
+            self.init_feature[die, slot] = self._pack({
+                "area": block.grid_area, "height": block.grid_h, "placed": block.placed, "sequence": movable_idx,
+                "width": block.grid_w, "x": -1, "y": -1, "z": block.grid_z,
+            })
+        self.feature = self.init_feature.copy()
+
+
+    def __deepcopy__(self, memo:dict) -> "SequenceFeature":
+        """init_feature and the index are shared, only the feature is copied."""
+        new = copy(self)
+        memo[id(self)] = new
+        new.feature = self.feature.copy()
+        return new
+
+
+    def _pack(self, values:Dict[str, int]) -> np.ndarray:
+        return np.array([values[key] for key in self.KEYS], dtype=self.init_feature.dtype)
+
+
+    def reset(self):
+        self.feature[:] = self.init_feature
+
+
+    def update(self, block:Block):
+        """After the block is placed, write its size and position in place."""
+        die, slot = self.die[block.movable_idx], self.slot[block.movable_idx]
+        if die == -1:
+            return
+        self.feature[die, slot] = self._pack({
+            "area": block.grid_area, "height": block.grid_h, "placed": block.placed, "sequence": block.movable_idx,
+            "width": block.grid_w, "x": block.grid_x, "y": block.grid_y, "z": block.grid_z,
+        })
+
+
+    def save(self, block:Block) -> Tuple[int, int, np.ndarray]:
+        """feature of the block, used by the undo log of PlaceEnv."""
+        die, slot = self.die[block.movable_idx], self.slot[block.movable_idx]
+        return die, slot, self.feature[die, slot].copy()
+
+
+    def load(self, state:Tuple[int, int, np.ndarray]):
+        die, slot, value = state
+        if die != -1:
+            self.feature[die, slot] = value
+
+
+    def get(self, last_placed_block:Dict[str, int]) -> Dict[str, np.ndarray]:
+        """
+        packed: copy of feature, [num_layer, max_len, C].
+        last_placed_block: [C], the same channels.
+        """
+        return {
+            "packed": self.feature.copy(),
+            "last_placed_block": self._pack(last_placed_block),
+        }
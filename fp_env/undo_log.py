@@ -0,0 +1,49 @@
+from typing import Any, Dict, List, Tuple
+
+
+class UndoLog:
+    """
+    Append-only log of PlaceEnv steps, one entry per step.
+    An entry holds the state overwritten by the step (block position and ratio, net rows, metrics, place order, ...),
+    so the step can be undone without replaying the episode from reset.
+    A token is (episode, number of logged steps), it is invalidated by reset.
+    """
+    def __init__(self):
+        self.entries:List[Dict[str, Any]] = []
+        self.episode = 0
+
+
+    def reset(self):
+        self.entries.clear()
+        self.episode += 1
+
+
+    def new_entry(self, **kwargs) -> Dict[str, Any]:
+        entry = dict(kwargs)
+        self.entries.append(entry)
+        return entry
+
+
+    @property
+    def last(self) -> Dict[str, Any]:
+        return self.entries[-1]
+
+
+    def pop(self) -> Dict[str, Any]:
+        return self.entries.pop()
+
+
+    def snapshot(self) -> Tuple[int, int]:
+        return self.episode, len(self.entries)
+
+
+    def steps_since(self, token:Tuple[int, int]) -> int:
+        """number of steps logged after token."""
+        episode, num_entry = token
+        assert episode == self.episode, "[Error] The token is taken in episode {}, but the current episode is {}.".format(episode, self.episode)
+        assert num_entry <= len(self.entries), "[Error] The token is taken after step {}, but only {} steps are logged.".format(num_entry, len(self.entries))
+        return len(self.entries) - num_entry
+
+
+    def __len__(self) -> int:
+        return len(self.entries)
@@ -0,0 +1,225 @@
+import numpy as np
+import torch
+from copy import deepcopy
+from typing import Any, Dict, List, Optional, Tuple, Union
+from tianshou.data import Batch
+from tianshou.env import DummyVectorEnv
+from .block import Block
+from .place_env import PlaceEnv
+from .position_mask import batch_position_mask
+
+
+class VectorPlaceEnv(DummyVectorEnv):
+    """
+    num_env copies of a PlaceEnv whose layout is stored as batched arrays:
+        canvas.shape = (num_env, num_layer, x_grid_num, y_grid_num)
+        sat.shape = (num_env, num_layer, x_grid_num+1, y_grid_num+1), summed-area table of position mask engine
+        net_bbox.shape = (num_env, net_num, 4), x_min, x_max, y_min, y_max of each net
+        num_placed_connector.shape = net_version.shape = (num_env, net_num)
+    The arrays in each PlaceEnv (fp_info.canvas, net_array.x_min, ...) are views of the batched arrays.
+    step() places the blocks of all episodes, updates nets, canvas and summed-area tables, and computes position masks and wiremasks with batched ops.
+    Place order, reward metrics and other observations are still handled by each PlaceEnv.
+    The fields of the observation are written into preallocated slots with shape (num_env, ...), see PlaceEnv.build_obs and fp_env.obs_schema,
+    and step() returns a Batch of the slots instead of stacking the observations of all envs.
+    There are two sets of slots used alternately, since the collector still reads the observation of the previous step.
+    The reward, terminated, truncated and info are the same as DummyVectorEnv.
+    """
+    def __init__(self, env:PlaceEnv, num_env:int, **kwargs):
+        super().__init__([lambda: deepcopy(env) for _ in range(num_env)], **kwargs)
+        self.envs:List[PlaceEnv] = [worker.env for worker in self.workers]
+
+        fp_info = self.envs[0].fp_info
+        if not hasattr(fp_info, "position_mask_engine"):
+            for e in self.envs:
+                e.fp_info.reset_canvas()
+        self.num_layer, self.x_grid_num, self.y_grid_num = fp_info.num_layer, fp_info.x_grid_num, fp_info.y_grid_num
+        self.net_num = fp_info.net_array.net_num
+
+        self.canvas = torch.stack([e.fp_info.canvas for e in self.envs])
+        self.sat = torch.stack([e.fp_info.position_mask_engine.sat for e in self.envs])
+        self.net_bbox = np.stack([np.stack([e.fp_info.net_array.x_min, e.fp_info.net_array.x_max, e.fp_info.net_array.y_min, e.fp_info.net_array.y_max], axis=-1) for e in self.envs])
+        self.num_placed_connector = np.stack([e.fp_info.net_array.num_placed_connector for e in self.envs])
+        self.net_version = np.stack([e.fp_info.net_array.version for e in self.envs])
+
+        # each env uses views of the batched arrays
+        for env_idx, e in enumerate(self.envs):
+            e.fp_info.canvas = self.canvas[env_idx]
+            e.fp_info.position_mask_engine.sat = self.sat[env_idx]
+            net_array = e.fp_info.net_array
+            net_array.x_min, net_array.x_max, net_array.y_min, net_array.y_max = [self.net_bbox[env_idx, :, i] for i in range(4)]
+            net_array.num_placed_connector = self.num_placed_connector[env_idx]
+            net_array.version = self.net_version[env_idx]
+
+        # observation slots, allocated by the observation schema in the first step
+        self.obs_slots:List[Dict[str, torch.Tensor]] = [{}, {}]
+        self._slot_idx = 0
+
+        self._x_idx = torch.arange(self.x_grid_num + 1)
+        self._y_idx = torch.arange(self.y_grid_num + 1)
+        print("[INFO] VectorPlaceEnv with {} envs, batched canvas {}".format(num_env, tuple(self.canvas.shape)))
+
+
+    def step(self, action:np.ndarray, id:Optional[Union[int, List[int], np.ndarray]] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        self._assert_is_not_closed()
+        id = self._wrap_id(id)
+        assert len(action) == len(id)
+        envs = [self.envs[j] for j in id]
+
+        # pop the block to place in each episode
+        blocks:List[Block] = []
+        for env, act in zip(envs, action):
+            block, x, y = env.pop_block(act)
+            env.set_block_position(block, x, y)
+            blocks.append(block)
+
+        # batched update of layout
+        self._update_nets(id, blocks)
+        self._update_canvas(id, blocks)
+
+        # reward and the next block of each episode
+        results = []
+        for env, act, block in zip(envs, action, blocks):
+            env.update_placed_block(block)
+            results.append(env.after_place(act, block, block.grid_x, block.grid_y))
+
+        # masks of the next observation
+        self._prefetch_masks(id)
+
+        for j, (_, _, _, _, info) in zip(id, results):
+            info["env_id"] = j
+        obs_batch = self._build_obs(id, envs, [obs_next for obs_next, *_ in results])
+
+        _, rew_list, term_list, trunc_list, info_list = tuple(zip(*results))
+        return (
+            obs_batch,
+            np.stack(rew_list),
+            np.stack(term_list),
+            np.stack(trunc_list),
+            np.stack(info_list),
+        )
+
+
+    def _build_obs(self, id:List[int], envs:List[PlaceEnv], getters:List[Dict[str, Any]]) -> Batch:
+        """Build the observations of envs into the next set of slots, return them as a Batch."""
+        slots = self.obs_slots[self._slot_idx]
+        self._slot_idx = 1 - self._slot_idx
+        if len(slots) == 0:
+            assert envs[0].obs_schema is not None, "[Error] The observation schema is inferred in reset()."
+            slots.update(envs[0].obs_schema.empty(len(self.envs)))
+        for j, env, g in zip(id, envs, getters):
+            env.build_obs(g, out={key: slot[j, ...] for key, slot in slots.items()})
+
+        full = len(id) == len(self.envs) and np.array_equal(id, np.arange(len(self.envs)))
+        return Batch({key: slot if full else slot[np.asarray(id)] for key, slot in slots.items()})
+
+
+    def _update_nets(self, id:List[int], blocks:List[Block]):
+        """Batched NetArray.update, the nets of all placed blocks are updated at once."""
+        env_indices, net_indices, x_center, y_center = [], [], [], []
+        for j, block in zip(id, blocks):
+            indices = self.envs[j].fp_info.net_array.get_net_indices(block)
+            env_indices.append(np.full(len(indices), j))
+            net_indices.append(indices)
+            x_center.append(np.full(len(indices), block.grid_x + block.grid_w / 2))
+            y_center.append(np.full(len(indices), block.grid_y + block.grid_h / 2))
+        env_indices, net_indices = np.concatenate(env_indices), np.concatenate(net_indices)
+        x_center, y_center = np.concatenate(x_center), np.concatenate(y_center)
+
+        np.add.at(self.num_placed_connector, (env_indices, net_indices), 1)
+        self.net_version[env_indices, net_indices] += 1
+        bbox = self.net_bbox[env_indices, net_indices]
+        # np.round is half to even, the same as python round
+        self.net_bbox[env_indices, net_indices] = np.round(np.stack([
+            np.minimum(bbox[:, 0], x_center), np.maximum(bbox[:, 1], x_center),
+            np.minimum(bbox[:, 2], y_center), np.maximum(bbox[:, 3], y_center),
+        ], axis=-1))
+
+
+    def _update_canvas(self, id:List[int], blocks:List[Block]):
+        """Batched FPInfo.update_canvas, canvas and summed-area table of all placed blocks are updated at once."""
+        placed = [(j, block) for j, block in zip(id, blocks) if not block.virtual]
+        if len(placed) == 0:
+            return
+        env_indices = torch.tensor([j for j, _ in placed])
+        z = torch.tensor([block.grid_z for _, block in placed])
+        x0 = torch.tensor([min(block.grid_x, self.x_grid_num) for _, block in placed])
+        x1 = torch.tensor([min(block.grid_x + block.grid_w, self.x_grid_num) for _, block in placed])
+        y0 = torch.tensor([min(block.grid_y, self.y_grid_num) for _, block in placed])
+        y1 = torch.tensor([min(block.grid_y + block.grid_h, self.y_grid_num) for _, block in placed])
+
+        # sat[i,j] += |[x0,x1) & [0,i)| * |[y0,y1) & [0,j)|, canvas is the difference of sat
+        ramp_x = (self._x_idx[None, :] - x0[:, None]).clamp_(min=0).minimum((x1 - x0).clamp_(min=0)[:, None])
+        ramp_y = (self._y_idx[None, :] - y0[:, None]).clamp_(min=0).minimum((y1 - y0).clamp_(min=0)[:, None])
+        self.sat[env_indices, z] += ramp_x[:, :, None] * ramp_y[:, None, :]
+        self.canvas[env_indices, z] += (ramp_x.diff(dim=1)[:, :, None] * ramp_y.diff(dim=1)[:, None, :]).to(self.canvas.dtype)
+
+        for j, block in placed:
+            fp_info = self.envs[j].fp_info
+            fp_info.position_mask_engine._add_rect(block)
+            fp_info.die_version[block.grid_z] += 1
+
+
+    def _prefetch_masks(self, id:List[int]):
+        """Compute the uncached position masks and wiremasks of the next observation in a batch, and put them into the mask cache of each env."""
+        position_requests, wiremask_requests = [], []
+        for j in id:
+            env = self.envs[j]
+            next_block, next_next_block = env.get_next_blocks()
+            # without overlap, the same arguments as the position masks in PlaceEnv.after_place,
+            # where position_mask_loose passes overlap_ratio as along_boundary
+            position_masks = [(next_block, "position_mask", env.along_boundary), (next_block, "position_mask_loose", env.overlap_ratio), (next_next_block, "position_mask_next", env.along_boundary)]
+            for block, position_key, along_boundary in position_masks:
+                if block is None:
+                    continue
+                if env.obs_keys is None or position_key in env.obs_keys:
+                    key = env.get_position_mask_key(block.grid_w, block.grid_h, int(env.layer_curr_blk), along_boundary, 0.0, env.device)
+                    if key not in env.mask_cache:
+                        position_requests.append((j, key, block, int(env.layer_curr_blk), along_boundary is not False))
+            for block, wiremask_key in [(next_block, "wiremask"), (next_next_block, "wiremask_next")]:
+                if block is None:
+                    continue
+                if env.obs_keys is None or wiremask_key in env.obs_keys:
+                    key = env.get_wiremask_key(block, env.device)
+                    if key not in env.mask_cache:
+                        wiremask_requests.append((j, key, block))
+
+        # requests of the same block are computed once
+        position_requests = list({(j, key): (j, key, block, layer, along_boundary) for j, key, block, layer, along_boundary in position_requests}.values())
+        wiremask_requests = list({(j, key): (j, key, block) for j, key, block in wiremask_requests}.values())
+
+        if len(position_requests) > 0:
+            for along_boundary in set(r[-1] for r in position_requests):
+                requests = [r for r in position_requests if r[-1] == along_boundary]
+                sat = self.sat[torch.tensor([r[0] for r in requests]), torch.tensor([r[3] for r in requests])]
+                w1 = torch.tensor([r[2].grid_w for r in requests])
+                h1 = torch.tensor([r[2].grid_h for r in requests])
+                position_mask = batch_position_mask(sat, w1, h1, along_boundary)
+                for i, (j, key, *_) in enumerate(requests):
+                    self.envs[j].mask_cache.get(key, lambda: position_mask[i].to(device=self.envs[j].device))
+
+        if len(wiremask_requests) > 0:
+            wiremask = self._batch_wiremask(wiremask_requests)
+            for i, (j, key, _) in enumerate(wiremask_requests):
+                self.envs[j].mask_cache.get(key, lambda: wiremask[i].to(device=self.envs[j].device))
+
+
+    def _batch_wiremask(self, requests:List[Tuple[int, tuple, Block]]) -> torch.Tensor:
+        """
+        Batched PlaceEnv._compute_wiremask, the profiles of the nets of all blocks are computed at once.
+        Return a tensor with shape (num_request, x_grid_num, y_grid_num).
+        """
+        net_ranges = [self.envs[j].fp_info.net_array.get_placed_net_range(block) for j, _, block in requests]
+        num_net = [len(net_range[0]) for net_range in net_ranges]
+        # (x_min, x_max, y_min, y_max, weight) of each net, shape = (num_net, 1)
+        bbox = torch.tensor(np.concatenate([np.stack(net_range) for net_range in net_ranges], axis=1), dtype=torch.float32)
+        x_min, x_max, y_min, y_max, weight = bbox.unsqueeze(-1).unbind(dim=0)
+        x = torch.arange(self.x_grid_num)
+        y = torch.arange(self.y_grid_num)
+
+        # distance to the net range of each net, zero inside the range
+        x_profile = ((x_min - x).clamp_min(0) + (x - x_max).clamp_min(0)) * weight
+        y_profile = ((y_min - y).clamp_min(0) + (y - y_max).clamp_min(0)) * weight
+        # sum over the nets of each block
+        x_profile = torch.stack([p.sum(dim=0) for p in x_profile.split(num_net)])
+        y_profile = torch.stack([p.sum(dim=0) for p in y_profile.split(num_net)])
+        return x_profile[:, :, None] + y_profile[:, None, :]
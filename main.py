@@ -8,19 +8,17 @@ from tqdm import tqdm
 from arguments import get_args
 import math
 import tianshou
-from tianshou.env import DummyVectorEnv
 from tianshou.data import VectorReplayBuffer, Batch
 from einops import rearrange
-from copy import deepcopy
 
 # from tianshou.policy import PPOPolicy
-from policy import PPOPolicy, ClipLossCoef, EntropyLossCoef, load_ppo_policy
+from policy import PPOPolicy, ClipLossCoef, EntropyLossCoef, load_ppo_policy, BeamSearch
 
 # from tianshou.trainer import OnpolicyTrainer
 from trainer import OnpolicyTrainer
 
 # from tianshou.data import Collector
-from collector import Collector, get_statistics
+from collector import Collector, get_statistics, DedupVectorReplayBuffer, ActionReplayBuffer
 
 import model
 import numpy as np
@@ -63,7 +61,10 @@ writer = TensorboardWriter(log_dir=result_dir)
 
 # fp_info
 fp_info, df_partner = circuit_dataloader.construct_fp_info_func(args.circuit, args.area_util, num_grid_x, num_grid_y, 
-                                                    args.num_alignment, args.alignment_rate, args.alignment_sort, args.num_preplaced_module, args.add_virtual_block, args.num_layer, True, True, args.add_halo, args.halo_width, args.halo_height)
+                                                    args.num_alignment, args.alignment_rate, args.alignment_sort, args.num_preplaced_module, args.add_virtual_block, args.num_layer, True, True, args.add_halo, args.halo_width, args.halo_height,
+                                                    args.net_model, args.max_net_fanout, args.high_fanout_net, args.data_format, cache_dir=args.design_cache_dir or None)
+
+fp_info.set_metrics_debug(args.debug_metrics)
 
 #pdb.set_trace()
 
@@ -239,12 +240,20 @@ single_env = fp_env.PlaceEnv(
     args.graph, args.input_layer_sequence, need_sequence_feature,
     need_alignment_mask,
 )
+# only compute the observation consumed by actor and critic
+single_env.set_obs_keys(actor.obs_keys() | critic.obs_keys())
+single_env.set_alignment_constraint(actor.use_alignment_constraint)
+single_env.set_compact_obs(args.compact_obs)
+single_env.set_mask_workers(args.mask_workers)
 
 # print(fp_info)
 # print(single_env)
 # print(reward_args)
 
 single_env.reset()
+# the adjacency matrix is registered once, instead of stored in each observation
+if args.graph:
+    shared_encoder.set_static_graph_data(single_env.get_static_graph_data())
 df_place_order = single_env.get_place_order_detailed_information()
 df_place_order.to_csv(os.path.join(result_dir, "place_order.csv"), index=False)
 # Why should we set num_env 8?
@@ -260,7 +269,7 @@ buffer_size = num_env * episode_per_collect_per_env * episode_len
 if not wiremask_bbo and args.train:
     if args.statistics is None:
         print("[INFO] Collect statistics for normalization")
-        collect_envs = DummyVectorEnv([lambda: deepcopy(single_env) for _ in range(num_env_test)])
+        collect_envs = fp_env.VectorPlaceEnv(single_env, num_env_test)
         statistics_buffer_size = num_env_test * episode_per_collect_per_env * episode_len
         if args.statistics_method in {1,2}:
             statistics_buffer_size *= 4
@@ -286,18 +295,23 @@ if not args.load_then_collect and args.checkpoint is not None:
     print("[INFO] load_then_collect = {}".format(args.load_then_collect))
     last_epoch = load_ppo_policy(ppo_policy, args.checkpoint, args.load_optimizer, device)
 
-# construct env (copy the environment into 8/4 pieces, DummyVectorEnv: Sequential update of the envs)
+# construct env (copy the environment into 8/4 pieces, VectorPlaceEnv: batched update of the layout of all envs)
 # training env
 
-train_envs = DummyVectorEnv([lambda: deepcopy(single_env) for _ in range(num_env)])
-test_envs = DummyVectorEnv([lambda: deepcopy(single_env) for _ in range(num_env_test)])
+train_envs = fp_env.VectorPlaceEnv(single_env, num_env)
+test_envs = fp_env.VectorPlaceEnv(single_env, num_env_test)
 
 
 train_envs.reset()
 test_envs.reset()
 
 # buffer for training
-buffer = VectorReplayBuffer(buffer_size, num_env)
+if args.action_replay:
+    buffer = ActionReplayBuffer(buffer_size, num_env, single_env)
+elif args.dedup_obs:
+    buffer = DedupVectorReplayBuffer(buffer_size, num_env)
+else:
+    buffer = VectorReplayBuffer(buffer_size, num_env)
 buffer.reset()
 
 
@@ -339,72 +353,95 @@ print("[INFO] Training finished")
 writer.save_df()
 
 df = pd.DataFrame()
-obs, _ = test_envs.reset()
-
-print("obs: ", obs)
-
-obs = Batch(obs)
 act_record = defaultdict(lambda: defaultdict(list))
 
 ppo_policy.eval()
 time_start = time.time()
-for iter_idx in tqdm(range(episode_len)):
-    # wiremask_bbo = True to use BBO method
-    with torch.no_grad():
-        probs, _ = ppo_policy.actor(obs)
-
-    act = Batch()
-    for key in probs.keys():
-        act[key] = ppo_policy.dist_fn[key](probs[key]).sample()
-        for env_idx in range(num_env_test):
-            single_act = act[key][env_idx].item()
-
+if args.search == "beam":
+    # beam search over the trained policy, one episode
+    beam_search = BeamSearch(ppo_policy, single_env, args.beam_width, args.search_topk, args.search_value_coef, args.search_time_budget, args.search_node_budget)
+    best_env, info, actions = beam_search.run()
+    time_end = time.time()
+    for single_act in actions:
+        for key, value in single_act.items():
             if key == "ratio":
-                next_block_ratio = single_act
                 ratio_range = args.ratio_range
-                # next_block_ratio is in range [-1,1], use linear transformation to [low, high]
-                next_block_ratio = (next_block_ratio + 1) / 2 * (ratio_range[1] - ratio_range[0]) + ratio_range[0]
-                next_block_ratio = np.clip(next_block_ratio, ratio_range[0], ratio_range[1])
-                single_act = next_block_ratio
+                value = np.clip((value + 1) / 2 * (ratio_range[1] - ratio_range[0]) + ratio_range[0], ratio_range[0], ratio_range[1])
+            act_record[0][key].append(value)
+    df = pd.DataFrame([{
+        "env_idx": 0,
+        "hpwl": info["hpwl"],
+        "original_hpwl": info["original_hpwl"],
+        "overlap": info["overlap"],
+        "alignment": info["alignment"],
+        "runtime": time_end - time_start,
+    }])
+    final_fp_infos = [best_env.fp_info]
+
+else:
+    obs, _ = test_envs.reset()
+
+    print("obs: ", obs)
+
+    obs = Batch(obs)
+    for iter_idx in tqdm(range(episode_len)):
+        # wiremask_bbo = True to use BBO method
+        with torch.no_grad():
+            probs, _ = ppo_policy.actor(obs)
+
+        act = Batch()
+        for key in probs.keys():
+            act[key] = ppo_policy.dist_fn[key](probs[key]).sample()
+            for env_idx in range(num_env_test):
+                single_act = act[key][env_idx].item()
+
+                if key == "ratio":
+                    next_block_ratio = single_act
+                    ratio_range = args.ratio_range
+                    # next_block_ratio is in range [-1,1], use linear transformation to [low, high]
+                    next_block_ratio = (next_block_ratio + 1) / 2 * (ratio_range[1] - ratio_range[0]) + ratio_range[0]
+                    next_block_ratio = np.clip(next_block_ratio, ratio_range[0], ratio_range[1])
+                    single_act = next_block_ratio
                 
-            act_record[env_idx][key].append(single_act)
-    act = tianshou.data.to_numpy(act)
-    obs_next, rew, terminated, trunc, info = test_envs.step(act)
-    obs_next = Batch(obs_next)
-
-    # # save position mask
-    env_idx = 0
-    fp_info = test_envs.get_env_attr("fp_info", env_idx)[0]
-    # if args.save_fig > 0:
-    #     utils.save_intermediate_floorplan(os.path.join(fig_dir, "mask-env={}-place_order={:03d}.png".format(env_idx, iter_idx)), obs["block"][env_idx], 
-    #         obs["canvas"][env_idx],
-    #         obs["position_mask"][env_idx], 
-    #         obs["wiremask"][env_idx], 
-    #         obs["alignment_mask"][env_idx] if "alignment_mask" in obs.keys() else None,
-    #         obs["binary_alignment_mask"][env_idx] if "binary_alignment_mask" in obs.keys() else None,
-    #         fp_info,
-    #     )
-
-    # set next obs
-    obs = obs_next
-
-    # add to dataframe
-    if terminated.sum() > 0:
-        time_end = time.time()
-        terminated_indices = np.where(terminated)[0]
-        info = Batch(info)
-        for terminated_idx in terminated_indices:
-            df = pd.concat([df, pd.DataFrame([{
-                "env_idx": terminated_idx,
-                "hpwl": info["hpwl"][terminated_idx],
-                "original_hpwl": info["original_hpwl"][terminated_idx],
-                "overlap": info["overlap"][terminated_idx],
-                "alignment": info["alignment"][terminated_idx],
-                # "distance_adjacent_terminal": info["distance_adjacent_terminal"][terminated_idx],
-                # "max_temp": info["max_temp"][terminated_idx],
-                # "mean_temp": info["mean_temp"][terminated_idx],
-                "runtime": time_end - time_start,
-            }])], ignore_index=True)
+                act_record[env_idx][key].append(single_act)
+        act = tianshou.data.to_numpy(act)
+        obs_next, rew, terminated, trunc, info = test_envs.step(act)
+        obs_next = Batch(obs_next)
+
+        # # save position mask
+        env_idx = 0
+        fp_info = test_envs.get_env_attr("fp_info", env_idx)[0]
+        # if args.save_fig > 0:
+        #     utils.save_intermediate_floorplan(os.path.join(fig_dir, "mask-env={}-place_order={:03d}.png".format(env_idx, iter_idx)), obs["block"][env_idx], 
+        #         obs["canvas"][env_idx],
+        #         obs["position_mask"][env_idx], 
+        #         obs["wiremask"][env_idx], 
+        #         obs["alignment_mask"][env_idx] if "alignment_mask" in obs.keys() else None,
+        #         obs["binary_alignment_mask"][env_idx] if "binary_alignment_mask" in obs.keys() else None,
+        #         fp_info,
+        #     )
+
+        # set next obs
+        obs = obs_next
+
+        # add to dataframe
+        if terminated.sum() > 0:
+            time_end = time.time()
+            terminated_indices = np.where(terminated)[0]
+            info = Batch(info)
+            for terminated_idx in terminated_indices:
+                df = pd.concat([df, pd.DataFrame([{
+                    "env_idx": terminated_idx,
+                    "hpwl": info["hpwl"][terminated_idx],
+                    "original_hpwl": info["original_hpwl"][terminated_idx],
+                    "overlap": info["overlap"][terminated_idx],
+                    "alignment": info["alignment"][terminated_idx],
+                    # "distance_adjacent_terminal": info["distance_adjacent_terminal"][terminated_idx],
+                    # "max_temp": info["max_temp"][terminated_idx],
+                    # "mean_temp": info["mean_temp"][terminated_idx],
+                    "runtime": time_end - time_start,
+                }])], ignore_index=True)
+    final_fp_infos = [test_envs.get_env_attr("fp_info", env_idx)[0] for env_idx in range(num_env_test)]
 
 # save dataframe
 df.to_csv(os.path.join(result_dir, "final.csv"), index=False)
@@ -417,8 +454,7 @@ utils.save_json(time, os.path.join(result_dir, "time.json"))
 
 # # save canvas
 if args.save_fig > 0 or True:
-    for env_idx in range(num_env_test):
-        fp_info = test_envs.get_env_attr("fp_info", env_idx)[0]
+    for env_idx, fp_info in enumerate(final_fp_infos):
         # save_final_floorplan
         if args.add_halo:
             utils.save_final_floorplan(os.path.join(fig_dir, "final-canvas-env={:03d}.png".format(env_idx)), fp_info, args.impl, args.design, args.halo_height, args.halo_width)
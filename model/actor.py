@@ -3,8 +3,10 @@ from torch import nn
 from einops import rearrange, repeat
 from typing import Tuple
 from tianshou.data import Batch, to_torch_as
-from typing import List, Union
+from typing import List, Union, Set
 import numpy as np
+from fp_env.obs_codec import decode_obs
+from fp_env.obs_schema import unflatten_obs
 from .shared_encoder import SharedEncoder
 from .generator import InfoGANGenerator
 from .ratio_decider import RatioDecider
@@ -76,6 +78,33 @@ class Actor(nn.Module):
     def get_device(self) -> torch.device:
         return self.redundancy.device
 
+
+    def obs_keys(self) -> Set[str]:
+        """observation keys read by forward, PlaceEnv only computes the keys consumed by actor and critic."""
+        keys = {"canvas", "wiremask", "position_mask", "constraint_tier", "min_tier", "layer_idx"}
+        if self.norm_wiremask:
+            keys.add("num_net")
+        if self.wiremask_bbo:
+            return keys
+
+        if self.input_next_block == 1:
+            keys.update({"wiremask_next", "position_mask_next"})
+        if self.input_alignment_mask:
+            keys.add("alignment_mask")
+        if self.shared_encoder.graph:
+            keys.add("graph_data")
+        if self.ratio_decider is not None:
+            keys.add("grid_area_next")
+        if self.layer_decider is not None and self.layer_decider_forward:
+            keys.add("num_blk_without_placing_order")
+            if self.layer_decider.async_place_input_sequence:
+                keys.add("sequence_feature")
+            if self.layer_decider.input_layer_sequence:
+                keys.update({"layer_sequence", "layer_sequence_mask", "layer_sequence_len"})
+            if self.use_ready_layers_mask:
+                keys.add("ready_layers")
+        return keys
+
     
     def forward(self, obs:Batch, state:Union[dict, Batch, np.ndarray]=None, info=None) -> Tuple[Batch, torch.Tensor]:
         """
@@ -87,6 +116,8 @@ class Actor(nn.Module):
             hidden: other info, such as other_probs dist.
         """
         device = self.get_device()
+        obs = decode_obs(obs, device) # see PlaceEnv.set_compact_obs
+        obs = unflatten_obs(obs) # see fp_env.obs_schema
         canvas = obs["canvas"].to(device) # [B, D, H, W], D is the number of layers
         # print("canvas shape: ", canvas.shape)
         wiremask = obs["wiremask"].to(device) # [B, H, W]
@@ -94,11 +125,11 @@ class Actor(nn.Module):
         #print("wiremask shape: ", wiremask.shape)
         position_mask = obs["position_mask"].to(device) # [B, H, W]
         # print("position mask shape: ", wiremask.shape)
-        wiremask_next = obs["wiremask_next"].to(device) # [B, H, W]
+        wiremask_next = obs["wiremask_next"].to(device) if self.input_next_block == 1 else None # [B, H, W]
         # print("wire mask shape next: ", wiremask_next.shape)
-        position_mask_next = obs["position_mask_next"].to(device) # [B, H, W]
+        position_mask_next = obs["position_mask_next"].to(device) if self.input_next_block == 1 else None # [B, H, W]
         # print("position mask shape next: ", position_mask_next.shape)
-        grid_area_next = torch.from_numpy(obs["grid_area_next"]).to(device=device, dtype=wiremask.dtype) # [B]
+        grid_area_next = torch.from_numpy(obs["grid_area_next"]).to(device=device, dtype=wiremask.dtype) if self.ratio_decider is not None else None # [B]
         # print("greid_area_next: ", grid_area_next.shape)
 
         if self.set_canvas_to_zero:
@@ -111,7 +142,7 @@ class Actor(nn.Module):
             # wiremask
             # wiremask_next
             wiremask = wiremask / num_net
-            wiremask_next = wiremask_next / num_net
+            wiremask_next = wiremask_next / num_net if wiremask_next is not None else None
 
         # wiremask_bbo
         if not self.wiremask_bbo:
@@ -195,54 +226,11 @@ class Actor(nn.Module):
         # print("layer_decider_forward_finished: ", layer_decider_forward_finished, "score: ", score.shape)
         
 
-        # available_mask to decide final available position
-        binary_alignment_mask = obs["binary_alignment_mask"].to(device) if self.use_alignment_constraint else torch.zeros_like(position_mask) # [B, H, W]
-        position_mask_loose = obs["position_mask_loose"].to(device) # [B, H, W]
-        boundary_mask = obs["boundary_mask"].to(device) # [B, H, W]
-        # print("binary_alignment_mask", self.use_alignment_constraint)
-
-        # only 0+0 == 0
-        available_mask = position_mask + binary_alignment_mask
-        # print(available_mask.shape)
-
-        # drop adjacent block mask constraint
-        num_avail_pos = (available_mask == 0).sum(dim=(1,2))
-        # print("num_avail_pos: ", num_avail_pos)
-
-        # print("where = 0: ", torch.where(num_avail_pos == 0))
-
-        no_avail_pos = torch.where(num_avail_pos == 0)[0]
-
-        if len(no_avail_pos) > 0:
-            # print("Before cal: ", available_mask[no_avail_pos])
-            available_mask[no_avail_pos] = (position_mask + binary_alignment_mask)[no_avail_pos]
-            # print("After cal: ", available_mask[no_avail_pos])
-
-        # drop adjacent terminal mask constraint
-        num_avail_pos = (available_mask == 0).sum(dim=(1,2)) # [B]
-        no_avail_pos = torch.where(num_avail_pos == 0)[0]
-
-        if len(no_avail_pos) > 0:
-            available_mask[no_avail_pos] = (position_mask + binary_alignment_mask)[no_avail_pos]
-        
-        # drop alignment mask constraint
-        num_avail_pos = (available_mask == 0).sum(dim=(1,2)) # [B]
-        no_avail_pos = torch.where(num_avail_pos == 0)[0]
-        if len(no_avail_pos) > 0:
-            available_mask[no_avail_pos] = position_mask[no_avail_pos]
-
-        # drop tight position mask constraint
-        num_avail_pos = (available_mask == 0).sum(dim=(1,2)) # [B]
-        no_avail_pos = torch.where(num_avail_pos == 0)[0]
-        if len(no_avail_pos) > 0:
-            available_mask[no_avail_pos] = position_mask_loose[no_avail_pos]
-
-        # drop all constraints, except boundary mask
-        num_avail_pos = (available_mask == 0).sum(dim=(1,2)) # [B]
-        no_avail_pos = torch.where(num_avail_pos == 0)[0]
-        if len(no_avail_pos) > 0:
-            available_mask[no_avail_pos] = boundary_mask[no_avail_pos] # only position_mask is still not satisfied, use boundary_mask
-
+        # available_mask to decide final available position, 0 is available
+        # the env relaxes the constraints tier by tier until a position is available, see PlaceEnv.get_constraint_tier
+        constraint_tier = obs["constraint_tier"].to(device) # [B, H, W]
+        min_tier = torch.as_tensor(obs["min_tier"], device=device) # [B]
+        available_mask = (constraint_tier > min_tier.view(-1, 1, 1)).to(score.dtype)
 
         scoremask = score + rearrange(available_mask, 'b h w -> b (h w)') * -1e12
         probs_pos = torch.softmax(scoremask, dim=-1)
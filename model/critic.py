@@ -1,8 +1,11 @@
 import torch
 from torch import nn
 from tianshou.data import Batch, to_torch_as
+from typing import Set
 from .shared_encoder import SharedEncoder
 import numpy as np
+from fp_env.obs_codec import decode_obs
+from fp_env.obs_schema import unflatten_obs
 from . import sequence_encoder as SeqEnc
 
 
@@ -74,6 +77,24 @@ class Critic(nn.Module):
     @property
     def device(self) -> torch.device:
         return self.redundancy.device
+
+
+    def obs_keys(self) -> Set[str]:
+        """observation keys read by forward, PlaceEnv only computes the keys consumed by actor and critic."""
+        keys = {"step", "canvas", "wiremask", "position_mask", "layer_idx"}
+        if self.norm_wiremask:
+            keys.add("num_net")
+        if self.input_next_block == 1:
+            keys.update({"wiremask_next", "position_mask_next"})
+        if self.input_alignment_mask:
+            keys.add("alignment_mask")
+        if self.shared_encoder.graph:
+            keys.add("graph_data")
+        if self.input_sequence_critic is not None:
+            keys.add("sequence_feature")
+        if self.input_die_critic:
+            keys.add("num_blk_without_placing_order")
+        return keys
     
 
     def forward(self, obs:Batch) -> torch.Tensor:
@@ -81,12 +102,14 @@ class Critic(nn.Module):
         return the state value of the current state, shape is [B]
         """
         device = self.device
+        obs = decode_obs(obs, device) # see PlaceEnv.set_compact_obs
+        obs = unflatten_obs(obs) # see fp_env.obs_schema
         step = torch.from_numpy(obs["step"]).to(device) # [B]
         canvas = obs["canvas"].to(device) # [B, 2, H, W]
         wiremask = obs["wiremask"].to(device) # [B, H, W]
         position_mask = obs["position_mask"].to(device) # [B, H, W]
-        wiremask_next = obs["wiremask_next"].to(device) # [B, H, W]
-        position_mask_next = obs["position_mask_next"].to(device) # [B, H, W]
+        wiremask_next = obs["wiremask_next"].to(device) if self.input_next_block == 1 else None # [B, H, W]
+        position_mask_next = obs["position_mask_next"].to(device) if self.input_next_block == 1 else None # [B, H, W]
 
         if self.set_canvas_to_zero:
             canvas = torch.zeros_like(canvas)
@@ -95,7 +118,7 @@ class Critic(nn.Module):
             num_grid = wiremask.shape[-1]
             num_net = torch.from_numpy(obs["num_net"]).to(device=device, dtype=wiremask.dtype) # [B]
             wiremask = wiremask / num_net
-            wiremask_next = wiremask_next / num_net
+            wiremask_next = wiremask_next / num_net if wiremask_next is not None else None
             wiremask_next_another = wiremask_next_another / num_net if wiremask_next_another is not None else None
 
         if self.input_partner_die:
@@ -55,7 +55,8 @@ class Transformer(nn.Module):
         """
         x = self.fc0(x)
         x = self.pe(x, order)
-        mask = (1-adj_mat).bool()
+        # not connected, adj_mat may be weighted
+        mask = adj_mat == 0
         mask = repeat(mask, 'b i j -> b n i j', n=self.nhead)
         mask = rearrange(mask, 'b n i j -> (b n) i j')
         x = self.transformer(x, mask)
@@ -112,7 +113,8 @@ def create_graph_model(graph:int, shared_encoder_output_dim:int, episode_len:int
     return transformer, fc_graph
 
 
-def forward_graph_model(graph:int, graph_model:Transformer, fc_graph:nn.Module, x:torch.Tensor, graph_data_batch:Batch) -> torch.Tensor:
+def forward_graph_model(graph:int, graph_model:Transformer, fc_graph:nn.Module, x:torch.Tensor, graph_data_batch:Batch,
+                        adj_mat:torch.Tensor=None, order:torch.Tensor=None) -> torch.Tensor:
     """
     Arguments:
         @graph:int.
@@ -120,13 +122,22 @@ def forward_graph_model(graph:int, graph_model:Transformer, fc_graph:nn.Module,
             1: use transformer (GNN) to extract global and local graph features, then add them to the output.
             2: use transformer (GNN) to extract global and local graph features, then concatenate them to the output.
             3: use transformer (GNN) to extract global and local graph features, then concatenate (global+local) to the output.
+        @adj_mat, order: static graph data with shape [L,L] and [L], broadcast to the batch if they are not in graph_data_batch.
     """
     assert graph > 0
     graph_data = [graph_data_batch[k] for k in ['x', 'y', 'z', 'w', 'h', 'area', 'placed']]
     graph_data = torch.stack(graph_data, dim=-1).to(x.device)
-    adj_mat = graph_data_batch['adj_mat_mov'].to(x.device)
+    batch_size = graph_data.shape[0]
+    if 'adj_mat_mov' in graph_data_batch.keys():
+        adj_mat = graph_data_batch['adj_mat_mov'].to(x.device)
+    else:
+        assert adj_mat is not None, "[Error] adj_mat_mov is not registered, see SharedEncoder.set_static_graph_data."
+        adj_mat = adj_mat.expand(batch_size, -1, -1)
     curr_node = graph_data_batch['idx'].long()
-    order = graph_data_batch['order'].long() if 'order' in graph_data_batch.keys() else None
+    if 'order' in graph_data_batch.keys():
+        order = graph_data_batch['order'].long()
+    elif order is not None:
+        order = order.long().expand(batch_size, -1)
 
     emb_global, emb_local = graph_model(graph_data, adj_mat, curr_node, order)
 
@@ -37,11 +37,10 @@ class SequenceEncoderBase(nn.Module):
     
     def forward(self, seq_feat:Batch) -> torch.Tensor:
         """
-        @param seq_feat: [B, L, N, C], L is num_die, N is num_blk
+        @param seq_feat: seq_feat.packed is [B, L, N, C], L is num_die, N is num_blk
         @return: [B, L*out_channels], L is num_die
         """
-        seq_feat = torch.stack([seq_feat[key] for key in config.sequence_feature_keys], dim=-1) # [B, L, N, C]
-        x = self.rearrange(seq_feat)
+        x = self.rearrange(seq_feat.packed)
         x = self.seq_encoder(x)
         return x
     
@@ -114,10 +113,10 @@ class Transformer2(nn.Module):
         @return:
             output: [B, num_die*out_dim]
         """
-        # get data
-        seq = torch.stack([x[key] for key in config.sequence_feature_keys], dim=-1) # [B, num_die, num_blk, in_channels]
-        curr_blk = torch.stack([x["last_placed_block"][key] for key in config.sequence_feature_keys], dim=-1) # [B, in_channels]
-        place_order = x.sequence.long() # [B, num_die, num_blk]
+        # get data, channels are config.sequence_feature_keys
+        seq = x.packed # [B, num_die, num_blk, in_channels]
+        curr_blk = x.last_placed_block # [B, in_channels]
+        place_order = seq[..., config.sequence_feature_keys.index("sequence")].long() # [B, num_die, num_blk]
 
         # preprocess
         seq = self.fc1(seq)
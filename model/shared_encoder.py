@@ -8,7 +8,7 @@ from torch import nn
 
 from . import graph_model as GraphModel
 
-from typing import Tuple
+from typing import Dict, Tuple
 
 
 def create_shared_encoder_backbone(shared_encoder_cls, input_channels:int, num_grid:int, final_shape:Tuple[int,int,int]):
@@ -114,6 +114,19 @@ class SharedEncoder(nn.Module):
         self.graph = graph
         if graph > 0:
             self.transformer, self.fc_graph = GraphModel.create_graph_model(graph, self.last_channel, episode_len)
+            # graph data that does not change in an episode, see set_static_graph_data
+            self.register_buffer("adj_mat_mov", None, persistent=False)
+            self.register_buffer("graph_order", None, persistent=False)
+
+    def set_static_graph_data(self, static_graph_data:Dict[str, torch.Tensor]):
+        """
+        Register adj_mat_mov and order (only in sync place) of PlaceEnv.get_static_graph_data, they are broadcast to each batch.
+        """
+        device = next(self.parameters()).device
+        adj_mat_mov = torch.as_tensor(static_graph_data["adj_mat_mov"])
+        # the attention mask of the transformer is dense, only the movable blocks are densified
+        self.adj_mat_mov = (adj_mat_mov.to_dense() if adj_mat_mov.is_sparse else adj_mat_mov).to(device)
+        self.graph_order = torch.as_tensor(static_graph_data["order"]).to(device) if "order" in static_graph_data else None
 
     def forward(self, stacked_mask: torch.Tensor, graph_data_batch:Batch) -> torch.Tensor:
         """
@@ -124,6 +137,6 @@ class SharedEncoder(nn.Module):
         """
         output = self.encoder(stacked_mask)
         if self.graph > 0:
-            output = GraphModel.forward_graph_model(self.graph, self.transformer, self.fc_graph, output, graph_data_batch)
+            output = GraphModel.forward_graph_model(self.graph, self.transformer, self.fc_graph, output, graph_data_batch, self.adj_mat_mov, self.graph_order)
 
         return output
\ No newline at end of file
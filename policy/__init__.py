@@ -1,3 +1,4 @@
 from .ppo import PPOPolicy, ClipLossCoef, EntropyLossCoef
 from .base import BasePolicy
 from .load_policy import *
+from .beam_search import BeamSearch
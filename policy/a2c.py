@@ -1,4 +1,4 @@
-from typing import Any, Dict, List, Optional, Type
+from typing import Any, Dict, Iterator, List, Optional, Type
 
 import numpy as np
 import torch
@@ -81,6 +81,7 @@ class A2CPolicy(PGPolicy):
     def process_fn(
         self, batch: Batch, buffer: ReplayBuffer, indices: np.ndarray
     ) -> Batch:
+        self._learn_buffer = buffer
         batch = self._compute_returns(batch, buffer, indices)
         batch.act = to_torch_as(batch.act, batch.v_s)
         return batch
@@ -88,6 +89,9 @@ class A2CPolicy(PGPolicy):
     def _compute_returns(
         self, batch: Batch, buffer: ReplayBuffer, indices: np.ndarray
     ) -> Batch:
+        if "obs_next" not in batch.keys():
+            # DedupVectorReplayBuffer, obs_next is resolved by index
+            return self._compute_returns_dedup(batch, buffer, indices)
         v_s, v_s_ = [], []
         with torch.no_grad():
             for minibatch in batch.split(self._batch, shuffle=False, merge_last=True):
@@ -96,6 +100,64 @@ class A2CPolicy(PGPolicy):
         batch.v_s = torch.cat(v_s, dim=0).flatten()  # old value
         v_s = batch.v_s.cpu().numpy()
         v_s_ = torch.cat(v_s_, dim=0).flatten().cpu().numpy()
+        return self._compute_gae(batch, buffer, indices, v_s, v_s_)
+
+    def _compute_returns_dedup(
+        self, batch: Batch, buffer: ReplayBuffer, indices: np.ndarray
+    ) -> Batch:
+        """The critic runs on each stored obs once: V(obs_next[t]) is V(obs[t+1]) if
+        t+1 is in indices. It runs on obs_next only for the other transitions whose
+        obs_next value is not masked, i.e., not terminated."""
+        v_s = []
+        with torch.no_grad():
+            for minibatch in self._split(batch, self._batch, buffer, shuffle=False):
+                v_s.append(self.critic(minibatch.obs).cpu())
+        batch.v_s = torch.cat(v_s, dim=0).flatten()  # old value
+        v_s = batch.v_s.cpu().numpy()
+
+        position = np.full(buffer.maxsize, -1, dtype=np.int64)
+        position[indices] = np.arange(len(indices))
+        next_position = position[buffer.next(indices)]
+        from_v_s = ~buffer.has_extra_obs_next(indices) & (next_position >= 0)
+        v_s_ = np.zeros_like(v_s)
+        v_s_[from_v_s] = v_s[next_position[from_v_s]]
+        rest = np.where(~from_v_s & ~buffer.terminated[indices])[0]
+        if len(rest) > 0:
+            obs_next = buffer.get_obs_next(indices[rest])
+            with torch.no_grad():
+                v_rest = [
+                    self.critic(obs_next[i:i + self._batch]).cpu()
+                    for i in range(0, len(rest), self._batch)
+                ]
+            v_s_[rest] = torch.cat(v_rest, dim=0).flatten().numpy()
+        return self._compute_gae(batch, buffer, indices, v_s, v_s_)
+
+    @staticmethod
+    def _split(
+        batch: Batch, size: int, buffer: Optional[ReplayBuffer], shuffle: bool = True
+    ) -> Iterator[Batch]:
+        """batch.split(size, shuffle, merge_last=True). ActionReplayBuffer stores
+        (episode, step) instead of the observation, the observations of each minibatch
+        are rebuilt by replaying the actions, only one minibatch is rebuilt at a time.
+        Without shuffle, the minibatches are in buffer order; with shuffle, whole
+        episodes are shuffled, see ActionReplayBuffer.split_episodes. Either way each
+        episode is replayed once per pass."""
+        if not hasattr(buffer, "replay_obs"):
+            yield from batch.split(size, shuffle=shuffle, merge_last=True)
+            return
+        if shuffle:
+            minibatch_indices = buffer.split_episodes(batch.obs, size)
+        else:
+            minibatch_indices = np.array_split(np.arange(len(batch)), max(1, len(batch) // size))
+        for indices in minibatch_indices:
+            minibatch = batch[indices]
+            minibatch.obs = buffer.replay_obs(minibatch.obs)
+            yield minibatch
+
+    def _compute_gae(
+        self, batch: Batch, buffer: ReplayBuffer, indices: np.ndarray,
+        v_s: np.ndarray, v_s_: np.ndarray
+    ) -> Batch:
         # when normalizing values, we do not minus self.ret_rms.mean to be numerically
         # consistent with OPENAI baselines' value normalization pipeline. Emperical
         # study also shows that "minus mean" will harm performances a tiny little bit
@@ -127,7 +189,7 @@ class A2CPolicy(PGPolicy):
     ) -> Dict[str, List[float]]:
         losses, actor_losses, vf_losses, ent_losses = [], [], [], []
         for _ in range(repeat):
-            for minibatch in batch.split(batch_size, merge_last=True):
+            for minibatch in self._split(batch, batch_size, self._learn_buffer):
                 # calculate loss for actor
                 dist = self(minibatch).dist
                 log_prob = dist.log_prob(minibatch.act)
@@ -0,0 +1,113 @@
+import time
+import numpy as np
+import torch
+from copy import deepcopy
+from typing import Any, Dict, List, Tuple
+from tianshou.data import Batch
+from fp_env import PlaceEnv
+from .ppo import PPOPolicy
+
+
+class BeamSearch:
+    """
+    Beam search over a trained policy, used for inference instead of sampling one action per step.
+    Each beam state is a PlaceEnv replica. In each step, the top-k joint (position, layer) actions of each state are expanded from the actor probabilities.
+    A candidate is evaluated by stepping its env and undoing the step (see PlaceEnv.snapshot and PlaceEnv.undo),
+    and scored by the return so far (the incremental hpwl, via, overlap and alignment metrics) plus value_coef * critic value.
+    The actor is called once for all beam states, the critic is called once for all candidates.
+    After the time budget (seconds) or node budget (evaluated candidates) is used up, the rest of the episode is greedy. <= 0 means no limit.
+    """
+    def __init__(self, policy:PPOPolicy, env:PlaceEnv, beam_width:int, topk:int, value_coef:float=1.0, time_budget:float=0.0, node_budget:int=0):
+        assert beam_width >= 1 and topk >= 1, "[Error] beam_width = {} and topk = {} should be >= 1.".format(beam_width, topk)
+        self.policy = policy
+        self.env = env
+        self.beam_width = beam_width
+        self.topk = topk
+        self.value_coef = value_coef
+        self.time_budget = time_budget
+        self.node_budget = node_budget
+
+
+    @torch.no_grad()
+    def run(self) -> Tuple[PlaceEnv, Dict[str, Any], List[Dict[str, Any]]]:
+        """Search one episode, return the env of the best floorplan, its last info and its actions."""
+        env = deepcopy(self.env)
+        obs, _ = env.reset()
+        env.snapshot()
+        # env, obs, return, actions, info of each beam state, sorted by score
+        beams = [(env, obs, 0.0, [], {})]
+        time_start = time.time()
+        num_node = 0
+
+        terminated = False
+        while not terminated:
+            exhausted = (self.time_budget > 0 and time.time() - time_start > self.time_budget) or (self.node_budget > 0 and num_node >= self.node_budget)
+            if exhausted:
+                beams = beams[:1]
+            beam_width, topk = (1, 1) if exhausted else (self.beam_width, self.topk)
+
+            probs, _ = self.policy.actor(Batch(np.stack([beam[1] for beam in beams])))
+
+            # evaluate candidates: step and undo
+            candidates = []
+            for beam_idx, (env, _, ret, _, _) in enumerate(beams):
+                for action in self._expand(probs, beam_idx, topk):
+                    obs_next, reward, terminated, _, _ = env.step(action)
+                    env.undo(1, build_obs=False)
+                    candidates.append((beam_idx, action, obs_next, ret + reward))
+            num_node += len(candidates)
+
+            # score with critic value, the value of the final state is 0
+            scores = np.array([ret for *_, ret in candidates])
+            if not terminated and len(candidates) > 1 and self.value_coef != 0:
+                value = self.policy.critic(Batch(np.stack([obs_next for _, _, obs_next, _ in candidates])))
+                scores += self.value_coef * value.cpu().numpy()
+            selected = [candidates[i] for i in np.argsort(-scores, kind="stable")[:beam_width]]
+
+            # materialize selected candidates, a parent with several children is copied
+            num_children = np.bincount([beam_idx for beam_idx, *_ in selected], minlength=len(beams))
+            parent_envs = [[beam[0]] + [self._copy_env(beam[0]) for _ in range(num_children[i] - 1)] for i, beam in enumerate(beams)]
+            new_beams = []
+            for beam_idx, action, _, _ in selected:
+                env, ret, actions = parent_envs[beam_idx].pop(), beams[beam_idx][2], beams[beam_idx][3]
+                obs_next, reward, terminated, _, info = env.step(action)
+                new_beams.append((env, obs_next, ret + reward, actions + [action], info))
+            beams = new_beams
+
+        print("[INFO] Beam search evaluated {} nodes in {:.2f}s".format(num_node, time.time() - time_start))
+        env, _, _, actions, info = beams[0]
+        return env, info, actions
+
+
+    def _expand(self, probs:Batch, beam_idx:int, topk:int) -> List[Dict[str, Any]]:
+        """top-k joint (position, layer) actions of a beam state, the ratio is the mean of its distribution."""
+        logp = torch.log(probs["pos"][beam_idx]) # [N]
+        pos = torch.arange(len(logp))
+        if "layer" in probs.keys():
+            logp_layer = torch.log(probs["layer"][beam_idx]) # [num_layer]
+            num_layer = len(logp_layer)
+            logp = (logp[:, None] + logp_layer[None, :]).flatten() # [N * num_layer]
+            pos = pos.repeat_interleave(num_layer)
+            layer = torch.arange(num_layer).repeat(len(logp) // num_layer)
+
+        # positions with zero probability are masked by actor
+        valid = torch.where(logp > -np.inf)[0]
+        if len(valid) == 0:
+            valid = torch.arange(len(logp))
+        indices = valid[logp[valid].topk(min(topk, len(valid))).indices]
+
+        actions = []
+        for i in indices.tolist():
+            action = {"pos": int(pos[i])}
+            if "ratio" in probs.keys():
+                action["ratio"] = float(probs["ratio"]["mean"][beam_idx])
+            if "layer" in probs.keys():
+                action["layer"] = int(layer[i])
+            actions.append(action)
+        return actions
+
+
+    def _copy_env(self, env:PlaceEnv) -> PlaceEnv:
+        new_env = deepcopy(env)
+        new_env.snapshot() # the undo log is not copied
+        return new_env
@@ -153,6 +153,7 @@ class PPOPolicy(A2CPolicy):
         if self._recompute_adv:
             # buffer input `buffer` and `indices` to be used in `learn()`.
             self._buffer, self._indices = buffer, indices
+        self._learn_buffer = buffer
         # batch
         batch = self._compute_returns(batch, buffer, indices)
         batch.act = to_torch_as(batch.act, batch.v_s)
@@ -223,7 +224,7 @@ class PPOPolicy(A2CPolicy):
         for step in range(repeat):
             if self._recompute_adv and step > 0:
                 batch = self._compute_returns(batch, self._buffer, self._indices)
-            for minibatch in batch.split(batch_size, merge_last=True):
+            for minibatch in self._split(batch, batch_size, self._learn_buffer):
                 try:
                     # calculate loss for actor
                     dist = self(minibatch).dist